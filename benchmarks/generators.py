@@ -0,0 +1,108 @@
+import json
+import random
+from typing import Iterator, Optional
+
+from pydantic import BaseModel, ConfigDict
+
+from model import LogMonitorEvent
+
+WORDS = (
+    "kernel",
+    "systemd",
+    "service",
+    "started",
+    "connection",
+    "request",
+    "timeout",
+    "worker",
+    "device",
+    "memory",
+    "session",
+    "handler",
+)
+
+
+class LogProfile(BaseModel):
+    """Shape of the synthetic log lines and of the events watching them."""
+
+    line_length: int = 200
+    # Share of lines matching one of the events
+    match_ratio: float = 0.1
+    events: int = 5
+    regexes: int = 2
+    # Share of matching lines with a json group
+    json_ratio: float = 0.0
+    json_fields: int = 10
+    seed: int = 0
+    model_config = ConfigDict(extra="forbid")
+
+
+def make_events(
+    profile: LogProfile, index: str = "benchmark", targets: Optional[list] = None
+) -> list[LogMonitorEvent]:
+    """Events with `profile.regexes` patterns each. Every pattern has a plain and
+    a json variant, matching the lines of `generate_lines`. Documents are saved to
+    `targets`, by default to the Elasticsearch `index`."""
+    if targets is None:
+        targets = [{"type": "elasticsearch", "config": {"index": index}}]
+    events = []
+    for event in range(profile.events):
+        regexes = []
+        for regex in range(profile.regexes):
+            tag = f"event{event}_{regex}"
+            regexes.append(rf"{tag} seq=(?P<seq>\d+) json=(?P<json>\{{.*\}})$")
+            regexes.append(rf"{tag} seq=(?P<seq>\d+) (?P<message>\w+)")
+        events.append(
+            LogMonitorEvent(
+                name=f"event{event}",
+                regexes=regexes,
+                targets=targets,
+            )
+        )
+    return events
+
+
+def _padding(rng: random.Random, length: int) -> str:
+    words = [rng.choice(WORDS)]
+    length -= len(words[0])
+    while length > 1:
+        words.append(rng.choice(WORDS))
+        length -= len(words[-1]) + 1
+    return " ".join(words)
+
+
+def _json_payload(rng: random.Random, fields: int) -> str:
+    return json.dumps(
+        {
+            f"field{field}": rng.choice((rng.randrange(10**6), rng.choice(WORDS)))
+            for field in range(fields)
+        }
+    )
+
+
+def generate_lines(profile: LogProfile, count: int, start: int = 0) -> Iterator[str]:
+    """Generate `count` newline terminated log lines of roughly `profile.line_length`.
+
+    Every line carries its sequence number (`seq=<n>`, starting at `start`), so the
+    documents created from matching lines can be traced back to the line.
+    The lines only depend on the profile, `count` and `start`.
+    """
+    rng = random.Random(f"{profile.seed}-{start}")
+    for seq in range(start, start + count):
+        if rng.random() < profile.match_ratio:
+            event = rng.randrange(profile.events)
+            regex = rng.randrange(profile.regexes)
+            prefix = f"app[{seq % 1000}]: event{event}_{regex} seq={seq}"
+            if rng.random() < profile.json_ratio:
+                line = f"{prefix} json={_json_payload(rng, profile.json_fields)}"
+            else:
+                line = f"{prefix} {_padding(rng, profile.line_length - len(prefix))}"
+        else:
+            prefix = f"app[{seq % 1000}]: noise seq={seq}"
+            line = f"{prefix} {_padding(rng, profile.line_length - len(prefix))}"
+        yield line + "\n"
+
+
+def count_matching(profile: LogProfile, count: int, start: int = 0) -> int:
+    """Number of lines of `generate_lines` which match one of the events."""
+    return sum(" noise " not in line for line in generate_lines(profile, count, start))
@@ -0,0 +1,171 @@
+import json
+import multiprocessing
+import platform
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import click
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from generators import LogProfile  # noqa: E402
+from scenarios import SCENARIOS, run_scenario  # noqa: E402
+
+COMPARED = ("lines_per_second", "runs_per_second", "latency_p50", "latency_p99")
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _scenario_options(name: str, parameters: dict) -> dict:
+    if name == "command":
+        return {
+            "commands": parameters["commands"],
+            "duration": parameters["duration"],
+            "command_line": parameters["command"],
+            "repeat": parameters["repeat"],
+            "exec_mode": parameters["exec_mode"],
+        }
+    profile = LogProfile(
+        line_length=parameters["line_length"],
+        match_ratio=parameters["match_ratio"],
+        events=parameters["events"],
+        regexes=parameters["regexes"],
+        json_ratio=parameters["json_ratio"],
+        json_fields=parameters["json_fields"],
+        seed=parameters["seed"],
+    )
+    options = {"profile": profile, "lines": parameters["lines"]}
+    if name != "parse":
+        options.update(
+            live_lines=parameters["live_lines"],
+            rate=parameters["rate"],
+            parse_threads=parameters["parse_threads"],
+        )
+    return options
+
+
+def _compare(results: dict, baseline: dict) -> None:
+    click.echo(f"Compared to {baseline.get('commit') or baseline['started_at']}:")
+    for name, result in results.items():
+        previous = baseline["results"].get(name)
+        if previous is None:
+            continue
+        for key in (*COMPARED, "peak_rss_bytes"):
+            if result.get(key) is None or not previous.get(key):
+                continue
+            change = (result[key] - previous[key]) / previous[key] * 100
+            click.echo(
+                f"  {name:8} {key:18} {previous[key]:14.6g} -> "
+                f"{result[key]:14.6g} ({change:+.1f}%)"
+            )
+
+
+@click.command()
+@click.option(
+    "--scenario",
+    "scenarios",
+    type=click.Choice(list(SCENARIOS)),
+    multiple=True,
+    help="Scenarios to run, all by default.",
+)
+@click.option("--lines", default=200000, show_default=True, help="Lines to read.")
+@click.option("--line-length", default=200, show_default=True)
+@click.option(
+    "--match-ratio",
+    default=0.1,
+    show_default=True,
+    help="Share of lines matching an event.",
+)
+@click.option("--events", default=5, show_default=True, help="Number of events.")
+@click.option("--regexes", default=2, show_default=True, help="Regexes per event.")
+@click.option(
+    "--json-ratio",
+    default=0.0,
+    show_default=True,
+    help="Share of matching lines with a json group.",
+)
+@click.option("--json-fields", default=10, show_default=True)
+@click.option("--seed", default=0, show_default=True)
+@click.option(
+    "--live-lines",
+    default=10000,
+    show_default=True,
+    help="Lines appended while tailing, to measure the latency.",
+)
+@click.option(
+    "--rate",
+    default=5000.0,
+    show_default=True,
+    help="Lines per second appended while tailing.",
+)
+@click.option(
+    "--parse-threads",
+    default=1,
+    show_default=True,
+    help="Threads matching lines while tailing, 0 matches on the event loop.",
+)
+@click.option("--commands", default=50, show_default=True, help="Command monitors.")
+@click.option("--command", default="echo benchmark", show_default=True)
+@click.option("--repeat", default=0.1, show_default=True)
+@click.option(
+    "--exec/--shell",
+    "exec_mode",
+    default=False,
+    show_default=True,
+    help="Execute the command directly instead of using the shell.",
+)
+@click.option(
+    "--duration",
+    default=10.0,
+    show_default=True,
+    help="Seconds to run the command monitors.",
+)
+@click.option("--output", type=click.Path(dir_okay=False), help="Save results as json.")
+@click.option(
+    "--baseline",
+    type=click.File("r"),
+    help="Results of a previous run to compare with.",
+)
+def main(scenarios, output, baseline, **parameters):
+    """Benchmark the log and command monitors with synthetic data."""
+    report = {
+        "started_at": datetime.now().isoformat(),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": parameters,
+        "results": {},
+    }
+    # Every scenario runs in a fresh process, to measure its peak memory usage
+    context = multiprocessing.get_context("spawn")
+    for name in scenarios or SCENARIOS:
+        with ProcessPoolExecutor(1, mp_context=context) as executor:
+            options = _scenario_options(name, parameters)
+            result = executor.submit(run_scenario, name, options).result()
+        report["results"][name] = result
+        click.echo(f"{name}: {json.dumps(result)}")
+
+    if output is not None:
+        with open(output, "w") as file:
+            json.dump(report, file, indent=2)
+    if baseline is not None:
+        _compare(report["results"], json.load(baseline))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+import asyncio
+import os
+import re
+import resource
+import shlex
+import tempfile
+import time
+from typing import Iterable, Optional
+
+from aiohttp import web
+from elasticsearch import AsyncElasticsearch
+from generators import LogProfile, count_matching, generate_lines, make_events
+
+from components.command_monitor.monitor import CommandMonitor
+from components.command_monitor.scheduler import CommandScheduler
+from components.log_monitor.discovery import create_parse_executor
+from components.log_monitor.logparser import EventMatcher
+from components.log_monitor.monitor import LogMonitor
+from components.sink.bulk_sink import ElasticsearchBulkSink
+from components.sink.file_sink import FileSink
+from components.sink.router import SinkRouter
+from model import CmdMonitorEvent, Target, TargetType
+
+_SEQ = re.compile(r'"seq":"(\d+)"')
+
+
+def percentile(values: list[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class Receiver:
+    """Records when the document created from each line arrived at the sink."""
+
+    def __init__(self) -> None:
+        self.received: dict[int, float] = {}
+        self.count = 0
+        self._expected = 0
+        self._done = asyncio.Event()
+
+    def receive(self, seq: Optional[int]) -> None:
+        self.count += 1
+        if seq is not None:
+            self.received[seq] = time.perf_counter()
+        if self.count >= self._expected:
+            self._done.set()
+
+    async def wait(self, count: int, timeout: float) -> None:
+        self._expected = count
+        if self.count < count:
+            self._done.clear()
+            await asyncio.wait_for(self._done.wait(), timeout)
+
+
+class MemorySink:
+    """Sink which only records the documents, to measure the monitors alone."""
+
+    def __init__(self, receiver: Receiver) -> None:
+        self.receiver = receiver
+
+    async def put(self, target: Target, document: dict) -> None:
+        seq = document.get("seq")
+        self.receiver.receive(int(seq) if seq is not None else None)
+
+    async def close(self) -> None:
+        pass
+
+
+class TimedFileSink(FileSink):
+    """File sink which records when the document of each line was written."""
+
+    def __init__(self, receiver: Receiver, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.receiver = receiver
+
+    async def _write(self, data: bytes) -> None:
+        await super()._write(data)
+        for line in data.decode().splitlines():
+            seq = _SEQ.search(line)
+            self.receiver.receive(int(seq.group(1)) if seq else None)
+
+
+class FakeElasticsearch:
+    """Local HTTP server answering bulk requests like Elasticsearch would.
+
+    Runs on the same event loop as the monitors, so it competes with them for
+    CPU time. Documents are not parsed, only their sequence numbers are read.
+    """
+
+    def __init__(self, receiver: Receiver) -> None:
+        self.receiver = receiver
+        self._runner: Optional[web.AppRunner] = None
+
+    async def bulk(self, request: web.Request) -> web.Response:
+        body = await request.text()
+        items = []
+        for line in body.splitlines()[1::2]:
+            seq = _SEQ.search(line)
+            self.receiver.receive(int(seq.group(1)) if seq else None)
+            items.append({"index": {"status": 201}})
+        return web.json_response(
+            {"errors": False, "items": items},
+            headers={"X-Elastic-Product": "Elasticsearch"},
+        )
+
+    async def start(self) -> AsyncElasticsearch:
+        app = web.Application(client_max_size=1024**3)
+        app.router.add_route("*", "/_bulk", self.bulk)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return AsyncElasticsearch(f"http://127.0.0.1:{port}")
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+async def _create_sink(
+    sink_type: str, receiver: Receiver
+) -> tuple[Optional[AsyncElasticsearch], object, Optional[FakeElasticsearch]]:
+    if sink_type == "memory":
+        return None, MemorySink(receiver), None
+    if sink_type == "file":
+        factories = {
+            TargetType.FILE: lambda settings: TimedFileSink(
+                receiver, **settings.model_dump()
+            )
+        }
+        return None, SinkRouter(factories=factories), None
+    server = FakeElasticsearch(receiver)
+    es = await server.start()
+    return es, SinkRouter(ElasticsearchBulkSink(es)), server
+
+
+def _append(path: str, lines: Iterable[str]) -> None:
+    with open(path, "a") as file:
+        file.writelines(lines)
+
+
+async def parse(profile: LogProfile, lines: int) -> dict:
+    """Match and parse lines, without any file or sink involved."""
+    matcher = EventMatcher([event.parser for event in make_events(profile)])
+    log_lines = list(generate_lines(profile, lines))
+    durations = []
+    events = 0
+    start = time.perf_counter()
+    for line in log_lines:
+        line_start = time.perf_counter()
+        if matcher.match(line) is not None:
+            events += 1
+        durations.append(time.perf_counter() - line_start)
+    seconds = time.perf_counter() - start
+    return {
+        "lines": lines,
+        "events": events,
+        "seconds": seconds,
+        "lines_per_second": lines / seconds,
+        "latency_p50": percentile(durations, 0.5),
+        "latency_p99": percentile(durations, 0.99),
+    }
+
+
+async def tail(
+    profile: LogProfile,
+    lines: int,
+    sink_type: str = "memory",
+    live_lines: int = 10000,
+    rate: float = 5000.0,
+    parse_threads: int = 1,
+    timeout: float = 300.0,
+) -> dict:
+    """Tail a log file into a sink.
+
+    First, `lines` lines are written before the monitor starts, and the time until
+    all of their events reached the sink gives the throughput. Then `live_lines`
+    lines are appended at `rate` lines per second, and the time from writing a
+    line until its document reached the sink gives the latency.
+    """
+    receiver = Receiver()
+    es, sink, server = await _create_sink(sink_type, receiver)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "benchmark.log")
+        _append(path, generate_lines(profile, lines))
+        executor = create_parse_executor(parse_threads)
+        targets = None
+        if sink_type == "file":
+            output = os.path.join(directory, "events.ndjson")
+            targets = [{"type": "file", "config": {"path": output}}]
+        log_events = make_events(profile, targets=targets)
+        monitor = LogMonitor(path, log_events, es, sink, executor=executor)
+
+        start = time.perf_counter()
+        task = asyncio.create_task(monitor.start_monitoring())
+        events = count_matching(profile, lines)
+        await receiver.wait(events, timeout)
+        seconds = time.perf_counter() - start
+
+        live = list(generate_lines(profile, live_lines, lines))
+        written = {}
+        batch = max(1, int(rate / 100))
+        for offset in range(0, live_lines, batch):
+            appended = live[offset : offset + batch]
+            await asyncio.to_thread(_append, path, appended)
+            now = time.perf_counter()
+            written.update((lines + offset + i, now) for i in range(len(appended)))
+            await asyncio.sleep(batch / rate)
+        live_events = sum(" noise " not in line for line in live)
+        await receiver.wait(events + live_events, timeout)
+
+        monitor.stop_monitoring()
+        await task
+        await sink.close()
+    if server is not None:
+        await es.close()
+        await server.close()
+
+    latencies = [
+        received - written[seq]
+        for seq, received in receiver.received.items()
+        if seq in written
+    ]
+    return {
+        "lines": lines,
+        "events": events,
+        "seconds": seconds,
+        "lines_per_second": lines / seconds,
+        "latency_p50": percentile(latencies, 0.5),
+        "latency_p99": percentile(latencies, 0.99),
+    }
+
+
+async def tail_es(profile: LogProfile, lines: int, **kwargs) -> dict:
+    """Like `tail`, sending documents to a fake Elasticsearch using the bulk sink."""
+    return await tail(profile, lines, sink_type="elasticsearch", **kwargs)
+
+
+async def tail_file(profile: LogProfile, lines: int, **kwargs) -> dict:
+    """Like `tail`, writing documents to an NDJSON file using the file sink."""
+    return await tail(profile, lines, sink_type="file", **kwargs)
+
+
+class _TimedCommandMonitor(CommandMonitor):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.durations: list[float] = []
+
+    async def _execute_command(self) -> None:
+        start = time.perf_counter()
+        await super()._execute_command()
+        self.durations.append(time.perf_counter() - start)
+
+
+async def command(
+    commands: int,
+    duration: float,
+    command_line: str = "echo benchmark",
+    repeat: float = 0.1,
+    exec_mode: bool = False,
+) -> dict:
+    """Run `commands` command monitors using the scheduler for `duration` seconds."""
+    sink = MemorySink(Receiver())
+    monitors = [
+        _TimedCommandMonitor(
+            CmdMonitorEvent(
+                name=f"command{index}",
+                command=shlex.split(command_line) if exec_mode else command_line,
+                repeat=repeat,
+                targets=[{"type": "elasticsearch", "config": {"index": "benchmark"}}],
+            ),
+            None,
+            sink,
+        )
+        for index in range(commands)
+    ]
+    scheduler = CommandScheduler(monitors, None, sink)
+    start = time.perf_counter()
+    task = asyncio.create_task(scheduler.start_monitoring())
+    await asyncio.sleep(duration)
+    scheduler.stop_monitoring()
+    await task
+    seconds = time.perf_counter() - start
+
+    durations = [value for monitor in monitors for value in monitor.durations]
+    return {
+        "commands": commands,
+        "runs": len(durations),
+        "seconds": seconds,
+        "runs_per_second": len(durations) / seconds,
+        "latency_p50": percentile(durations, 0.5),
+        "latency_p99": percentile(durations, 0.99),
+    }
+
+
+SCENARIOS = {
+    "parse": parse,
+    "tail": tail,
+    "tail-es": tail_es,
+    "tail-file": tail_file,
+    "command": command,
+}
+
+
+def run_scenario(name: str, options: dict) -> dict:
+    """Run a scenario in the current process and add its peak memory usage.
+
+    Meant to be called in a fresh process per scenario, since the peak resident
+    set size can only grow.
+    """
+    result = asyncio.run(SCENARIOS[name](**options))
+    # Linux reports kilobytes
+    result["peak_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return result
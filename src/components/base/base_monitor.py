@@ -1,16 +1,27 @@
+import asyncio
 import logging
 from datetime import datetime
+from typing import Optional
 
 from elasticsearch import AsyncElasticsearch
 
-from model import Target, TargetType
+from components.sink.router import SinkRouter
+from model import Target
 
 logger = logging.getLogger(__name__)
 
 
 class BaseMonitor:
-    def __init__(self, es: AsyncElasticsearch) -> None:
+    def __init__(
+        self, es: AsyncElasticsearch, sink: Optional[SinkRouter] = None
+    ) -> None:
         self.es = es
+        self.sink = sink
+        self._stopped = asyncio.Event()
+
+    @property
+    def stopped(self) -> bool:
+        return self._stopped.is_set()
 
     async def start_monitoring(self) -> None:
         raise NotImplementedError()
@@ -19,14 +30,16 @@ class BaseMonitor:
         raise NotImplementedError()
 
     async def _save_data(self, data: dict, targets: list[Target]):
-        created_at = datetime.now()
+        # Formatted once, instead of by every serialization
+        created_at = datetime.now().isoformat()
         data.update({"created_at": created_at})
         for target in targets:
-            if target.type == TargetType.ELASTICSEARCH:
-                response = await self._save_data_es(data, target.config)
+            if self.sink is not None:
+                # Documents are batched by the sink of the target.
+                # Awaiting only blocks while the sink's queue is full.
+                await self.sink.put(target, data)
+            else:
+                response = await self.es.index(
+                    index=target.settings.index, document=data
+                )
                 logger.debug(response)
-
-    async def _save_data_es(self, data: dict, config: dict):
-        # TODO: sending documents individually or sending them in bulk?
-        # Can the mechanism be rebuilt to use https://elasticsearch-py.readthedocs.io/en/v8.12.0/async.html#bulk-and-streaming-bulk
-        return await self.es.index(index=config["index"], document=data)
@@ -0,0 +1,175 @@
+import logging
+import os
+import re
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+PRESSURE_RESOURCES = ("cpu", "memory", "io", "irq")
+# File systems without disk usage of their own, or whose usage is meaningless,
+# like the read-only squashfs images of snaps which are always full
+PSEUDO_FILESYSTEMS = frozenset(
+    (
+        "autofs",
+        "binfmt_misc",
+        "bpf",
+        "cgroup",
+        "cgroup2",
+        "configfs",
+        "debugfs",
+        "devpts",
+        "devtmpfs",
+        "efivarfs",
+        "fusectl",
+        "hugetlbfs",
+        "mqueue",
+        "nsfs",
+        "proc",
+        "pstore",
+        "rpc_pipefs",
+        "securityfs",
+        "selinuxfs",
+        "squashfs",
+        "sysfs",
+        "tracefs",
+    )
+)
+_OCTAL_ESCAPE = re.compile(r"\\([0-7]{3})")
+
+
+def _read(path: str) -> str:
+    with open(path) as file:
+        return file.read()
+
+
+def _select(values: dict, fields: Optional[list[str]]) -> dict:
+    if fields is None:
+        return values
+    return {field: values[field] for field in fields if field in values}
+
+
+def read_meminfo(proc: str = "/proc", fields: Optional[list[str]] = None) -> dict:
+    """Read /proc/meminfo, with all sizes in bytes."""
+    values = {}
+    for line in _read(f"{proc}/meminfo").splitlines():
+        name, _, value = line.partition(":")
+        number, *unit = value.split()
+        values[name] = int(number) * 1024 if unit == ["kB"] else int(number)
+    return _select(values, fields)
+
+
+def read_vmstat(proc: str = "/proc", fields: Optional[list[str]] = None) -> dict:
+    """Read the counters of /proc/vmstat, e.g. `oom_kill` or `pgmajfault`."""
+    values = {}
+    for line in _read(f"{proc}/vmstat").splitlines():
+        name, value = line.split()
+        values[name] = int(value)
+    return _select(values, fields)
+
+
+def read_loadavg(proc: str = "/proc") -> dict:
+    load1, load5, load15, tasks, last_pid = _read(f"{proc}/loadavg").split()
+    running, total = tasks.split("/")
+    return {
+        "load1": float(load1),
+        "load5": float(load5),
+        "load15": float(load15),
+        "tasks_running": int(running),
+        "tasks_total": int(total),
+    }
+
+
+def read_pressure(proc: str = "/proc") -> dict:
+    """Read the pressure stall information of every resource the kernel supports.
+
+    Returns e.g. `{"memory": {"some": {"avg10": 0.0, ..., "total": 0}, "full": ...}}`,
+    with the total stall time in microseconds.
+    """
+    values = {}
+    for resource in PRESSURE_RESOURCES:
+        try:
+            content = _read(f"{proc}/pressure/{resource}")
+        except OSError:
+            # Kernels before 4.20, or without CONFIG_PSI
+            continue
+        values[resource] = {}
+        for line in content.splitlines():
+            kind, *fields = line.split()
+            values[resource][kind] = {
+                name: int(value) if name == "total" else float(value)
+                for name, value in (field.split("=") for field in fields)
+            }
+    return values
+
+
+def _unescape(path: str) -> str:
+    # Spaces and other special characters are escaped as octal numbers
+    return _OCTAL_ESCAPE.sub(lambda match: chr(int(match.group(1), 8)), path)
+
+
+def read_mounts(proc: str = "/proc") -> list[tuple[str, str, str]]:
+    """Return the device, mount point and file system type of all mounted file
+    systems except PSEUDO_FILESYSTEMS, each block device only once.
+
+    File systems without a block device, like the `overlay` root of a container
+    or `tmpfs`, are included with each of their mounts.
+    """
+    mounts = []
+    devices = set()
+    for line in _read(f"{proc}/self/mounts").splitlines():
+        device, mount, fstype, *_ = line.split()
+        if fstype in PSEUDO_FILESYSTEMS:
+            continue
+        if device.startswith("/"):
+            # Bind mounts of the same device
+            if device in devices:
+                continue
+            devices.add(device)
+        mounts.append((device, _unescape(mount), fstype))
+    return mounts
+
+
+def read_disk_usage(
+    mounts: Optional[list[str]] = None, proc: str = "/proc"
+) -> list[dict]:
+    """Return the usage of each mount point, in bytes and inodes.
+
+    Blocks, since `statvfs` does not return while a network file system is
+    unreachable.
+    """
+    if mounts is None:
+        found = read_mounts(proc)
+    else:
+        known = {mount: (device, fstype) for device, mount, fstype in read_mounts(proc)}
+        found = []
+        for mount in mounts:
+            device, fstype = known.get(mount, (None, None))
+            found.append((device, mount, fstype))
+    documents = []
+    for device, mount, fstype in found:
+        try:
+            stat = os.statvfs(mount)
+        except OSError as error:
+            logger.warning(f"Unable to get the disk usage of {mount}: {error}")
+            continue
+        total = stat.f_blocks * stat.f_frsize
+        free = stat.f_bfree * stat.f_frsize
+        available = stat.f_bavail * stat.f_frsize
+        used = total - free
+        documents.append(
+            {
+                "mount": mount,
+                "device": device,
+                "fstype": fstype,
+                "total_bytes": total,
+                "used_bytes": used,
+                "available_bytes": available,
+                # Like df, relative to the space available to unprivileged users
+                "used_percent": (
+                    used / (used + available) * 100 if used + available else 0.0
+                ),
+                "inodes_total": stat.f_files,
+                "inodes_free": stat.f_ffree,
+            }
+        )
+    return documents
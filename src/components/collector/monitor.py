@@ -0,0 +1,99 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from elasticsearch import AsyncElasticsearch
+
+from components.base.base_monitor import BaseMonitor
+from components.collector import collectors
+from components.sink.router import SinkRouter
+from model import CollectorConfig, CollectorType
+
+logger = logging.getLogger(__name__)
+
+# statvfs blocks while a network file system is unreachable, so it does not use
+# the default executor, which the sinks use as well
+_DISK_USAGE_EXECUTOR = ThreadPoolExecutor(4, thread_name_prefix="disk-usage")
+
+
+class CollectorMonitor(BaseMonitor):
+    """Saves system metrics read from /proc, or the usage of the mounted file
+    systems, every `interval` seconds.
+
+    Unlike a command monitor running e.g. `free` or `df`, no processes are
+    started and the documents contain numeric fields instead of text.
+    """
+
+    def __init__(
+        self,
+        config: CollectorConfig,
+        es: AsyncElasticsearch,
+        sink: Optional[SinkRouter] = None,
+        proc: str = "/proc",
+    ) -> None:
+        super().__init__(es, sink)
+        self.config = config
+        self.proc = proc
+        self._disk_usage: Optional[asyncio.Future] = None
+
+    async def start_monitoring(self) -> None:
+        while not self.stopped:
+            try:
+                await self._collect()
+            except OSError:
+                logger.exception(f"Unable to collect {self.config.type.value}.")
+            try:
+                await asyncio.wait_for(self._stopped.wait(), self.config.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def stop_monitoring(self) -> None:
+        self._stopped.set()
+
+    async def collect(self) -> list[dict]:
+        """Return the documents of one collection."""
+        config = self.config
+        if config.type == CollectorType.MEMINFO:
+            return [collectors.read_meminfo(self.proc, config.fields)]
+        if config.type == CollectorType.VMSTAT:
+            return [collectors.read_vmstat(self.proc, config.fields)]
+        if config.type == CollectorType.LOADAVG:
+            return [collectors.read_loadavg(self.proc)]
+        if config.type == CollectorType.PRESSURE:
+            return [collectors.read_pressure(self.proc)]
+        return await self._read_disk_usage()
+
+    async def _read_disk_usage(self) -> list[dict]:
+        # Waits at most one interval, and does not start another thread while the
+        # previous one still blocks
+        if self._disk_usage is not None and not self._disk_usage.done():
+            logger.warning(f"Skipping {self.config.name}, statvfs still blocks.")
+            return []
+        self._disk_usage = asyncio.get_running_loop().run_in_executor(
+            _DISK_USAGE_EXECUTOR,
+            collectors.read_disk_usage,
+            self.config.mounts,
+            self.proc,
+        )
+        try:
+            return await asyncio.wait_for(
+                asyncio.shield(self._disk_usage), self.config.interval
+            )
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"Reading the disk usage for {self.config.name} takes longer than "
+                f"{self.config.interval} seconds."
+            )
+            # Retrieved, so that an error is not reported as never retrieved
+            self._disk_usage.add_done_callback(
+                lambda future: future.cancelled() or future.exception()
+            )
+            return []
+
+    async def _collect(self) -> None:
+        for values in await self.collect():
+            data = {"name": self.config.name, "type": self.config.type.value}
+            data.update(values)
+            logger.debug(data)
+            await self._save_data(data, self.config.targets)
@@ -1,49 +1,213 @@
 import asyncio
 import logging
+import os
+import shlex
+import signal
+import time
+import uuid
+from typing import Optional
 
 from elasticsearch import AsyncElasticsearch
 
 from components.base.base_monitor import BaseMonitor
-from model import CmdMonitorEvent
+from components.command_monitor.output import LineSplitter, OutputCapture
+from components.command_monitor.scheduler import CommandScheduler
+from components.log_monitor.logparser import EventMatcher
+from components.metrics.metrics import REGISTRY
+from components.sink.router import SinkRouter
+from model import CmdMonitorEvent, IoniceClass
 
 logger = logging.getLogger(__name__)
 
+RUNS = REGISTRY.counter(
+    "command_monitor_runs_total", "Executed commands.", ("event", "exit_code")
+)
+RUN_SECONDS = REGISTRY.histogram(
+    "command_monitor_run_seconds", "Duration of executed commands.", ("event",)
+)
+TIMEOUTS = REGISTRY.counter(
+    "command_monitor_timeouts_total", "Commands killed after their timeout.", ("event",)
+)
+
+# Bytes read from stdout or stderr at once
+CHUNK_SIZE = 64 * 1024
+IONICE_CLASSES = {
+    IoniceClass.REALTIME: "1",
+    IoniceClass.BEST_EFFORT: "2",
+    IoniceClass.IDLE: "3",
+}
+
+
+def _priority_prefix(event: CmdMonitorEvent) -> list[str]:
+    """Commands setting the priority and then executing the actual command.
+
+    Unlike a `preexec_fn`, they do not prevent the fast spawning of processes
+    using vfork, and the priority applies to all child processes of the command.
+    """
+    prefix = []
+    if event.nice is not None:
+        prefix += ["nice", "-n", str(event.nice)]
+    if event.ionice_class is not None or event.ionice_level is not None:
+        prefix.append("ionice")
+        if event.ionice_class is not None:
+            prefix += ["-c", IONICE_CLASSES[event.ionice_class]]
+        if event.ionice_level is not None:
+            prefix += ["-n", str(event.ionice_level)]
+    return prefix
+
+
+def _kill_process_group(proc: asyncio.subprocess.Process) -> None:
+    try:
+        # The command runs in a new session, its process group has its pid
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
 
 class CommandMonitor(BaseMonitor):
-    def __init__(self, event: CmdMonitorEvent, es: AsyncElasticsearch) -> None:
-        super().__init__(es)
+    def __init__(
+        self,
+        event: CmdMonitorEvent,
+        es: AsyncElasticsearch,
+        sink: Optional[SinkRouter] = None,
+    ) -> None:
+        super().__init__(es, sink)
         self.event = event
+        self.matcher = None
+        if event.line_events:
+            self.matcher = EventMatcher([line.parser for line in event.line_events])
+        self._scheduler: Optional[CommandScheduler] = None
 
     async def start_monitoring(self) -> None:
-        while True:
-            await self._execute_command()
-            if self.event.repeat is None:
-                return
-            else:
-                await asyncio.sleep(self.event.repeat)
+        """Run the command on its own. Use a `CommandScheduler` for several commands."""
+        self._scheduler = CommandScheduler([self], self.es, self.sink)
+        if self.stopped:
+            self._scheduler.stop_monitoring()
+        await self._scheduler.start_monitoring()
 
     def stop_monitoring(self) -> None:
-        # TODO: stop monitoring
-        pass
+        """Stop repeating the command. A running command is not interrupted."""
+        self._stopped.set()
+        if self._scheduler is not None:
+            self._scheduler.stop_monitoring()
+
+    async def _start_process(self) -> asyncio.subprocess.Process:
+        """Start the command, directly if it is a list, otherwise using the shell."""
+        options = {
+            "stdout": asyncio.subprocess.PIPE,
+            "stderr": asyncio.subprocess.PIPE,
+            "cwd": self.event.chdir,
+            "env": {**os.environ, **self.event.env} if self.event.env else None,
+            # Allows to kill the command with all its child processes
+            "start_new_session": True,
+        }
+        command = self.event.command
+        prefix = _priority_prefix(self.event)
+        if isinstance(command, list):
+            return await asyncio.create_subprocess_exec(*prefix, *command, **options)
+        if prefix:
+            return await asyncio.create_subprocess_exec(
+                *prefix, "/bin/sh", "-c", command, **options
+            )
+        return await asyncio.create_subprocess_shell(command, **options)
 
     async def _execute_command(self) -> None:
         command = self.event.command
-        if self.event.chdir is not None:
-            command = f"cd {self.event.chdir} && {self.event.command}"
+        if isinstance(command, list):
+            command = shlex.join(command)
 
-        proc = await asyncio.create_subprocess_shell(
-            command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-        )
-        stdout, stderr = await proc.communicate()
+        # Shared by the documents of the run and of the line events found in it
+        run_id = uuid.uuid4().hex
+        start = time.perf_counter()
+        proc = await self._start_process()
+        output = self.event.output
+        stdout = OutputCapture(output.head_bytes, output.tail_bytes)
+        stderr = OutputCapture(output.head_bytes, output.tail_bytes)
+        timed_out = False
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(
+                    self._read_output(proc.stdout, stdout, "stdout", run_id),
+                    self._read_output(proc.stderr, stderr, "stderr", run_id),
+                    proc.wait(),
+                ),
+                self.event.timeout,
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"[{command!r} timed out after {self.event.timeout}s]")
+            TIMEOUTS.labels(self.event.name).inc()
+            timed_out = True
+            _kill_process_group(proc)
+            await proc.wait()
+        except asyncio.CancelledError:
+            _kill_process_group(proc)
+            raise
+        RUN_SECONDS.labels(self.event.name).observe(time.perf_counter() - start)
+        RUNS.labels(self.event.name, proc.returncode).inc()
         logger.info(f"[{command!r} exited with {proc.returncode}]")
-        if stdout:
-            logger.debug(f"[stdout]\n{stdout.decode()}")
-        if stderr:
-            logger.debug(f"[stderr]\n{stderr.decode()}")
+        stdout_text, stderr_text = stdout.text(), stderr.text()
+        if stdout_text:
+            logger.debug(f"[stdout]\n{stdout_text}")
+        if stderr_text:
+            logger.debug(f"[stderr]\n{stderr_text}")
 
-        data = self.event.model_dump(exclude={"targets"})
+        # The scheduling and execution settings are not part of the documents
+        data = self.event.model_dump(include={"name", "command", "repeat", "chdir"})
         data.update(
-            {"stdout": stdout.decode("utf-8"), "stderr": stderr.decode("utf-8")}
+            {
+                "stdout": stdout_text,
+                "stderr": stderr_text,
+                "stdout_bytes": stdout.total,
+                "stderr_bytes": stderr.total,
+                "stdout_truncated": stdout.truncated,
+                "stderr_truncated": stderr.truncated,
+                "timed_out": timed_out,
+                "run_id": run_id,
+            }
         )
         await self._save_data(data, self.event.targets)
         return
+
+    async def _read_output(
+        self,
+        stream: asyncio.StreamReader,
+        capture: OutputCapture,
+        name: str,
+        run_id: str,
+    ) -> None:
+        """Capture the output of the command, and save the line events found in it."""
+        splitter = None
+        if self.matcher is not None:
+            splitter = LineSplitter(self.event.output.max_line_bytes)
+        while chunk := await stream.read(CHUNK_SIZE):
+            capture.feed(chunk)
+            if splitter is not None:
+                await self._save_line_events(splitter.feed(chunk), name, run_id)
+        if splitter is not None:
+            await self._save_line_events(splitter.flush(), name, run_id)
+
+    async def _save_line_events(
+        self, lines: list[str], stream: str, run_id: str
+    ) -> None:
+        """Save the events found in the lines of `stream` (stdout or stderr) of the
+        run with `run_id`."""
+        for line in lines:
+            if line.endswith("\n"):
+                line = line[:-1]
+            if (found := self.matcher.match(line)) is None:
+                continue
+            event_index, result = found
+            line_event = self.event.line_events[event_index]
+            result.update(
+                {
+                    "name": self.event.name,
+                    "line_event": line_event.name,
+                    "stream": stream,
+                    "run_id": run_id,
+                }
+            )
+            logger.info(result)
+            targets = line_event.targets
+            await self._save_data(
+                result, targets if targets is not None else self.event.targets
+            )
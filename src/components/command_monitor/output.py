@@ -0,0 +1,72 @@
+class OutputCapture:
+    """Keeps the first `head_bytes` and the last `tail_bytes` of a stream.
+
+    The memory used does not depend on the length of the stream. If bytes in
+    between are dropped, the text contains a marker with their number.
+    """
+
+    def __init__(self, head_bytes: int, tail_bytes: int) -> None:
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.total = 0
+        self._head = bytearray()
+        self._tail = bytearray()
+
+    @property
+    def truncated(self) -> bool:
+        return self.total > len(self._head) + len(self._tail)
+
+    def feed(self, data: bytes) -> None:
+        self.total += len(data)
+        if len(self._head) < self.head_bytes:
+            missing = self.head_bytes - len(self._head)
+            self._head += data[:missing]
+            data = data[missing:]
+        if not self.tail_bytes or not data:
+            return
+        if len(data) >= self.tail_bytes:
+            self._tail = bytearray(data[-self.tail_bytes :])
+        else:
+            self._tail += data
+            del self._tail[: -self.tail_bytes]
+
+    def text(self) -> str:
+        head = self._head.decode("utf-8", "replace")
+        if not self.truncated:
+            return head + self._tail.decode("utf-8", "replace")
+        omitted = self.total - len(self._head) - len(self._tail)
+        return (
+            f"{head}\n[... {omitted} bytes truncated ...]\n"
+            f"{self._tail.decode('utf-8', 'replace')}"
+        )
+
+
+class LineSplitter:
+    """Splits a stream into lines, which are at most `max_line_bytes` long."""
+
+    def __init__(self, max_line_bytes: int) -> None:
+        self.max_line_bytes = max_line_bytes
+        self._partial = bytearray()
+
+    def feed(self, data: bytes) -> list[str]:
+        self._partial += data
+        lines = []
+        start = 0
+        while True:
+            end = self._partial.find(b"\n", start, start + self.max_line_bytes)
+            if end == -1:
+                if len(self._partial) - start < self.max_line_bytes:
+                    break
+                end = start + self.max_line_bytes - 1
+            lines.append(self._partial[start : end + 1].decode("utf-8", "replace"))
+            start = end + 1
+        del self._partial[:start]
+        return lines
+
+    def flush(self) -> list[str]:
+        """Return the last line, if it does not end with a newline."""
+        if not self._partial:
+            return []
+        line = self._partial.decode("utf-8", "replace")
+        self._partial.clear()
+        return [line]
@@ -0,0 +1,185 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from typing import TYPE_CHECKING, Optional
+
+from elasticsearch import AsyncElasticsearch
+
+from components.base.base_monitor import BaseMonitor
+from components.metrics.metrics import REGISTRY
+from components.sink.router import SinkRouter
+from model import OverlapPolicy
+
+if TYPE_CHECKING:
+    from components.command_monitor.monitor import CommandMonitor
+
+logger = logging.getLogger(__name__)
+
+OVERLAPS = REGISTRY.counter(
+    "command_monitor_overlaps_total",
+    "Runs which were due while the previous runs of the command were still running.",
+    ("event", "policy"),
+)
+
+
+class CommandScheduler(BaseMonitor):
+    """Runs the commands of all command monitors at a fixed rate.
+
+    Runs are kept in a heap ordered by the time they are due. A command is due
+    every `repeat` seconds after its first run, regardless of how long it runs,
+    plus a random delay of up to `jitter` seconds, so commands with the same
+    period do not all start at once. If a command is due while `max_concurrent`
+    runs of it are still running, its `overlap` policy decides whether the run is
+    skipped, queued until a run finished, or the oldest run is killed. At most
+    `max_concurrent` commands run at once in total, 0 does not limit them.
+
+    Monitors can be added and removed while running. The scheduler ends once no
+    more runs are due and no command is running anymore.
+    """
+
+    def __init__(
+        self,
+        monitors: list["CommandMonitor"],
+        es: AsyncElasticsearch,
+        sink: Optional[SinkRouter] = None,
+        max_concurrent: int = 0,
+        rng: Optional[random.Random] = None,
+    ) -> None:
+        super().__init__(es, sink)
+        self.monitors = list(monitors)
+        self.max_concurrent = max_concurrent
+        self.rng = rng or random.Random()
+        self._slots = asyncio.Semaphore(max_concurrent) if max_concurrent else None
+        # (due, entry, scheduled, monitor): `scheduled` is the due time without the
+        # jitter, `entry` orders runs due at the same time
+        self._heap: list[tuple[float, int, float, "CommandMonitor"]] = []
+        self._entries = itertools.count()
+        # The entry of the next run of every scheduled monitor. Runs of removed
+        # monitors, or of monitors which were added again, are dropped lazily.
+        self._next: dict["CommandMonitor", int] = {}
+        self._running: dict["CommandMonitor", list[asyncio.Task]] = {}
+        self._queued: set["CommandMonitor"] = set()
+        self._wakeup = asyncio.Event()
+
+    async def start_monitoring(self) -> None:
+        now = time.monotonic()
+        for monitor in self.monitors:
+            self._schedule(monitor, now)
+        try:
+            while not self.stopped:
+                if not self._heap:
+                    # Commands can still be added while the last runs are running
+                    if not (tasks := self._tasks()):
+                        break
+                    self._wakeup.clear()
+                    wakeup = asyncio.create_task(self._wakeup.wait())
+                    try:
+                        await asyncio.wait(
+                            [*tasks, wakeup], return_when=asyncio.FIRST_COMPLETED
+                        )
+                    finally:
+                        wakeup.cancel()
+                    continue
+                due, entry, scheduled, monitor = self._heap[0]
+                timeout = due - time.monotonic()
+                if timeout > 0:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                heapq.heappop(self._heap)
+                if self._next.get(monitor) != entry:
+                    continue
+                del self._next[monitor]
+                self._dispatch(monitor)
+                if monitor.event.repeat is not None:
+                    self._schedule(monitor, self._next_run(monitor, scheduled))
+
+            # Running commands are not interrupted
+            while tasks := self._tasks():
+                await asyncio.wait(tasks)
+        finally:
+            self._queued.clear()
+            for task in self._tasks():
+                task.cancel()
+
+    def stop_monitoring(self) -> None:
+        """Stop scheduling commands. Running commands are not interrupted."""
+        self._stopped.set()
+        self._queued.clear()
+        self._wakeup.set()
+
+    def add(self, monitor: "CommandMonitor") -> None:
+        """Schedule the command of `monitor`, starting now."""
+        self.monitors.append(monitor)
+        self._schedule(monitor, time.monotonic())
+        self._wakeup.set()
+
+    def remove(self, monitor: "CommandMonitor") -> None:
+        """Stop scheduling the command of `monitor`. Running commands are not
+        interrupted."""
+        self.monitors.remove(monitor)
+        self._next.pop(monitor, None)
+        self._queued.discard(monitor)
+
+    def _tasks(self) -> list[asyncio.Task]:
+        return [task for running in self._running.values() for task in running]
+
+    def _next_run(self, monitor: "CommandMonitor", scheduled: float) -> float:
+        repeat = monitor.event.repeat
+        scheduled += repeat
+        now = time.monotonic()
+        if scheduled < now:
+            # Runs missed while the event loop was blocked or the system suspended
+            scheduled += (now - scheduled) // repeat * repeat
+        return scheduled
+
+    def _schedule(self, monitor: "CommandMonitor", scheduled: float) -> None:
+        jitter = monitor.event.jitter
+        due = scheduled + (self.rng.uniform(0, jitter) if jitter else 0.0)
+        entry = self._next[monitor] = next(self._entries)
+        heapq.heappush(self._heap, (due, entry, scheduled, monitor))
+
+    def _dispatch(self, monitor: "CommandMonitor") -> None:
+        event = monitor.event
+        running = self._running.setdefault(monitor, [])
+        if len(running) >= event.max_concurrent:
+            OVERLAPS.labels(event.name, event.overlap.value).inc()
+            if event.overlap == OverlapPolicy.SKIP:
+                logger.warning(f"{event.name!r} is still running, skipping a run.")
+                return
+            if event.overlap == OverlapPolicy.QUEUE:
+                # At most one run is queued, further runs are coalesced
+                self._queued.add(monitor)
+                return
+            logger.warning(f"{event.name!r} is still running, killing the oldest run.")
+            running[0].cancel()
+
+        task = asyncio.create_task(self._run(monitor))
+        running.append(task)
+        task.add_done_callback(lambda task: self._finished(monitor, task))
+
+    async def _run(self, monitor: "CommandMonitor") -> None:
+        if self._slots is None:
+            await monitor._execute_command()
+            return
+        async with self._slots:
+            await monitor._execute_command()
+
+    def _finished(self, monitor: "CommandMonitor", task: asyncio.Task) -> None:
+        running = self._running[monitor]
+        running.remove(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(
+                f"Command {monitor.event.name!r} failed.", exc_info=task.exception()
+            )
+        if monitor in self._queued and not self.stopped:
+            self._queued.discard(monitor)
+            self._dispatch(monitor)
+        elif not running:
+            del self._running[monitor]
@@ -0,0 +1,191 @@
+import math
+from datetime import datetime
+from typing import Any, Optional
+
+from model import AggregationConfig
+
+# Values closer to zero are counted as zero
+_MIN_VALUE = 1e-9
+OTHER = "__other__"
+
+
+class LogBucketSketch:
+    """Approximates quantiles of a stream of numbers in a bounded amount of memory.
+
+    Values are counted in buckets whose bounds grow by the factor
+    `(1 + accuracy) / (1 - accuracy)`, so every quantile is off by at most
+    `accuracy` relative to the actual value (like DDSketch). If there are more
+    than `max_buckets` buckets, the buckets of the values closest to zero are
+    merged, which only affects the accuracy of the lowest quantiles.
+    """
+
+    def __init__(self, accuracy: float = 0.01, max_buckets: int = 1024) -> None:
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.max_buckets = max_buckets
+        self._log_gamma = math.log(self.gamma)
+        self._positive: dict[int, int] = {}
+        self._negative: dict[int, int] = {}
+        self._zero = 0
+        self.count = 0
+
+    def _key(self, value: float) -> int:
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def _value(self, key: int) -> float:
+        # Between the bounds of the bucket, with the same relative error to both
+        return 2 * self.gamma**key / (self.gamma + 1)
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        if value > _MIN_VALUE:
+            store = self._positive
+        elif value < -_MIN_VALUE:
+            store = self._negative
+        else:
+            self._zero += 1
+            return
+        key = self._key(abs(value))
+        store[key] = store.get(key, 0) + 1
+        if len(self._positive) + len(self._negative) > self.max_buckets:
+            self._collapse(store)
+
+    @staticmethod
+    def _collapse(store: dict[int, int]) -> None:
+        lowest = min(store)
+        count = store.pop(lowest)
+        if store:
+            store[min(store)] += count
+        else:
+            store[lowest] = count
+
+    def _buckets(self):
+        """Yield the value and count of all buckets, from the lowest value."""
+        for key in sorted(self._negative, reverse=True):
+            yield -self._value(key), self._negative[key]
+        if self._zero:
+            yield 0.0, self._zero
+        for key in sorted(self._positive):
+            yield self._value(key), self._positive[key]
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for value, count in self._buckets():
+            seen += count
+            if seen > rank:
+                return value
+        return value
+
+
+class FieldStats:
+    def __init__(self, config: AggregationConfig) -> None:
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sketch = (
+            LogBucketSketch(config.accuracy, config.max_buckets)
+            if config.percentiles
+            else None
+        )
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if self.sketch is not None:
+            self.sketch.add(value)
+
+    def to_document(self, percentiles: list[float]) -> dict:
+        document = {"count": self.count, "sum": self.sum}
+        if self.count:
+            document.update(min=self.min, max=self.max, avg=self.sum / self.count)
+        for percentile in percentiles if self.count else ():
+            value = self.sketch.quantile(percentile / 100)
+            # The sketch is approximate, the extremes are not
+            document[f"p{percentile:g}"] = min(max(value, self.min), self.max)
+        return document
+
+
+def _number(value: Any) -> Optional[float]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value) if math.isfinite(value) else None
+    if isinstance(value, str):
+        try:
+            number = float(value)
+        except ValueError:
+            return None
+        return number if math.isfinite(number) else None
+    return None
+
+
+class Aggregator:
+    """Rolls the events of one event config up into one document per key and window.
+
+    Windows are aligned to the wall clock, e.g. a window of 60 seconds starts at
+    every full minute. The key consists of the `group_by` fields of the event.
+    Events of keys beyond `max_keys` are counted under the key `__other__`, so
+    the memory used per window is bounded.
+    """
+
+    def __init__(self, config: AggregationConfig) -> None:
+        self.config = config
+        self._window_start: Optional[float] = None
+        self._counts: dict[tuple, int] = {}
+        self._stats: dict[tuple, dict[str, FieldStats]] = {}
+
+    def _key(self, document: dict) -> tuple:
+        key = tuple(
+            value if isinstance(value, (str, int, float, type(None))) else str(value)
+            for value in (document.get(field) for field in self.config.group_by)
+        )
+        if key not in self._counts and len(self._counts) >= self.config.max_keys:
+            return (OTHER,) * len(self.config.group_by)
+        return key
+
+    def add(self, document: dict, now: float) -> list[dict]:
+        """Add the event, and return the documents of the window which ended, if any."""
+        documents = self.expired(now)
+        if self._window_start is None:
+            self._window_start = now - now % self.config.window
+        key = self._key(document)
+        self._counts[key] = self._counts.get(key, 0) + 1
+        stats = self._stats.setdefault(key, {})
+        for field in self.config.fields:
+            if (value := _number(document.get(field))) is None:
+                continue
+            if field not in stats:
+                stats[field] = FieldStats(self.config)
+            stats[field].add(value)
+        return documents
+
+    def deadline(self) -> Optional[float]:
+        """Time at which the current window ends, if any events were added."""
+        if self._window_start is None:
+            return None
+        return self._window_start + self.config.window
+
+    def expired(self, now: Optional[float] = None) -> list[dict]:
+        """Return the documents of the window if it ended, or in any case if `now`
+        is None."""
+        deadline = self.deadline()
+        if deadline is None or (now is not None and now < deadline):
+            return []
+        start = datetime.fromtimestamp(self._window_start).isoformat()
+        end = datetime.fromtimestamp(deadline).isoformat()
+        documents = []
+        for key, count in self._counts.items():
+            document = dict(zip(self.config.group_by, key))
+            document.update(window_start=start, window_end=end, count=count)
+            for field, stats in self._stats[key].items():
+                document[field] = stats.to_document(self.config.percentiles)
+            documents.append(document)
+        self._window_start = None
+        self._counts = {}
+        self._stats = {}
+        return documents
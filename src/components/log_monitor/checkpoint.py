@@ -0,0 +1,132 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Optional, Sequence
+
+from components.sink.router import SinkRouter
+from utils import write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+
+class CheckpointStore:
+    """Persists the read offset of every watched log file.
+
+    Offsets are kept in memory and written to disk every `interval` seconds, if
+    they changed. With a `sink`, the offsets are only written once the documents
+    queued before they were updated have been sent, so that documents are sent
+    again rather than lost after a crash. The file is replaced atomically, so a
+    crash never leaves a partially written checkpoint file behind. Together with
+    the inode and device of a file, the offset allows to continue reading where
+    the monitor stopped.
+    """
+
+    def __init__(
+        self, path: str, interval: float = 5.0, sink: Optional[SinkRouter] = None
+    ) -> None:
+        self.path = path
+        self.interval = interval
+        self.sink = sink
+        self._checkpoints: dict[str, dict] = self._load()
+        self._dirty = False
+        # Incremented by every change
+        self._version = 0
+
+    def _load(self) -> dict[str, dict]:
+        try:
+            with open(self.path, "r") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError):
+            logger.exception(f"Unable to load checkpoints from {self.path}.")
+            return {}
+
+    def get(self, log_file_path: str) -> Optional[dict]:
+        return self._checkpoints.get(log_file_path)
+
+    def get_offset(
+        self, log_file_path: str, stat: os.stat_result, aliases: Sequence[str] = ()
+    ) -> Optional[int]:
+        """Offset to continue reading at, if the file was read before.
+
+        Without a checkpoint for the path, the checkpoint of one of `aliases`, e.g.
+        a symlink the file was read through before, is moved to the path if it is
+        of the same file.
+
+        Returns 0 if a different file was found at the path (e.g. after a rotation)
+        and None if there is no checkpoint for the path.
+        """
+        if (checkpoint := self.get(log_file_path)) is None:
+            for alias in aliases:
+                checkpoint = self.get(alias)
+                if checkpoint is not None and (
+                    checkpoint["inode"],
+                    checkpoint["device"],
+                ) == (stat.st_ino, stat.st_dev):
+                    logger.info(f"Moving the checkpoint of {alias} to {log_file_path}.")
+                    self.remove(alias)
+                    self.update(log_file_path, stat, checkpoint["offset"])
+                    break
+            else:
+                return None
+        if (checkpoint["inode"], checkpoint["device"]) != (stat.st_ino, stat.st_dev):
+            return 0
+        if checkpoint["offset"] > stat.st_size:
+            # The file has been truncated
+            return 0
+        return checkpoint["offset"]
+
+    def update(self, log_file_path: str, stat: os.stat_result, offset: int) -> None:
+        self._checkpoints[log_file_path] = {
+            "inode": stat.st_ino,
+            "device": stat.st_dev,
+            "offset": offset,
+        }
+        self._dirty = True
+        self._version += 1
+
+    def remove(self, log_file_path: str) -> None:
+        if self._checkpoints.pop(log_file_path, None) is not None:
+            self._dirty = True
+            self._version += 1
+
+    def discard_changes(self) -> None:
+        """Do not save the changes since the last save, e.g. because the documents
+        read meanwhile could not be sent. They are saved with the next update."""
+        self._dirty = False
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+        write_json_atomic(self.path, self._checkpoints)
+        self._dirty = False
+
+    async def save_sent(self) -> None:
+        """Save the current offsets, once the documents queued so far have been sent
+        by the sink."""
+        if not self._dirty:
+            return
+        checkpoints, version = dict(self._checkpoints), self._version
+        if self.sink is not None:
+            await self.sink.flush()
+        write_json_atomic(self.path, checkpoints)
+        if self._version == version:
+            self._dirty = False
+
+    async def run(self) -> None:
+        """Periodically save the checkpoints, until cancelled.
+
+        The checkpoints are saved once more when cancelled, which assumes that the
+        sink has been closed before.
+        """
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                try:
+                    await self.save_sent()
+                except OSError:
+                    logger.exception(f"Unable to save checkpoints to {self.path}.")
+        finally:
+            self.save()
@@ -0,0 +1,293 @@
+import asyncio
+import glob
+import logging
+import os
+import zlib
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Coroutine, Optional
+
+from elasticsearch import AsyncElasticsearch
+from pydantic import BaseModel
+
+from components.base.base_monitor import BaseMonitor
+from components.log_monitor.checkpoint import CheckpointStore
+from components.log_monitor.monitor import LogMonitor
+from components.log_monitor.watcher import FileWatcher, create_directory_watcher
+from components.sink.router import SinkRouter
+from model import LogMonitorConfig, LogMonitorEvent, StartPosition, WatcherType
+
+logger = logging.getLogger(__name__)
+
+
+def shard_of(path: str, shards: int) -> int:
+    """Shard a log file belongs to. Stable across processes and restarts."""
+    return zlib.crc32(os.fsencode(os.path.abspath(path))) % shards
+
+
+def _dump(*models: BaseModel, exclude: Optional[set] = None) -> list[dict]:
+    # Models are compared by their fields, not by their compiled regexes
+    return [model.model_dump(exclude=exclude) for model in models]
+
+
+def create_parse_executor(threads: int) -> Optional[Executor]:
+    """Thread pool to match and parse log lines in, None to do it on the event loop.
+
+    Matching does not run in parallel to the event loop, but the event loop gets
+    its share of time while long lines are parsed, instead of waiting for them.
+    """
+    if threads == 0:
+        return None
+    return ThreadPoolExecutor(threads, thread_name_prefix="log-parser")
+
+
+class LogFileDiscovery(BaseMonitor):
+    """Starts a LogMonitor for every file matching the path of a log config.
+
+    Files are identified by their real path, so a file matched by several configs,
+    or through symlinks, is read by a single monitor with the events of all of
+    these configs. Lines are matched against the events of each config separately,
+    as if every config read the file by itself. The other settings of the monitor
+    are taken from the first of these configs.
+
+    The glob patterns are evaluated again whenever a file is created in one of
+    their directories, and at least every `rescan_interval` seconds. Monitors of
+    deleted files end by themselves and are forgotten, so that a file which
+    appears again at the same path is picked up by a new monitor.
+
+    With `shard=(index, count)`, only files with `shard_of(path, count) == index`
+    are monitored, so that several processes can split the files between them.
+    Lines are matched and parsed using `executor`, if given.
+
+    The configs can be replaced while running using `reconfigure`.
+    """
+
+    def __init__(
+        self,
+        configs: list[LogMonitorConfig],
+        es: AsyncElasticsearch,
+        sink: Optional[SinkRouter] = None,
+        checkpoints: Optional[CheckpointStore] = None,
+        rescan_interval: float = 5.0,
+        shard: Optional[tuple[int, int]] = None,
+        executor: Optional[Executor] = None,
+    ) -> None:
+        super().__init__(es, sink)
+        self.configs = configs
+        self.checkpoints = checkpoints
+        self.rescan_interval = rescan_interval
+        self.shard = shard
+        self.executor = executor
+        self.monitors: dict[str, LogMonitor] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+        # Indices of the configs matching each monitored file
+        self._matches: dict[str, tuple[int, ...]] = {}
+        self._watcher: Optional[FileWatcher] = None
+        # Configs which have not been scanned yet, their start position applies
+        self._unscanned = set(range(len(configs)))
+        self._reconfigured = False
+
+    async def start_monitoring(self) -> None:
+        watcher = self._watcher = self._create_watcher()
+        try:
+            self._scan()
+            while not self.stopped:
+                await watcher.wait(timeout=self.rescan_interval)
+                if self._reconfigured:
+                    self._reconfigured = False
+                    watcher.close()
+                    watcher = self._watcher = self._create_watcher()
+                if not self.stopped:
+                    self._scan()
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        finally:
+            watcher.close()
+            for task in list(self._tasks.values()):
+                task.cancel()
+
+    def stop_monitoring(self) -> None:
+        """Stop discovering files and stop all started monitors."""
+        self._stopped.set()
+        if self._watcher is not None:
+            self._watcher.wake()
+        for monitor in self.monitors.values():
+            monitor.stop_monitoring()
+
+    def reconfigure(self, configs: list[LogMonitorConfig]) -> None:
+        """Replace the configs, keeping the monitors of files whose configs did not
+        change.
+
+        Configs are matched by their path. If only the events of the configs of a
+        file changed, its monitor continues with the new events. Otherwise it is
+        restarted and continues at the offset its predecessor stopped at. Monitors
+        of files no longer matched by any config are stopped.
+        """
+        indices: dict[str, list[int]] = {}
+        for index, config in enumerate(self.configs):
+            indices.setdefault(config.path, []).append(index)
+        new_indices = {}
+        for new_index, config in enumerate(configs):
+            if indices.get(config.path):
+                new_indices[indices[config.path].pop(0)] = new_index
+        self._unscanned = set(range(len(configs))) - set(new_indices.values())
+        old_configs, self.configs = self.configs, configs
+
+        for path, monitor in list(self.monitors.items()):
+            old = self._matches[path]
+            matches = tuple(sorted(new_indices[i] for i in old if i in new_indices))
+            if not matches:
+                logger.info(f"Stop monitoring {path}, its config has been removed.")
+                monitor.stop_monitoring()
+                self._forget(path)
+                continue
+            self._matches[path] = matches
+            events, groups = self._events(matches)
+            if _dump(old_configs[old[0]], exclude={"events"}) != _dump(
+                configs[matches[0]], exclude={"events"}
+            ):
+                logger.info(f"Restart monitoring {path}, its config has changed.")
+                monitor.stop_monitoring()
+                restarted = self._create_monitor(
+                    path,
+                    configs[matches[0]],
+                    events,
+                    groups,
+                    initial=False,
+                    aliases=monitor.checkpoint_aliases,
+                )
+                self.monitors[path] = restarted
+                self._tasks[path] = self._start_task(
+                    path, self._restart(restarted, monitor, self._tasks[path])
+                )
+            elif _dump(*events) != _dump(*monitor.events) or groups != monitor.groups:
+                monitor.update_events(events, groups)
+        if self._watcher is not None:
+            self._reconfigured = True
+            self._watcher.wake()
+
+    def _create_watcher(self) -> FileWatcher:
+        directories = set()
+        for config in self.configs:
+            directory = os.path.dirname(os.path.abspath(config.path))
+            if glob.escape(directory) == directory:
+                directories.add(directory)
+        # Inotify is only used if all configs allow it
+        watcher_type = WatcherType.AUTO
+        if any(config.watcher == WatcherType.POLLING for config in self.configs):
+            watcher_type = WatcherType.POLLING
+        return create_directory_watcher(
+            sorted(directories), watcher_type, self.rescan_interval
+        )
+
+    def _scan(self) -> None:
+        found: dict[str, list[int]] = {}
+        # Paths the files were found at, which checkpoints were saved for before
+        # files were identified by their real path
+        aliases: dict[str, list[str]] = {}
+        for index, config in enumerate(self.configs):
+            for match in glob.glob(config.path):
+                if not os.path.isfile(match):
+                    continue
+                path = os.path.realpath(match)
+                if self._in_shard(path):
+                    matches = found.setdefault(path, [])
+                    if index not in matches:
+                        matches.append(index)
+                    alias = os.path.abspath(match)
+                    if alias != path and alias not in aliases.get(path, []):
+                        aliases.setdefault(path, []).append(alias)
+
+        for path, matches in found.items():
+            if path in self._tasks:
+                added = set(matches) - set(self._matches[path])
+                if added:
+                    # E.g. a symlink to the file has been created
+                    self._matches[path] = tuple(
+                        sorted(added.union(self._matches[path]))
+                    )
+                    self.monitors[path].update_events(
+                        *self._events(self._matches[path])
+                    )
+                continue
+            logger.info(f"Start monitoring {path}.")
+            config = self.configs[matches[0]]
+            monitor = self._create_monitor(
+                path,
+                config,
+                *self._events(matches),
+                matches[0] in self._unscanned,
+                tuple(aliases.get(path, ())),
+            )
+            self.monitors[path] = monitor
+            self._matches[path] = tuple(matches)
+            self._tasks[path] = self._start_task(path, monitor.start_monitoring())
+        self._unscanned.clear()
+
+    def _events(
+        self, matches: tuple[int, ...]
+    ) -> tuple[list[LogMonitorEvent], list[int]]:
+        """The events of the configs `matches` and the group of each event, one group
+        per config."""
+        events, groups = [], []
+        for group, index in enumerate(matches):
+            events.extend(self.configs[index].events)
+            groups.extend([group] * len(self.configs[index].events))
+        return events, groups
+
+    def _start_task(self, path: str, coroutine: Coroutine) -> asyncio.Task:
+        task = asyncio.create_task(coroutine)
+        task.add_done_callback(lambda task: self._on_done(path, task))
+        return task
+
+    @staticmethod
+    async def _restart(
+        monitor: LogMonitor, previous: LogMonitor, previous_task: asyncio.Task
+    ) -> None:
+        # Continue where the previous monitor stopped, once it saved its last lines
+        await asyncio.wait([previous_task])
+        monitor.resume = previous.position
+        if not monitor.stopped:
+            await monitor.start_monitoring()
+
+    def _in_shard(self, path: str) -> bool:
+        if self.shard is None:
+            return True
+        index, count = self.shard
+        return shard_of(path, count) == index
+
+    def _create_monitor(
+        self,
+        path: str,
+        config: LogMonitorConfig,
+        events: list[LogMonitorEvent],
+        groups: list[int],
+        initial: bool,
+        aliases: tuple[str, ...] = (),
+    ) -> LogMonitor:
+        return LogMonitor(
+            path,
+            events,
+            self.es,
+            self.sink,
+            groups=groups,
+            checkpoint_aliases=aliases,
+            watcher_type=config.watcher,
+            poll_interval=config.poll_interval,
+            chunk_size=config.chunk_size,
+            checkpoints=self.checkpoints,
+            executor=self.executor,
+            # Files appearing while running are new, so all of their content is read
+            start_position=(
+                config.start_position if initial else StartPosition.BEGINNING
+            ),
+        )
+
+    def _on_done(self, path: str, task: asyncio.Task) -> None:
+        if self._tasks.get(path) is task:
+            self._forget(path)
+        if not task.cancelled() and (exception := task.exception()) is not None:
+            logger.error(f"Monitoring {path} failed.", exc_info=exception)
+
+    def _forget(self, path: str) -> None:
+        del self._tasks[path]
+        del self.monitors[path]
+        del self._matches[path]
@@ -0,0 +1,150 @@
+import random
+from collections import OrderedDict
+from typing import Optional
+
+from components.sink import codec
+from model import DedupConfig, FilterConfig, RateLimitConfig, TimestampConfig
+
+# Fields which differ between otherwise identical events
+_VOLATILE = ("line", "pattern")
+
+
+class _Window:
+    def __init__(self, expires_at: float) -> None:
+        self.expires_at = expires_at
+        self.repeats = 0
+        self.last: Optional[dict] = None
+
+
+class Deduplicator:
+    """Drops documents identical to one seen less than `window` seconds before.
+
+    The first document of a window is kept. Once the window ended, `expired`
+    returns the last dropped document with the number of dropped documents as
+    `repeat_count`. At most `max_keys` windows are kept, if there are more
+    distinct documents the oldest windows end early, so the memory stays bounded.
+    """
+
+    def __init__(self, config: DedupConfig, ignored: tuple[str, ...] = ()) -> None:
+        self.config = config
+        self.ignored = frozenset(_VOLATILE + ignored)
+        # In the order the windows started, which is the order they expire
+        self._windows: OrderedDict[bytes, _Window] = OrderedDict()
+        self._ended: list[_Window] = []
+
+    def _key(self, document: dict) -> bytes:
+        if self.config.fields is not None:
+            return codec.dumps([document.get(field) for field in self.config.fields])
+        return codec.dumps(
+            {key: value for key, value in document.items() if key not in self.ignored}
+        )
+
+    def check(self, document: dict, now: float) -> bool:
+        """Return whether the document should be kept."""
+        key = self._key(document)
+        window = self._windows.get(key)
+        if window is not None:
+            if window.expires_at > now:
+                window.repeats += 1
+                window.last = document
+                return False
+            del self._windows[key]
+            self._ended.append(window)
+        self._windows[key] = _Window(now + self.config.window)
+        if len(self._windows) > self.config.max_keys:
+            self._ended.append(self._windows.popitem(last=False)[1])
+        return True
+
+    def expired(self, now: Optional[float] = None) -> list[dict]:
+        """Return the summaries of the windows which ended, or of all windows if
+        `now` is None."""
+        ended, self._ended = self._ended, []
+        while self._windows:
+            key, window = next(iter(self._windows.items()))
+            if now is not None and window.expires_at > now:
+                break
+            del self._windows[key]
+            ended.append(window)
+        return [
+            {**window.last, "repeat_count": window.repeats}
+            for window in ended
+            if window.repeats
+        ]
+
+    def deadline(self) -> Optional[float]:
+        """Time at which the next window ends, if any."""
+        if self._ended:
+            return 0.0
+        for window in self._windows.values():
+            return window.expires_at
+        return None
+
+
+class TokenBucket:
+    """Allows `rate` events per second on average and `burst` events at once."""
+
+    def __init__(self, config: RateLimitConfig) -> None:
+        self.rate = config.rate
+        self.burst = config.burst or config.rate
+        self._tokens = self.burst
+        self._updated_at: Optional[float] = None
+
+    def take(self, now: float) -> bool:
+        if self._updated_at is not None:
+            elapsed = now - self._updated_at
+            self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+        self._updated_at = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+class EventFilter:
+    """Applies the filters of one event to its documents, before they are saved.
+
+    Documents are dropped if they match an exclude regex, repeat a recent
+    document, exceed the rate limit or are not sampled, in that order. Kept
+    documents of sampled events get the sample rate as `sample_rate`, so counts
+    can be extrapolated.
+    """
+
+    def __init__(
+        self,
+        config: FilterConfig,
+        timestamp: Optional[TimestampConfig] = None,
+        rng: Optional[random.Random] = None,
+    ) -> None:
+        self.config = config
+        self.rng = rng or random.Random()
+        self.dedup = None
+        if config.dedup is not None:
+            ignored = () if timestamp is None else (timestamp.group, timestamp.field)
+            self.dedup = Deduplicator(config.dedup, ignored)
+        self.rate_limit = None
+        if config.rate_limit is not None:
+            self.rate_limit = TokenBucket(config.rate_limit)
+
+    def check(self, document: dict, now: float) -> Optional[str]:
+        """Return why the document is dropped, or None if it is kept."""
+        line = document.get("line", "")
+        if any(pattern.search(line) for pattern in self.config.exclude_patterns):
+            return "excluded"
+        if self.dedup is not None and not self.dedup.check(document, now):
+            return "duplicate"
+        if self.rate_limit is not None and not self.rate_limit.take(now):
+            return "rate_limited"
+        if self.config.sample < 1:
+            if self.rng.random() >= self.config.sample:
+                return "sampled"
+            document["sample_rate"] = self.config.sample
+        return None
+
+    def expired(self, now: Optional[float] = None) -> list[dict]:
+        """Return the summaries of repeated documents, see `Deduplicator`."""
+        if self.dedup is None:
+            return []
+        return self.dedup.expired(now)
+
+    def deadline(self) -> Optional[float]:
+        return self.dedup.deadline() if self.dedup is not None else None
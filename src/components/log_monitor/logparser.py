@@ -1,24 +1,140 @@
-import json
 import logging
 import re
+import time
 from typing import Optional
 
+try:
+    from re import _parser as sre_parse  # Python >= 3.11
+except ImportError:  # pragma: no cover
+    import sre_parse
+
+from components.metrics.metrics import REGISTRY
+from components.sink import codec
+
 logger = logging.getLogger(__name__)
 
+PARSE_SECONDS = REGISTRY.histogram(
+    "log_event_parse_seconds",
+    "Time spent matching a line against the regexes and parsing the named groups "
+    "of the event it matched. Lines matching no event are not included.",
+    ("event",),
+)
+
+_REPEATS = tuple(
+    getattr(sre_parse, op)
+    for op in ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT")
+    if hasattr(sre_parse, op)
+)
+
+
+def _literal_candidates(items) -> list[tuple[str, ...]]:
+    candidates: list[tuple[str, ...]] = []
+    current: list[str] = []
+
+    def end_run() -> None:
+        if current:
+            candidates.append(("".join(current),))
+            current.clear()
+
+    def walk(items) -> None:
+        for op, av in items:
+            if op is sre_parse.LITERAL:
+                current.append(chr(av))
+            elif op is sre_parse.AT:
+                # Anchors do not consume characters
+                continue
+            elif op is sre_parse.SUBPATTERN and not av[1] & re.IGNORECASE:
+                walk(av[-1])
+            elif op in _REPEATS and av[0] >= 1:
+                end_run()
+                walk(av[2])
+                end_run()
+            elif op is sre_parse.BRANCH:
+                end_run()
+                alternatives = [_longest_literal(branch) for branch in av[1]]
+                if all(alternatives):
+                    candidates.append(tuple(alternatives))
+            else:
+                end_run()
+
+    walk(items)
+    end_run()
+    return candidates
+
+
+def _longest_literal(items) -> Optional[str]:
+    literals = [c[0] for c in _literal_candidates(items) if len(c) == 1]
+    return max(literals, key=len, default=None)
+
+
+def _subpatterns(value):
+    if isinstance(value, sre_parse.SubPattern):
+        yield value
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            yield from _subpatterns(item)
+
+
+def _has_group_references(items) -> bool:
+    for op, av in items:
+        if op in (sre_parse.GROUPREF, sre_parse.GROUPREF_EXISTS):
+            return True
+        if any(_has_group_references(nested) for nested in _subpatterns(av)):
+            return True
+    return False
+
+
+def required_literals(pattern: str) -> Optional[tuple[str, ...]]:
+    """Find literal substrings of which at least one must be part of every match.
+
+    Used as a cheap prefilter: if none of the returned literals is part of a line,
+    the pattern can not match it and the regex does not need to run.
+
+    Args:
+        pattern (str): the regular expression.
+
+    Returns:
+        Optional[tuple[str, ...]]: The most selective set of alternative literals,
+        or None if no literal is required by the pattern.
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except re.error:
+        return None
+    if parsed.state.flags & re.IGNORECASE:
+        return None
+    return max(
+        _literal_candidates(parsed),
+        key=lambda literals: min(map(len, literals)),
+        default=None,
+    )
+
 
 class EventParser:
     def __init__(self, name: str, regex_matchers: list) -> None:
         self.name = name
         self.regex_matchers = regex_matchers
+        self.patterns = [re.compile(pattern) for pattern in regex_matchers]
+        self._parse_seconds = PARSE_SECONDS.labels(name)
 
     def parse_line(self, line: str) -> Optional[dict]:
-        for pattern in self.regex_matchers:
-            match = re.search(pattern, line)
+        start = time.perf_counter()
+        for pattern in self.patterns:
+            match = pattern.search(line)
             if match:
-                logger.debug(f"New event found: {self.name}")
-                return self._parse(match)
+                return self.parse_match(match, start)
         return None
 
+    def parse_match(self, match: re.Match, start: Optional[float] = None) -> dict:
+        """Parse the named groups of `match`. The time since `start`, when the
+        matching began, is included in the parse time of the event."""
+        logger.debug(f"New event found: {self.name}")
+        if start is None:
+            start = time.perf_counter()
+        result = self._parse(match)
+        self._parse_seconds.observe(time.perf_counter() - start)
+        return result
+
     def _parse(self, match: re.Match) -> dict:
         raise NotImplementedError("abstract base class")
 
@@ -28,7 +144,7 @@ class LogEventParser(EventParser):
         super().__init__(name, regex_matchers)
 
     def _parse_json_group(self, json_string: str) -> dict:
-        return json.loads(json_string)
+        return codec.loads(json_string)
 
     def _parse(self, match: re.Match) -> dict:
         """Parse lines using events defined in log_monitor_config.
@@ -53,3 +169,96 @@ class LogEventParser(EventParser):
         named_groups.update({"line": match.string, "pattern": match.re.pattern})
 
         return named_groups
+
+
+class _MatcherPattern:
+    def __init__(self, parser_index: int, pattern: re.Pattern) -> None:
+        self.parser_index = parser_index
+        self.pattern = pattern
+        self.literals = required_literals(pattern.pattern)
+        # Index of the capturing group wrapping this pattern in the combined regex
+        self.group = 0
+
+
+class EventMatcher:
+    """Matches lines against the patterns of several event parsers in a single pass.
+
+    All patterns are precompiled and combined into one alternation, which rejects
+    non-matching lines with a single scan. Before that, lines are checked for the
+    literals required by the patterns, so most lines are rejected without running
+    any regex. The first matching pattern of the first matching parser wins, just
+    as if `EventParser.parse_line` was called for each parser in order.
+    """
+
+    def __init__(self, parsers: list[EventParser]) -> None:
+        self.parsers = parsers
+        self._patterns = [
+            _MatcherPattern(index, pattern)
+            for index, parser in enumerate(parsers)
+            for pattern in parser.patterns
+        ]
+        self._all_filtered = all(p.literals is not None for p in self._patterns)
+        self._combined = self._combine(self._patterns)
+
+    @staticmethod
+    def _combine(patterns: list[_MatcherPattern]) -> Optional[re.Pattern]:
+        if len(patterns) < 2:
+            return None
+        for pattern in patterns:
+            # Numbered back references would point to the wrong group
+            if _has_group_references(sre_parse.parse(pattern.pattern.pattern)):
+                return None
+        group = 1
+        for pattern in patterns:
+            pattern.group = group
+            group += pattern.pattern.groups + 1
+        try:
+            # Global inline flags or duplicate group names are not allowed inside
+            # of the alternation. Fall back to matching pattern by pattern.
+            return re.compile("|".join(f"({p.pattern.pattern})" for p in patterns))
+        except re.error:
+            return None
+
+    def match(self, line: str) -> Optional[tuple[int, dict]]:
+        """Find the first event matching the line.
+
+        Args:
+            line (str): the log line.
+
+        Returns:
+            Optional[tuple[int, dict]]: The index of the matching parser and its
+            parsed result, or None if no parser matched.
+        """
+        start = time.perf_counter()
+        if self._all_filtered:
+            candidates = [
+                p
+                for p in self._patterns
+                if any(literal in line for literal in p.literals)
+            ]
+        else:
+            candidates = [
+                p
+                for p in self._patterns
+                if p.literals is None or any(literal in line for literal in p.literals)
+            ]
+        if not candidates:
+            return None
+
+        if self._combined is not None and len(candidates) > 1:
+            combined_match = self._combined.search(line)
+            if combined_match is None:
+                return None
+            # The alternative matching at the leftmost position is known to match,
+            # but earlier patterns might still match further right in the line.
+            for pattern in candidates:
+                if combined_match.group(pattern.group) is not None:
+                    candidates = candidates[: candidates.index(pattern) + 1]
+                    break
+
+        for pattern in candidates:
+            if match := pattern.pattern.search(line):
+                return pattern.parser_index, self.parsers[
+                    pattern.parser_index
+                ].parse_match(match, start)
+        return None
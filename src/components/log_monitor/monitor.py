@@ -1,15 +1,45 @@
 import asyncio
 import logging
-from typing import Iterator, Optional
+import os
+import time
+from concurrent.futures import Executor
+from typing import AsyncIterator, Optional
 
-from aiofile import async_open
+from aiofile import AIOFile
 from elasticsearch import AsyncElasticsearch
 
 from components.base.base_monitor import BaseMonitor
-from model import LogMonitorEvent
+from components.log_monitor.aggregation import Aggregator
+from components.log_monitor.checkpoint import CheckpointStore
+from components.log_monitor.filters import EventFilter
+from components.log_monitor.logparser import EventMatcher
+from components.log_monitor.multiline import MultilineEvent
+from components.log_monitor.reader import LineReader
+from components.log_monitor.timestamp import TimestampParser
+from components.log_monitor.watcher import FileWatcher, create_watcher
+from components.metrics.metrics import REGISTRY
+from components.sink.router import SinkRouter
+from model import LogMonitorEvent, StartPosition, Target, WatcherType
 
 logger = logging.getLogger(__name__)
 
+LINES = REGISTRY.counter(
+    "log_monitor_lines_total", "Lines read from a log file.", ("path",)
+)
+EVENTS = REGISTRY.counter(
+    "log_monitor_events_total", "Events found in a log file.", ("path", "event")
+)
+FILTERED = REGISTRY.counter(
+    "log_monitor_filtered_total",
+    "Events dropped by the filters of the event.",
+    ("path", "event", "reason"),
+)
+MATCH_SECONDS = REGISTRY.counter(
+    "log_monitor_match_seconds_total",
+    "Time spent matching the lines of a log file against its events.",
+    ("path",),
+)
+
 
 class LogMonitor(BaseMonitor):
     def __init__(
@@ -17,50 +47,485 @@ class LogMonitor(BaseMonitor):
         log_file_path: str,
         log_events: list[LogMonitorEvent],
         es: AsyncElasticsearch,
+        sink: Optional[SinkRouter] = None,
+        watcher_type: WatcherType = WatcherType.AUTO,
+        poll_interval: float = 0.1,
+        chunk_size: int = 256 * 1024,
+        checkpoints: Optional[CheckpointStore] = None,
+        start_position: StartPosition = StartPosition.BEGINNING,
+        executor: Optional[Executor] = None,
+        max_in_flight: int = 4,
+        resume: Optional[tuple[int, int, int]] = None,
+        groups: Optional[list[int]] = None,
+        checkpoint_aliases: tuple[str, ...] = (),
     ) -> None:
-        super().__init__(es)
+        super().__init__(es, sink)
         self.log_file_path = log_file_path
-        self.events = log_events
+        self.watcher_type = watcher_type
+        self.poll_interval = poll_interval
+        self.chunk_size = chunk_size
+        self.checkpoints = checkpoints
+        self.start_position = start_position
+        # Other paths the checkpoint of the file may have been saved for
+        self.checkpoint_aliases = checkpoint_aliases
+        self.executor = executor
+        self.max_in_flight = max_in_flight
+        # Inode, device and offset to continue at, see `position`
+        self.resume = resume
+        self.position: Optional[tuple[int, int, int]] = None
+        # Pending multi-line events by group
+        self._pending: dict[int, MultilineEvent] = {}
+        # Offsets of the batches in which the pending multi-line events and the
+        # current aggregation windows started
+        self._holds: dict[object, int] = {}
+        self._stat: Optional[os.stat_result] = None
+        self._next_events: Optional[tuple[list[LogMonitorEvent], list[int]]] = None
+        self._watcher: Optional[FileWatcher] = None
+        path = str(log_file_path)
+        self._lines_metric = LINES.labels(path)
+        self._match_seconds_metric = MATCH_SECONDS.labels(path)
+        self._set_events(
+            log_events,
+            groups if groups is not None else [0] * len(log_events),
+            [self._event_state(event) for event in log_events],
+        )
+
+    @staticmethod
+    def _event_state(event: LogMonitorEvent) -> tuple:
+        return (
+            # Per file, since the detected timestamp format is cached
+            TimestampParser(event.timestamp) if event.timestamp is not None else None,
+            (
+                EventFilter(event.filters, event.timestamp)
+                if event.filters is not None
+                else None
+            ),
+            Aggregator(event.aggregation) if event.aggregation is not None else None,
+        )
+
+    def _set_events(
+        self, events: list[LogMonitorEvent], groups: list[int], states: list[tuple]
+    ) -> None:
+        self.events = events
+        self.groups = groups
+        members: dict[int, list[int]] = {}
+        for event_index, group in enumerate(groups):
+            members.setdefault(group, []).append(event_index)
+        # The first matching event of every group is saved
+        self.matchers = [
+            (EventMatcher([events[i].parser for i in indices]), indices)
+            for indices in members.values()
+        ]
+        self._timestamps = [state[0] for state in states]
+        self._filters = [state[1] for state in states]
+        self._aggregators = [state[2] for state in states]
+        path = str(self.log_file_path)
+        self._event_metrics = [EVENTS.labels(path, event.name) for event in events]
+        # Read by the threads matching lines, so it is replaced at once
+        self._matching = (self.matchers, self._timestamps)
+
+    def update_events(
+        self, events: list[LogMonitorEvent], groups: Optional[list[int]] = None
+    ) -> None:
+        """Replace the events, once the lines read so far have been processed.
+
+        Pending multi-line events are saved first. Events which did not change keep
+        their dedup and aggregation windows, those of changed events are saved.
+        """
+        self._next_events = (
+            events,
+            groups if groups is not None else [0] * len(events),
+        )
+        if self._watcher is not None:
+            self._watcher.wake()
+
+    async def _apply_events(self) -> None:
+        (events, groups), self._next_events = self._next_events, None
+        await self._flush_pending()
+        unchanged: dict[str, list[tuple]] = {}
+        for event, *state in zip(
+            self.events, self._timestamps, self._filters, self._aggregators
+        ):
+            unchanged.setdefault(event.model_dump_json(), []).append(tuple(state))
+        states = []
+        for event in events:
+            reused = unchanged.get(event.model_dump_json())
+            states.append(reused.pop(0) if reused else self._event_state(event))
+        kept = {id(part) for state in states for part in state}
+        for event, filters, aggregator in zip(
+            self.events, self._filters, self._aggregators
+        ):
+            # Report the windows of removed and changed events
+            if filters is not None and id(filters) not in kept:
+                await self._save_all(filters.expired(), event.targets)
+            if aggregator is not None and id(aggregator) not in kept:
+                await self._save_all(aggregator.expired(), event.targets)
+        logger.info(f"Updated the events of {self.log_file_path}.")
+        self._set_events(events, groups, states)
 
     async def start_monitoring(self):
-        async with async_open(self.log_file_path, "r") as logfile:
-            loglines = self._follow(logfile)
-            # TODO: multi log-line parsing could be done by
-            # storing the last x lines in the log and moving on via sliding window
-            async for line in loglines:
-                try:
-                    await self._retrieve_line_event(line)
-                except Exception:
-                    # TODO: proper exception handling. Make sure the parser can continue but properly logs the errors.
-                    logger.exception(f"Exception while parsing log line: {line}.")
+        watcher = self._watcher = create_watcher(
+            self.log_file_path, self.watcher_type, self.poll_interval
+        )
+        try:
+            start_offset = None
+            while await self._monitor_file(watcher, start_offset):
+                # The file has been rotated, continue with the new file
+                logger.info(f"{self.log_file_path} has been rotated, reopening it.")
+                watcher.rewatch()
+                start_offset = 0
+            # Report the repeat counts and aggregates of the current windows
+            await self._flush_windows()
+            if self.stopped and self.position is not None:
+                offset = self.position[2]
+                self._update_checkpoint(self._stat, offset, offset)
+        finally:
+            watcher.close()
+
+    async def _monitor_file(
+        self, watcher: FileWatcher, start_offset: Optional[int] = None
+    ) -> bool:
+        """Monitor the file currently found at the path until it is rotated or deleted.
+
+        Returns:
+            bool: True if the file has been rotated, False if it has been deleted.
+        """
+        try:
+            logfile = AIOFile(self.log_file_path, "rb")
+            await logfile.open()
+        except FileNotFoundError:
+            return self._retire()
+
+        async with logfile:
+            stat = os.fstat(logfile.fileno())
+            if start_offset is None:
+                start_offset = self._start_offset(stat)
+            self.position = (stat.st_ino, stat.st_dev, start_offset)
+            self._stat = stat
+            # Lines of a previous file can not be read again
+            self._holds = {}
+            batch_start = start_offset
+            reader = LineReader(
+                logfile, offset=start_offset, chunk_size=self.chunk_size
+            )
+            batches = self._match_batches(self._follow(reader, watcher, stat), reader)
+            async for lines, matches, offset in batches:
+                self.position = (stat.st_ino, stat.st_dev, offset)
+                self._lines_metric.inc(len(lines))
+                for line, found in zip(lines, matches):
+                    try:
+                        await self._handle_line(line, found)
+                    except Exception:
+                        # TODO: proper exception handling. Make sure the parser can continue but properly logs the errors.
+                        logger.exception(f"Exception while parsing log line: {line}.")
+                if self._next_events is not None:
+                    await self._apply_events()
+                for group, pending in list(self._pending.items()):
+                    if pending.expired():
+                        await self._flush_pending(group)
+                await self._flush_windows(time.monotonic())
+                if self.executor is not None and self._deadline() is not None:
+                    # The file may have been read to its end while the batch was
+                    # matched, wake the reader to wait for the deadline instead
+                    watcher.wake()
+                self._update_checkpoint(stat, batch_start, offset)
+                batch_start = offset
+            await self._flush_pending()
+            self._update_checkpoint(stat, batch_start, batch_start)
+
+        if self.stopped:
+            return False
+        if os.path.exists(self.log_file_path):
+            return True
+        return self._retire()
+
+    def _retire(self) -> bool:
+        logger.info(f"{self.log_file_path} has been deleted, stop monitoring it.")
+        if self.checkpoints is not None:
+            self.checkpoints.remove(self._checkpoint_key)
+        path = str(self.log_file_path)
+        LINES.remove(path)
+        MATCH_SECONDS.remove(path)
+        for event in self.events:
+            EVENTS.remove(path, event.name)
+            for reason in ("excluded", "duplicate", "rate_limited", "sampled"):
+                FILTERED.remove(path, event.name, reason)
+        return False
+
+    def _update_checkpoint(
+        self, stat: os.stat_result, batch_start: int, offset: int
+    ) -> None:
+        """Update the checkpoint to `offset`, the end of the batch starting at
+        `batch_start`. It is held at the start of the batch in which a pending
+        multi-line event or an aggregation window started, so that their lines are
+        read again after a crash.
+        """
+        if self.checkpoints is None:
+            return
+        holds: list[object] = list(self._pending.values())
+        holds.extend(
+            (aggregator, deadline)
+            for aggregator in self._aggregators
+            if aggregator is not None
+            and (deadline := aggregator.deadline()) is not None
+        )
+        self._holds = {hold: self._holds.get(hold, batch_start) for hold in holds}
+        self.checkpoints.update(
+            self._checkpoint_key, stat, min(self._holds.values(), default=offset)
+        )
+
+    @property
+    def _checkpoint_key(self) -> str:
+        return os.path.abspath(self.log_file_path)
+
+    def _start_offset(self, stat: os.stat_result) -> int:
+        if self.resume is not None:
+            inode, device, offset = self.resume
+            if (inode, device) == (stat.st_ino, stat.st_dev) and offset <= stat.st_size:
+                return offset
+        if self.checkpoints is not None:
+            offset = self.checkpoints.get_offset(
+                self._checkpoint_key, stat, self.checkpoint_aliases
+            )
+            if offset is not None:
+                logger.info(f"Continue reading {self.log_file_path} at {offset}.")
+                return offset
+        if self.start_position == StartPosition.END:
+            return stat.st_size
+        return 0
 
     def stop_monitoring(self) -> None:
-        # TODO: stop monitoring
-        pass
+        """Stop tailing the file. Lines which have already been read are processed."""
+        self._stopped.set()
+        if self._watcher is not None:
+            self._watcher.wake()
+
+    def _match_line(
+        self, line: str, matching: Optional[tuple] = None
+    ) -> list[tuple[int, dict]]:
+        """Match the line against the events of every group.
+
+        Returns:
+            list[tuple[int, dict]]: The index of the first matching event of each
+            group whose events match, and the parsed groups of the line.
+        """
+        matchers, timestamps = matching or self._matching
+        found = []
+        for matcher, indices in matchers:
+            if (match := matcher.match(line)) is None:
+                continue
+            event_index = indices[match[0]]
+            parser = timestamps[event_index]
+            if parser is not None:
+                parser.apply(match[1])
+            found.append((event_index, match[1]))
+        return found
+
+    def _match_lines(
+        self, lines: list[str]
+    ) -> tuple[list[list[tuple[int, dict]]], float, tuple]:
+        """Match and parse a batch of lines. Runs in the executor, if there is one.
+
+        Returns:
+            tuple[list[list[tuple[int, dict]]], float, tuple]: The result of
+            `_match_line` for every line, the time spent, and the matchers and
+            timestamp parsers used.
+        """
+        matching = self._matching
+        start = time.perf_counter()
+        matches = []
+        for line in lines:
+            try:
+                matches.append(self._match_line(line, matching))
+            except Exception:
+                logger.exception(f"Exception while parsing log line: {line}.")
+                matches.append([])
+        return matches, time.perf_counter() - start, matching
+
+    async def _match_batches(
+        self, batches: AsyncIterator[list[str]], reader: LineReader
+    ) -> AsyncIterator[tuple[list[str], list[list[tuple[int, dict]]], int]]:
+        """Match the batches of lines and yield them with their matches and the
+        offset after the batch, in the order they were read.
+
+        With an executor, up to `max_in_flight` batches are matched while the next
+        ones are read, and the event loop is free for other monitors meanwhile.
+        Lines belonging to pending multi-line events are matched as well, the
+        results are just not used.
+        """
+        if self.executor is None:
+            async for lines in batches:
+                matches, seconds, _ = self._match_lines(lines)
+                self._match_seconds_metric.inc(seconds)
+                yield lines, matches, reader.offset
+            return
+
+        loop = asyncio.get_running_loop()
+        in_flight = asyncio.Semaphore(self.max_in_flight)
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def produce() -> None:
+            try:
+                async for lines in batches:
+                    await in_flight.acquire()
+                    future = None
+                    if lines:
+                        future = loop.run_in_executor(
+                            self.executor, self._match_lines, lines
+                        )
+                    queue.put_nowait((lines, future, reader.offset))
+            finally:
+                queue.put_nowait(None)
+
+        producer = asyncio.create_task(produce())
+        try:
+            while (item := await queue.get()) is not None:
+                lines, future, offset = item
+                matches = []
+                if future is not None:
+                    matches, seconds, matching = await future
+                    if matching is not self._matching:
+                        # Matched before the events were updated
+                        matches, seconds, _ = self._match_lines(lines)
+                    self._match_seconds_metric.inc(seconds)
+                in_flight.release()
+                yield lines, matches, offset
+            # Raises the exception of the producer, if any
+            await producer
+        finally:
+            producer.cancel()
 
     async def _retrieve_line_event(self, line: str) -> Optional[dict]:
         """
         Find line events and parse corresponding log line.
         Return dict of line event if found, otherwise None
         """
-        for event in self.events:
-            if result := event.parser.parse_line(line):
-                logger.info(result)
-                # TODO: also store timestamp of log, if found in log.
-                # Should be there anyways, but how to parse? timestamp format as option?
-                await self._save_data(result, event.targets)
-                return result
-        return None
+        return await self._handle_line(line, self._match_line(line))
 
-    @staticmethod
-    async def _follow(file, sleep_timeout=0.1) -> Iterator[str]:
-        line = ""
-        while True:
-            tmp_line = await file.readline()
-            if tmp_line:
-                line += tmp_line
-                if line.endswith("\n"):
-                    yield line
-                    line = ""
+    async def _handle_line(
+        self, line: str, found: list[tuple[int, dict]]
+    ) -> Optional[dict]:
+        """
+        Save the line events found in the line, unless the line is added to a
+        pending multi-line event of their group. Return dict of the last line event
+        saved, otherwise None
+        """
+        added = set()
+        for group, pending in list(self._pending.items()):
+            if pending.add(line):
+                added.add(group)
+            if pending.finished:
+                await self._flush_pending(group)
+
+        saved = None
+        for event_index, result in found:
+            group = self.groups[event_index]
+            if group in added:
+                continue
+            event = self.events[event_index]
+            self._event_metrics[event_index].inc()
+            if event.multiline is not None:
+                pending = MultilineEvent(event.multiline, event_index, result, line)
+                self._pending[group] = pending
+                if pending.finished:
+                    await self._flush_pending(group)
+                continue
+            saved = await self._save_event(event_index, result) or saved
+        return saved
+
+    async def _flush_pending(self, group: Optional[int] = None) -> None:
+        """Save the pending multi-line event of `group`, or of all groups."""
+        for group in list(self._pending) if group is None else [group]:
+            if (pending := self._pending.pop(group, None)) is not None:
+                await self._save_event(pending.event_index, pending.to_document())
+
+    async def _save_event(self, event_index: int, result: dict) -> Optional[dict]:
+        """Save the event, unless it is dropped by its filters or aggregated."""
+        event = self.events[event_index]
+        filters = self._filters[event_index]
+        if filters is not None:
+            reason = filters.check(result, time.monotonic())
+            if reason is not None:
+                FILTERED.labels(str(self.log_file_path), event.name, reason).inc()
+                return None
+        aggregator = self._aggregators[event_index]
+        if aggregator is not None:
+            await self._save_all(aggregator.add(result, time.time()), event.targets)
+            return None
+        logger.info(result)
+        await self._save_data(result, event.targets)
+        return result
+
+    async def _save_all(self, documents: list[dict], targets: list[Target]) -> None:
+        for document in documents:
+            logger.info(document)
+            await self._save_data(document, targets)
+
+    async def _flush_windows(self, now: Optional[float] = None) -> None:
+        """Save the summaries of deduplicated events and the aggregates whose window
+        ended, or of all windows if `now` is None."""
+        wall_time = time.time() if now is not None else None
+        for event, filters, aggregator in zip(
+            self.events, self._filters, self._aggregators
+        ):
+            if filters is not None:
+                await self._save_all(filters.expired(now), event.targets)
+            if aggregator is not None:
+                await self._save_all(aggregator.expired(wall_time), event.targets)
+
+    def _deadline(self) -> Optional[float]:
+        """Time at which a pending multi-line event, a dedup window or an
+        aggregation window ends."""
+        deadlines = [
+            deadline
+            for filters in self._filters
+            if filters is not None and (deadline := filters.deadline()) is not None
+        ]
+        # Aggregation windows are aligned to the wall clock
+        offset = time.monotonic() - time.time()
+        deadlines.extend(
+            deadline + offset
+            for aggregator in self._aggregators
+            if aggregator is not None
+            and (deadline := aggregator.deadline()) is not None
+        )
+        deadlines.extend(pending.deadline() for pending in self._pending.values())
+        return min(deadlines, default=None)
+
+    async def _follow(
+        self, reader: LineReader, watcher: FileWatcher, stat: os.stat_result
+    ) -> AsyncIterator[list[str]]:
+        """Yield batches of lines, until the file is rotated or deleted and drained,
+        or monitoring is stopped.
+
+        An empty batch is yielded when a pending multi-line event timed out, a
+        dedup or aggregation window ended, or the events are to be updated.
+        """
+        while not self.stopped:
+            if self._next_events is not None:
+                # Lines read from now on are matched with the new events
+                yield []
+            lines = await reader.read_lines()
+            if lines:
+                yield lines
+                continue
+            if not reader.eof:
+                continue
+
+            # Everything appended so far has been read
+            try:
+                current = os.stat(self.log_file_path)
+            except FileNotFoundError:
+                return
+            if (current.st_ino, current.st_dev) != (stat.st_ino, stat.st_dev):
+                return
+            if current.st_size < reader.offset:
+                logger.info(f"{self.log_file_path} has been truncated.")
+                reader.reset(0)
+                continue
+            if (deadline := self._deadline()) is None:
+                await watcher.wait()
             else:
-                await asyncio.sleep(sleep_timeout)
+                timeout = max(0.0, deadline - time.monotonic())
+                if not await watcher.wait(timeout=timeout):
+                    yield []
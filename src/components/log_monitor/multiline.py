@@ -0,0 +1,73 @@
+import time
+from collections import deque
+from typing import Optional
+
+from model import MultilineConfig
+
+
+class MultilineEvent:
+    """Collects the lines of an event spanning multiple log lines.
+
+    The event starts with a line matched by one of the regexes of its
+    `LogMonitorEvent`. Following lines are added while they match the
+    `continuation` regex, or until a line matches the `end` regex. Lines are kept
+    in a ring buffer of `max_lines` lines, the event is finished as soon as the
+    buffer or `max_bytes` is full, so the memory used per event is bounded.
+    Every added line is checked against a single regex only.
+    """
+
+    def __init__(
+        self, config: MultilineConfig, event_index: int, result: dict, line: str
+    ) -> None:
+        self.config = config
+        self.event_index = event_index
+        self.result = result
+        self.lines: deque[str] = deque([line], maxlen=config.max_lines)
+        self.size = len(line.encode())
+        self.complete = False
+        self.last_update = time.monotonic()
+
+    def add(self, line: str) -> bool:
+        """Add the line to the event, if it is part of it.
+
+        Returns:
+            bool: True if the line has been added, False if the event is complete
+            and the line has to be processed on its own.
+        """
+        if self.config.continuation_pattern is not None:
+            if not self.config.continuation_pattern.search(line):
+                self.complete = True
+                return False
+        elif self.config.end_pattern.search(line):
+            self.complete = True
+
+        self.lines.append(line)
+        self.size += len(line.encode())
+        self.last_update = time.monotonic()
+        return True
+
+    @property
+    def finished(self) -> bool:
+        return (
+            self.complete
+            or len(self.lines) >= self.config.max_lines
+            or self.size >= self.config.max_bytes
+        )
+
+    def deadline(self) -> float:
+        """Point in time (time.monotonic) at which the event is flushed if idle."""
+        return self.last_update + self.config.flush_timeout
+
+    def expired(self, now: Optional[float] = None) -> bool:
+        return (now if now is not None else time.monotonic()) >= self.deadline()
+
+    def to_document(self) -> dict:
+        document = dict(self.result)
+        document.update(
+            {
+                "line": "".join(self.lines),
+                "lines": len(self.lines),
+                "complete": self.complete,
+            }
+        )
+        return document
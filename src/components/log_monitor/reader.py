@@ -0,0 +1,59 @@
+from aiofile import AIOFile
+
+
+class LineReader:
+    """Reads a file in large blocks and splits them into lines.
+
+    Each block costs a single executor round-trip, no matter how many lines it
+    contains. A partial line at the end of a block is carried over to the next one.
+    `offset` is the position in the file after the last complete line returned.
+    """
+
+    def __init__(
+        self,
+        file: AIOFile,
+        offset: int = 0,
+        chunk_size: int = 256 * 1024,
+        max_line_bytes: int = 1024 * 1024,
+    ) -> None:
+        self.file = file
+        self.offset = offset
+        self.chunk_size = chunk_size
+        self.max_line_bytes = max_line_bytes
+        self.eof = False
+        self._partial = b""
+
+    async def read_lines(self) -> list[str]:
+        """Read the next block and return all complete lines, including line breaks.
+
+        Returns an empty list if no complete line could be read, `eof` tells
+        whether the end of the file was reached.
+        """
+        read_offset = self.offset + len(self._partial)
+        block = await self.file.read_bytes(self.chunk_size, read_offset)
+        self.eof = len(block) < self.chunk_size
+        if not block:
+            return []
+
+        data = self._partial + block if self._partial else block
+        end = data.rfind(b"\n") + 1
+        if end == 0:
+            if len(data) < self.max_line_bytes:
+                self._partial = data
+                return []
+            # Line without line break is too long, split it
+            end = len(data)
+
+        self._partial = data[end:]
+        self.offset += end
+        lines = data[:end].decode("utf-8", errors="replace").split("\n")
+        if lines[-1]:
+            # The last line was split because it was too long
+            return [line + "\n" for line in lines[:-1]] + [lines[-1]]
+        return [line + "\n" for line in lines[:-1]]
+
+    def reset(self, offset: int = 0) -> None:
+        """Continue reading at `offset`, dropping any partial line."""
+        self.offset = offset
+        self.eof = False
+        self._partial = b""
@@ -0,0 +1,185 @@
+import logging
+import math
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+
+from model import TimestampConfig
+
+logger = logging.getLogger(__name__)
+
+_ISO8601 = re.compile(
+    r"(\d{4})-?(\d{2})-?(\d{2})[T ](\d{2}):?(\d{2}):?(\d{2})(?:[.,](\d+))?"
+    r"\s*(Z|[+-]\d{2}(?::?\d{2})?)?$"
+)
+_SYSLOG = re.compile(
+    r"([A-Z][a-z]{2}) {1,2}(\d{1,2}) (\d{2}):(\d{2}):(\d{2})(?:\.(\d+))?$"
+)
+_EPOCH = re.compile(r"\d+(?:\.\d+)?$")
+_MONTHS = {
+    name: number
+    for number, name in enumerate(
+        ("Jan", "Feb", "Mar", "Apr", "May", "Jun")
+        + ("Jul", "Aug", "Sep", "Oct", "Nov", "Dec"),
+        start=1,
+    )
+}
+
+
+def _microseconds(fraction: Optional[str]) -> int:
+    if not fraction:
+        return 0
+    return int(fraction[:6].ljust(6, "0"))
+
+
+def _timezone(offset: Optional[str]) -> Optional[timezone]:
+    if offset is None:
+        return None
+    if offset == "Z":
+        return timezone.utc
+    sign = -1 if offset[0] == "-" else 1
+    digits = offset[1:].replace(":", "")
+    minutes = int(digits[:2]) * 60 + int(digits[2:] or 0)
+    return timezone(sign * timedelta(minutes=minutes))
+
+
+def parse_iso8601(value: str) -> Optional[datetime]:
+    try:
+        # Implemented in C, but only supports all of ISO 8601 since Python 3.11
+        return datetime.fromisoformat(value)
+    except ValueError:
+        pass
+    if (match := _ISO8601.match(value)) is None:
+        return None
+    year, month, day, hour, minute, second, fraction, offset = match.groups()
+    try:
+        return datetime(
+            int(year),
+            int(month),
+            int(day),
+            int(hour),
+            int(minute),
+            int(second),
+            _microseconds(fraction),
+            _timezone(offset),
+        )
+    except ValueError:
+        return None
+
+
+def parse_syslog(value: str, now: Optional[datetime] = None) -> Optional[datetime]:
+    """Parse timestamps like `Oct 18 12:34:56`, which lack the year.
+
+    The current year is assumed, or the previous one if the timestamp would be
+    more than a day in the future (e.g. lines of December read in January).
+    """
+    if (match := _SYSLOG.match(value)) is None:
+        return None
+    month_name, day, hour, minute, second, fraction = match.groups()
+    if (month := _MONTHS.get(month_name)) is None:
+        return None
+    now = now or datetime.now()
+    try:
+        parsed = datetime(
+            now.year,
+            month,
+            int(day),
+            int(hour),
+            int(minute),
+            int(second),
+            _microseconds(fraction),
+        )
+        if parsed - now > timedelta(days=1):
+            parsed = parsed.replace(year=now.year - 1)
+    except ValueError:
+        # February 29th in the wrong year
+        return None
+    return parsed
+
+
+def parse_epoch(value: str) -> Optional[datetime]:
+    """Parse seconds, milliseconds, microseconds or nanoseconds since the epoch.
+
+    The unit is derived from the magnitude, so timestamps up to the year 2286
+    are supported in every unit.
+    """
+    if _EPOCH.match(value) is None:
+        return None
+    return _from_epoch(float(value))
+
+
+def _from_epoch(seconds: float) -> Optional[datetime]:
+    if not math.isfinite(seconds):
+        return None
+    while seconds >= 10**10:
+        seconds /= 1000
+    try:
+        return datetime.fromtimestamp(seconds, timezone.utc)
+    except (OverflowError, OSError, ValueError):
+        # Negative values before the year 1
+        return None
+
+
+def _strptime_parser(format: str) -> Callable[[str], Optional[datetime]]:
+    def parse(value: str) -> Optional[datetime]:
+        try:
+            return datetime.strptime(value, format)
+        except ValueError:
+            return None
+
+    return parse
+
+
+PARSERS: dict[str, Callable[[str], Optional[datetime]]] = {
+    "iso8601": parse_iso8601,
+    "epoch": parse_epoch,
+    "syslog": parse_syslog,
+}
+
+
+class TimestampParser:
+    """Parses the timestamps of one event in one log file.
+
+    With the `auto` format, the format is detected once and kept as long as the
+    timestamps match it, since all lines of a file usually share their format.
+    """
+
+    def __init__(self, config: TimestampConfig) -> None:
+        self.config = config
+        self._parse: Optional[Callable[[str], Optional[datetime]]] = None
+        if config.format in PARSERS:
+            self._parse = PARSERS[config.format]
+        elif config.format != "auto":
+            self._parse = _strptime_parser(config.format)
+
+    def parse(self, value: str) -> Optional[datetime]:
+        if self._parse is not None and (parsed := self._parse(value)) is not None:
+            return parsed
+        if self.config.format != "auto":
+            return None
+        for name, parse in PARSERS.items():
+            if (parsed := parse(value)) is not None:
+                logger.debug(f"Detected {name} timestamps, e.g. {value!r}.")
+                self._parse = parse
+                return parsed
+        return None
+
+    def apply(self, document: dict) -> None:
+        """Set the field of the config to the parsed timestamp of the document.
+
+        Numbers, e.g. of JSON groups, are taken as time since the epoch. The field
+        is not set if the timestamp cannot be parsed.
+        """
+        value = document.get(self.config.group)
+        if isinstance(value, str):
+            parsed = self.parse(value.strip()) if value else None
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            parsed = _from_epoch(value)
+        elif value is None:
+            return
+        else:
+            parsed = None
+        if parsed is None:
+            logger.debug(f"Unable to parse timestamp {value!r}.")
+            return
+        document[self.config.field] = parsed.isoformat()
@@ -0,0 +1,258 @@
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+import weakref
+from typing import Optional
+
+from model import WatcherType
+
+logger = logging.getLogger(__name__)
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = 0o0004000
+IN_CLOEXEC = 0o2000000
+
+FILE_MASK = IN_MODIFY | IN_ATTRIB | IN_MOVE_SELF | IN_DELETE_SELF
+DIR_MASK = IN_CREATE | IN_MOVED_TO
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    _libc.inotify_init1
+    _libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    _libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+except (OSError, AttributeError):
+    _libc = None
+
+
+class FileWatcher:
+    """Waits for changes of a watched file."""
+
+    def __init__(self) -> None:
+        self._changed = asyncio.Event()
+
+    async def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait until the file might have changed.
+
+        Args:
+            timeout (Optional[float]): maximum time to wait in seconds.
+
+        Returns:
+            bool: False if the timeout expired without any change, True otherwise.
+        """
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self._changed.clear()
+        return True
+
+    def wake(self) -> None:
+        """Wake up the waiting task, e.g. to stop monitoring."""
+        self._changed.set()
+
+    def close(self) -> None:
+        pass
+
+
+class PollingWatcher(FileWatcher):
+    """Fallback watcher, which assumes that the file changes every `interval` seconds."""
+
+    def __init__(self, interval: float = 0.1) -> None:
+        super().__init__()
+        self.interval = interval
+
+    async def wait(self, timeout: Optional[float] = None) -> bool:
+        interval = self.interval if timeout is None else min(timeout, self.interval)
+        if await super().wait(interval):
+            return True
+        return interval == self.interval
+
+
+class _Inotify:
+    """A single inotify instance per event loop, shared by all watchers.
+
+    The number of inotify instances per user is limited (usually to 128),
+    the number of watches is not.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self.fd = fd
+        self._watchers: dict[int, set["InotifyWatcher"]] = {}
+        loop.add_reader(fd, self._read)
+        weakref.finalize(loop, os.close, fd)
+
+    def add_watch(self, path: str, mask: int, watcher: "InotifyWatcher") -> int:
+        wd = _libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        self._watchers.setdefault(wd, set()).add(watcher)
+        return wd
+
+    def remove_watch(self, wd: int, watcher: "InotifyWatcher") -> None:
+        watchers = self._watchers.get(wd)
+        if watchers is None:
+            return
+        watchers.discard(watcher)
+        if not watchers:
+            del self._watchers[wd]
+            _libc.inotify_rm_watch(self.fd, wd)
+
+    def _read(self) -> None:
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost, every watcher has to check its file
+                for watchers in self._watchers.values():
+                    for watcher in watchers:
+                        watcher._notify(wd, mask, None)
+                continue
+            for watcher in tuple(self._watchers.get(wd, ())):
+                watcher._notify(wd, mask, name)
+            if mask & IN_IGNORED:
+                self._watchers.pop(wd, None)
+
+
+_instances: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _Inotify]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _get_inotify() -> _Inotify:
+    loop = asyncio.get_running_loop()
+    if (instance := _instances.get(loop)) is None:
+        instance = _instances[loop] = _Inotify(loop)
+    return instance
+
+
+class InotifyWatcher(FileWatcher):
+    """Watcher based on inotify. Idle files do not cause any wakeups.
+
+    Besides the file itself, its directory is watched for the file being
+    (re)created, so that rotations are noticed as well.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = os.path.abspath(path)
+        self._name = os.fsencode(os.path.basename(self.path))
+        super().__init__()
+        self._inotify = _get_inotify()
+        self._file_wd: Optional[int] = None
+        self._dir_wd = self._inotify.add_watch(
+            os.path.dirname(self.path), DIR_MASK, self
+        )
+        self.rewatch()
+
+    def rewatch(self) -> None:
+        """Watch the file currently found at the path, e.g. after a rotation."""
+        if self._file_wd is not None:
+            self._inotify.remove_watch(self._file_wd, self)
+            self._file_wd = None
+        try:
+            self._file_wd = self._inotify.add_watch(self.path, FILE_MASK, self)
+        except FileNotFoundError:
+            pass
+
+    def _notify(self, wd: int, mask: int, name: Optional[bytes]) -> None:
+        if wd == self._dir_wd and name is not None and name != self._name:
+            return
+        if wd == self._file_wd and mask & IN_IGNORED:
+            self._file_wd = None
+        self.wake()
+
+    def close(self) -> None:
+        for wd in (self._file_wd, self._dir_wd):
+            if wd is not None:
+                self._inotify.remove_watch(wd, self)
+        self._file_wd = self._dir_wd = None
+
+
+class InotifyDirectoryWatcher(FileWatcher):
+    """Watcher for files being created in or moved to any of the given directories."""
+
+    def __init__(self, directories: list[str]) -> None:
+        super().__init__()
+        self._inotify = _get_inotify()
+        self._wds = []
+        try:
+            for directory in directories:
+                try:
+                    self._wds.append(self._inotify.add_watch(directory, DIR_MASK, self))
+                except FileNotFoundError:
+                    logger.warning(f"Unable to watch missing directory {directory}.")
+        except OSError:
+            self.close()
+            raise
+
+    def _notify(self, wd: int, mask: int, name: Optional[bytes]) -> None:
+        if mask & IN_IGNORED and wd in self._wds:
+            self._wds.remove(wd)
+        self.wake()
+
+    def close(self) -> None:
+        for wd in self._wds:
+            self._inotify.remove_watch(wd, self)
+        self._wds = []
+
+
+def create_directory_watcher(
+    directories: list[str],
+    watcher_type: WatcherType = WatcherType.AUTO,
+    poll_interval: float = 5.0,
+) -> FileWatcher:
+    """Create a watcher for new files in `directories`.
+
+    Falls back to polling every `poll_interval` seconds, like `create_watcher`.
+    """
+    if watcher_type != WatcherType.POLLING and _libc is not None:
+        try:
+            return InotifyDirectoryWatcher(directories)
+        except OSError as e:
+            if watcher_type == WatcherType.INOTIFY:
+                raise
+            logger.warning(f"Unable to watch directories using inotify: {e}")
+    return PollingWatcher(poll_interval)
+
+
+def create_watcher(
+    path: str, watcher_type: WatcherType = WatcherType.AUTO, poll_interval: float = 0.1
+) -> FileWatcher:
+    """Create a watcher for the file at `path`.
+
+    With `WatcherType.AUTO`, inotify is used if available and polling otherwise.
+    """
+    if watcher_type != WatcherType.POLLING:
+        if _libc is not None:
+            try:
+                return InotifyWatcher(path)
+            except OSError as e:
+                if watcher_type == WatcherType.INOTIFY:
+                    raise
+                logger.warning(f"Unable to watch {path} using inotify: {e}")
+        elif watcher_type == WatcherType.INOTIFY:
+            raise OSError("inotify is not available on this platform")
+    return PollingWatcher(poll_interval)
@@ -0,0 +1,278 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+from multiprocessing.process import BaseProcess
+from typing import Optional
+
+from elasticsearch import AsyncElasticsearch
+
+from components.base.base_monitor import BaseMonitor
+from components.log_monitor.checkpoint import CheckpointStore
+from components.log_monitor.discovery import LogFileDiscovery, create_parse_executor
+from components.sink import codec
+from components.sink.router import SinkRouter
+from model import LogMonitorConfig, Target
+from utils import setup_logging
+
+logger = logging.getLogger(__name__)
+
+
+class _WorkerChannel:
+    """Sends the documents and checkpoint updates of a worker to the parent process.
+
+    Messages are sent in batches of up to `batch_size`, at the latest after `linger`
+    seconds. Documents are serialized in the worker, so the parent only has to
+    put them into the bulk body. If the queue to the parent is full, `put` blocks.
+    """
+
+    def __init__(
+        self, messages: multiprocessing.Queue, batch_size: int = 500, linger=0.05
+    ) -> None:
+        self.messages = messages
+        self.batch_size = batch_size
+        self.linger = linger
+        self._batch: list[tuple] = []
+        self._pending = asyncio.Event()
+        self._lock = asyncio.Lock()
+
+    async def put(self, target: Target, document: dict) -> None:
+        # The parent resolves the target from its key
+        self.send(("document", target.key, codec.dumps(document)))
+        if len(self._batch) >= self.batch_size:
+            await self.flush()
+
+    def send(self, message: tuple) -> None:
+        self._batch.append(message)
+        self._pending.set()
+
+    async def flush(self) -> None:
+        async with self._lock:
+            if not self._batch:
+                return
+            batch, self._batch = self._batch, []
+            self._pending.clear()
+            try:
+                self.messages.put_nowait(batch)
+            except queue.Full:
+                await asyncio.to_thread(self.messages.put, batch)
+
+    async def run(self) -> None:
+        while True:
+            await self._pending.wait()
+            await asyncio.sleep(self.linger)
+            await self.flush()
+
+
+class _WorkerCheckpoints(CheckpointStore):
+    """Offsets are read from the checkpoint file of the parent process. Updates
+    are forwarded to the parent, which saves them, in order with the documents."""
+
+    def __init__(self, path: str, channel: _WorkerChannel) -> None:
+        super().__init__(path)
+        self.channel = channel
+
+    def update(self, log_file_path: str, stat: os.stat_result, offset: int) -> None:
+        super().update(log_file_path, stat, offset)
+        self.channel.send(("checkpoint", log_file_path, stat, offset))
+
+    def remove(self, log_file_path: str) -> None:
+        super().remove(log_file_path)
+        self.channel.send(("remove", log_file_path))
+
+    def save(self) -> None:
+        pass
+
+
+async def _monitor_shard(
+    index: int,
+    count: int,
+    configs: list[dict],
+    checkpoint_path: Optional[str],
+    messages: multiprocessing.Queue,
+    parse_threads: int,
+) -> None:
+    channel = _WorkerChannel(messages)
+    checkpoints = None
+    if checkpoint_path is not None:
+        checkpoints = _WorkerCheckpoints(checkpoint_path, channel)
+    discovery = LogFileDiscovery(
+        [LogMonitorConfig(**config) for config in configs],
+        None,
+        channel,
+        checkpoints,
+        shard=(index, count),
+        executor=create_parse_executor(parse_threads),
+    )
+    asyncio.get_running_loop().add_signal_handler(
+        signal.SIGTERM, discovery.stop_monitoring
+    )
+    sender = asyncio.create_task(channel.run())
+    try:
+        await discovery.start_monitoring()
+    finally:
+        sender.cancel()
+        await channel.flush()
+
+
+def _run_worker(
+    index: int,
+    count: int,
+    configs: list[dict],
+    checkpoint_path: Optional[str],
+    messages: multiprocessing.Queue,
+    parse_threads: int,
+    log_level: int,
+) -> None:
+    setup_logging(log_level)
+    # Ctrl+C reaches the whole process group, only the parent decides when to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(
+        _monitor_shard(index, count, configs, checkpoint_path, messages, parse_threads)
+    )
+    messages.close()
+    messages.join_thread()
+
+
+class LogWorkerPool(BaseMonitor):
+    """Monitors the log files in `workers` processes, to use several CPU cores.
+
+    Every worker runs a LogFileDiscovery for a shard of the files, so each file is
+    monitored by exactly one worker. The parent process collects the documents of
+    all workers into its sink and saves their checkpoints. Workers which exit
+    unexpectedly are restarted and continue at the last saved checkpoint.
+
+    Changed configs are applied by `reconfigure` restarting all workers, which
+    requires checkpoints to not read the files again from their start position.
+    Workers which do not exit within `stop_timeout` seconds of being stopped are
+    killed.
+    """
+
+    def __init__(
+        self,
+        configs: list[LogMonitorConfig],
+        es: AsyncElasticsearch,
+        sink: SinkRouter,
+        checkpoints: Optional[CheckpointStore] = None,
+        workers: Optional[int] = None,
+        queue_size: int = 100,
+        restart_interval: float = 1.0,
+        parse_threads: int = 1,
+        stop_timeout: float = 5.0,
+    ) -> None:
+        super().__init__(es, sink)
+        self.configs = configs
+        self.checkpoints = checkpoints
+        self.workers = workers or os.cpu_count() or 1
+        self.restart_interval = restart_interval
+        self.parse_threads = parse_threads
+        self.stop_timeout = stop_timeout
+        self._context = multiprocessing.get_context("spawn")
+        self._messages = self._context.Queue(maxsize=queue_size)
+        self._processes: list[Optional[BaseProcess]] = [None] * self.workers
+        self._workers_done = False
+        self._replaced: set[int] = set()
+
+    async def start_monitoring(self) -> None:
+        self._workers_done = False
+        receiver = asyncio.create_task(self._receive())
+        try:
+            for index in range(self.workers):
+                await self._start_worker(index)
+            while not self.stopped:
+                try:
+                    await asyncio.wait_for(
+                        self._stopped.wait(), timeout=self.restart_interval
+                    )
+                except asyncio.TimeoutError:
+                    await self._restart_exited_workers()
+
+            for process in self._processes:
+                process.terminate()
+            for index, process in enumerate(self._processes):
+                await asyncio.to_thread(process.join, self.stop_timeout)
+                if process.is_alive():
+                    logger.error(
+                        f"Log worker {index} did not stop within "
+                        f"{self.stop_timeout}s, killing it."
+                    )
+                    process.kill()
+                    await asyncio.to_thread(process.join)
+            self._workers_done = True
+            await receiver
+        finally:
+            receiver.cancel()
+            for process in self._processes:
+                if process is not None and process.is_alive():
+                    process.kill()
+
+    def stop_monitoring(self) -> None:
+        """Stop all workers. Lines they have already read are still saved."""
+        self._stopped.set()
+
+    def reconfigure(self, configs: list[LogMonitorConfig]) -> None:
+        """Replace the configs and restart the workers with them."""
+        self.configs = configs
+        for index, process in enumerate(self._processes):
+            if process is not None and process.is_alive():
+                self._replaced.add(index)
+                # Lines which have already been read are still saved
+                process.terminate()
+
+    async def _start_worker(self, index: int) -> None:
+        if self.checkpoints is not None:
+            # Let the worker continue where its predecessor stopped, once the
+            # documents read by the predecessor have been sent
+            await self.checkpoints.save_sent()
+        process = self._context.Process(
+            target=_run_worker,
+            args=(
+                index,
+                self.workers,
+                [config.model_dump() for config in self.configs],
+                self.checkpoints.path if self.checkpoints is not None else None,
+                self._messages,
+                self.parse_threads,
+                logging.getLogger().getEffectiveLevel(),
+            ),
+            name=f"log-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        self._processes[index] = process
+        logger.info(f"Started log worker {index} (pid {process.pid}).")
+
+    async def _restart_exited_workers(self) -> None:
+        for index, process in enumerate(self._processes):
+            if not process.is_alive():
+                if index in self._replaced:
+                    self._replaced.discard(index)
+                    logger.info(f"Restarting log worker {index} with the new config.")
+                else:
+                    logger.error(
+                        f"Log worker {index} exited with {process.exitcode}, "
+                        "restarting it."
+                    )
+                await self._start_worker(index)
+
+    async def _receive(self) -> None:
+        while True:
+            try:
+                batch = await asyncio.to_thread(self._messages.get, timeout=0.1)
+            except queue.Empty:
+                if self._workers_done:
+                    return
+                continue
+            for message in batch:
+                await self._handle(message)
+
+    async def _handle(self, message: tuple) -> None:
+        kind, *args = message
+        if kind == "document":
+            await self.sink.put_serialized(*args)
+        elif kind == "checkpoint" and self.checkpoints is not None:
+            self.checkpoints.update(*args)
+        elif kind == "remove" and self.checkpoints is not None:
+            self.checkpoints.remove(*args)
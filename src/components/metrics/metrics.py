@@ -0,0 +1,246 @@
+import bisect
+import math
+import threading
+from typing import Callable, Iterator, Optional
+
+DEFAULT_BUCKETS = (
+    0.0001,
+    0.0005,
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.5,
+    1.0,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in labels.items()
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class CounterValue:
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class GaugeValue:
+    def __init__(self) -> None:
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Read the value from `function` whenever the gauge is collected."""
+        self.function = function
+
+    def get(self) -> float:
+        return self.function() if self.function is not None else self.value
+
+
+class HistogramValue:
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self) -> Iterator[tuple[float, int]]:
+        total = 0
+        for bound, count in zip((*self.buckets, math.inf), self.counts):
+            total += count
+            yield bound, total
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate a quantile, using the upper bound of the bucket it falls into."""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        for bound, total in self.cumulative_counts():
+            if total >= rank:
+                return bound if not math.isinf(bound) else self.buckets[-1]
+        return self.buckets[-1]
+
+
+class Metric:
+    """A metric with a fixed set of label names and one value per label set.
+
+    Values are created on first use with `labels` and should be kept by the
+    caller, so that updating them in hot paths is a single attribute access.
+    """
+
+    type = ""
+
+    def __init__(self, name: str, help: str, label_names: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self._values: dict[tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _new_value(self):
+        raise NotImplementedError()
+
+    def labels(self, *label_values: str):
+        assert len(label_values) == len(
+            self.label_names
+        ), f"{self.name} expects labels {self.label_names}"
+        key = tuple(str(value) for value in label_values)
+        if (value := self._values.get(key)) is None:
+            with self._lock:
+                value = self._values.setdefault(key, self._new_value())
+        return value
+
+    def remove(self, *label_values: str) -> None:
+        self._values.pop(tuple(str(value) for value in label_values), None)
+
+    def values(self) -> Iterator[tuple[dict[str, str], object]]:
+        for key, value in list(self._values.items()):
+            yield dict(zip(self.label_names, key)), value
+
+    def render(self) -> list[str]:
+        raise NotImplementedError()
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def _new_value(self) -> CounterValue:
+        return CounterValue()
+
+    def render(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(labels)} {_format_value(value.value)}"
+            for labels, value in self.values()
+        ]
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def _new_value(self) -> GaugeValue:
+        return GaugeValue()
+
+    def render(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(labels)} {_format_value(value.get())}"
+            for labels, value in self.values()
+        ]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        label_names: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, help, label_names)
+        self.buckets = buckets
+
+    def _new_value(self) -> HistogramValue:
+        return HistogramValue(self.buckets)
+
+    def render(self) -> list[str]:
+        lines = []
+        for labels, value in self.values():
+            for bound, total in value.cumulative_counts():
+                bucket_labels = _format_labels({**labels, "le": _format_value(bound)})
+                lines.append(f"{self.name}_bucket{bucket_labels} {total}")
+            lines.append(
+                f"{self.name}_sum{_format_labels(labels)} {_format_value(value.sum)}"
+            )
+            lines.append(f"{self.name}_count{_format_labels(labels)} {value.count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self.metrics: dict[str, Metric] = {}
+
+    def _register(self, metric: Metric) -> Metric:
+        existing = self.metrics.setdefault(metric.name, metric)
+        assert type(existing) is type(metric), f"{metric.name} already registered"
+        return existing
+
+    def counter(
+        self, name: str, help: str, label_names: tuple[str, ...] = ()
+    ) -> Counter:
+        return self._register(Counter(name, help, label_names))
+
+    def gauge(self, name: str, help: str, label_names: tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, help, label_names))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        label_names: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, help, label_names, buckets))
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def documents(self) -> Iterator[dict]:
+        """One document per metric and label set, e.g. to store them in Elasticsearch."""
+        for metric in self.metrics.values():
+            for labels, value in metric.values():
+                document = {"metric": metric.name, "labels": labels}
+                if isinstance(value, HistogramValue):
+                    document.update(
+                        {
+                            "count": value.count,
+                            "sum": value.sum,
+                            "p50": value.quantile(0.5),
+                            "p99": value.quantile(0.99),
+                        }
+                    )
+                elif isinstance(value, GaugeValue):
+                    document["value"] = value.get()
+                else:
+                    document["value"] = value.value
+                yield document
+
+
+REGISTRY = MetricsRegistry()
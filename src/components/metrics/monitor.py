@@ -0,0 +1,98 @@
+import asyncio
+import logging
+from typing import Optional
+
+from elasticsearch import AsyncElasticsearch
+
+from components.base.base_monitor import BaseMonitor
+from components.metrics.metrics import REGISTRY, MetricsRegistry
+from components.sink.router import SinkRouter
+from model import Target
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsServer(BaseMonitor):
+    """Serves the metrics of the agent in the Prometheus text format via HTTP."""
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        es: AsyncElasticsearch,
+        sink: Optional[SinkRouter] = None,
+        registry: MetricsRegistry = REGISTRY,
+    ) -> None:
+        super().__init__(es, sink)
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self.server: Optional[asyncio.Server] = None
+
+    async def start_monitoring(self) -> None:
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info(f"Serving metrics on {self.host}:{self.port}.")
+        try:
+            await self._stopped.wait()
+        finally:
+            self.server.close()
+            await self.server.wait_closed()
+
+    def stop_monitoring(self) -> None:
+        self._stopped.set()
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            request_line = await reader.readline()
+            # Skip the request headers
+            while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1] in ("/", "/metrics"):
+                status = "200 OK"
+                body = self.registry.render().encode()
+            else:
+                status = "404 Not Found"
+                body = b"Not Found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+class MetricsReporter(BaseMonitor):
+    """Periodically saves the metrics of the agent as documents to the targets."""
+
+    def __init__(
+        self,
+        interval: float,
+        targets: list[Target],
+        es: AsyncElasticsearch,
+        sink: Optional[SinkRouter] = None,
+        registry: MetricsRegistry = REGISTRY,
+    ) -> None:
+        super().__init__(es, sink)
+        self.interval = interval
+        self.targets = targets
+        self.registry = registry
+
+    async def start_monitoring(self) -> None:
+        while not self.stopped:
+            try:
+                await asyncio.wait_for(self._stopped.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            for document in self.registry.documents():
+                await self._save_data(document, self.targets)
+
+    def stop_monitoring(self) -> None:
+        self._stopped.set()
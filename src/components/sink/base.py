@@ -0,0 +1,46 @@
+from components.metrics.metrics import REGISTRY
+
+DOCUMENTS = REGISTRY.counter(
+    "sink_documents_total", "Documents sent or dropped by a sink.", ("sink", "result")
+)
+QUEUED = REGISTRY.gauge(
+    "sink_queued_documents", "Documents waiting in memory to be sent.", ("sink",)
+)
+SPOOLED = REGISTRY.gauge(
+    "sink_spooled_documents", "Documents waiting in the disk spool.", ("sink",)
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "sink_bulk_request_seconds", "Duration of bulk requests.", ("sink",)
+)
+
+
+class Sink:
+    """Base class of the sinks documents are sent to.
+
+    Sinks queue documents in memory and send them in the background, starting with
+    the first document. `close` sends the queued documents.
+    """
+
+    name: str
+
+    def start(self) -> None:
+        raise NotImplementedError()
+
+    async def flush(self) -> None:
+        """Wait until all queued documents have been sent."""
+        raise NotImplementedError()
+
+    async def close(self) -> None:
+        raise NotImplementedError()
+
+    async def abort(self) -> int:
+        """Stop sending at once, e.g. when `close` timed out.
+
+        Returns:
+            int: The number of queued documents which were dropped.
+        """
+        raise NotImplementedError()
+
+    @property
+    def pending(self) -> int:
+        raise NotImplementedError()
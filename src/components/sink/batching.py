@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from components.sink import codec
+from components.sink.base import DOCUMENTS, QUEUED, Sink
+
+logger = logging.getLogger(__name__)
+
+
+class BatchingSink(Sink):
+    """Base class of sinks which write documents in batches of NDJSON lines.
+
+    A background task collects the serialized documents into a batch, which is
+    written when `batch_size` documents or `max_batch_bytes` bytes are reached, or
+    `linger` seconds after its first document. Up to `max_concurrent` batches are
+    written at once. If writing is slow, the queue fills up and `put` blocks, which
+    pushes back on the monitors. Batches which can not be written are dropped.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        batch_size: int = 500,
+        max_batch_bytes: int = 5 * 1024 * 1024,
+        linger: float = 1.0,
+        queue_size: int = 10000,
+        max_concurrent: int = 1,
+    ) -> None:
+        self.name = name
+        self.batch_size = batch_size
+        self.max_batch_bytes = max_batch_bytes
+        self.linger = linger
+        self.sent = 0
+        self.failed = 0
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._batch: list[bytes] = []
+        self._batch_bytes = 0
+        self._batch_created_at = 0.0
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._writes: dict[asyncio.Task, int] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._sent_metric = DOCUMENTS.labels(name, "sent")
+        self._failed_metric = DOCUMENTS.labels(name, "failed")
+        QUEUED.labels(name).set_function(lambda: self.pending)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def put(self, document: dict) -> None:
+        """Queue a document. Blocks while the queue is full."""
+        await self.put_serialized(codec.dumps(document))
+
+    async def put_serialized(self, body: bytes) -> None:
+        """Queue a document which was already serialized with `codec.dumps`."""
+        self.start()
+        await self._queue.put(body)
+
+    async def flush(self) -> None:
+        if self._task is None:
+            return
+        flushed = asyncio.get_running_loop().create_future()
+        await self._queue.put(flushed)
+        await flushed
+
+    async def close(self) -> None:
+        await self.flush()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._close()
+
+    async def abort(self) -> int:
+        dropped = len(self._batch) + sum(self._writes.values())
+        tasks = [task for task in (self._task, *self._writes) if task is not None]
+        if not tasks:
+            return 0
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if isinstance(item, asyncio.Future):
+                item.cancel()
+            else:
+                dropped += 1
+        self._batch, self._batch_bytes = [], 0
+        self.failed += dropped
+        self._failed_metric.inc(dropped)
+        await self._close()
+        return dropped
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize() + len(self._batch) + sum(self._writes.values())
+
+    async def _run(self) -> None:
+        while True:
+            timeout = None
+            if self._batch:
+                timeout = max(
+                    0.0, self._batch_created_at + self.linger - time.monotonic()
+                )
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                await self._write_batch()
+                continue
+
+            if isinstance(item, asyncio.Future):
+                await self._write_batch()
+                if self._writes:
+                    await asyncio.wait(list(self._writes))
+                if not item.done():
+                    item.set_result(None)
+                continue
+
+            if not self._batch:
+                self._batch_created_at = time.monotonic()
+            self._batch.append(item)
+            self._batch_bytes += len(item) + 1
+            if (
+                len(self._batch) >= self.batch_size
+                or self._batch_bytes >= self.max_batch_bytes
+            ):
+                await self._write_batch()
+
+    async def _write_batch(self) -> None:
+        if not self._batch:
+            return
+        # Waits while `max_concurrent` batches are being written
+        await self._slots.acquire()
+        batch, self._batch, self._batch_bytes = self._batch, [], 0
+        task = asyncio.create_task(self._write_safely(batch))
+        self._writes[task] = len(batch)
+        task.add_done_callback(self._writes.pop)
+
+    async def _write_safely(self, batch: list[bytes]) -> None:
+        try:
+            await self._write(b"".join(body + b"\n" for body in batch))
+        except Exception:
+            self.failed += len(batch)
+            self._failed_metric.inc(len(batch))
+            logger.exception(f"Unable to write {len(batch)} documents to {self.name}.")
+        else:
+            self.sent += len(batch)
+            self._sent_metric.inc(len(batch))
+        finally:
+            self._slots.release()
+
+    async def _write(self, data: bytes) -> None:
+        """Write a batch of NDJSON lines."""
+        raise NotImplementedError()
+
+    async def _close(self) -> None:
+        pass
@@ -0,0 +1,401 @@
+import asyncio
+import logging
+import sys
+import time
+from typing import Callable, Optional, TypeVar, Union
+
+from elastic_transport import TransportError
+from elasticsearch import AsyncElasticsearch
+from elasticsearch.helpers import async_streaming_bulk
+
+from components.sink import codec
+from components.sink.base import DOCUMENTS, QUEUED, REQUEST_SECONDS, SPOOLED, Sink
+from components.sink.spool import DiskSpool
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def _body(document: Union[dict, bytes]) -> bytes:
+    # Serialized once, the client passes bytes through into the bulk body
+    return document if isinstance(document, bytes) else codec.dumps(document)
+
+
+def _expand_action(action: tuple[dict, bytes]) -> tuple[dict, bytes]:
+    return action
+
+
+class _IndexBatch:
+    def __init__(self) -> None:
+        self.actions: list[tuple[dict, bytes]] = []
+        self.size = 0
+        self.created_at = time.monotonic()
+
+
+class ElasticsearchBulkSink(Sink):
+    """Shared sink which batches documents per index and sends them using the bulk API.
+
+    Documents are put into a bounded queue. A background task collects them into
+    per-index batches, which are flushed when `chunk_size` documents or
+    `max_chunk_bytes` bytes are reached, or when the oldest document is older than
+    `linger` seconds. If the cluster is slow, the queue fills up and `put` blocks,
+    which pushes back on the monitors. Up to `max_concurrent` bulk requests are
+    sent at once, so the next batch does not wait for the response to the last one.
+
+    With a `spool`, documents which can not be sent because the cluster is
+    unavailable, or which do not fit into the full queue, are written to disk
+    instead. They are sent again in order once the cluster recovers. As long as
+    the spool is not empty, new documents are appended to it to keep their order.
+    The spool is written and read in a thread, one operation at a time, so the
+    event loop is not blocked while documents are diverted to the disk.
+    """
+
+    # Statuses of documents (or whole requests) which are retried
+    RETRY_STATUS = (429, 502, 503, 504)
+
+    def __init__(
+        self,
+        es: AsyncElasticsearch,
+        chunk_size: int = 500,
+        max_chunk_bytes: int = 5 * 1024 * 1024,
+        linger: float = 1.0,
+        queue_size: int = 10000,
+        max_retries: int = 3,
+        initial_backoff: float = 1.0,
+        spool: Optional[DiskSpool] = None,
+        retry_interval: float = 5.0,
+        name: str = "elasticsearch",
+        max_concurrent: int = 1,
+        close_client: bool = False,
+    ) -> None:
+        self.es = es
+        self.name = name
+        self.close_client = close_client
+        self.chunk_size = chunk_size
+        self.max_chunk_bytes = max_chunk_bytes
+        self.linger = linger
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.spool = spool
+        self.retry_interval = retry_interval
+        self.indexed = 0
+        self.failed = 0
+        self.spooled = 0
+        self._available = True
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._batches: dict[str, _IndexBatch] = {}
+        self._slots = asyncio.Semaphore(max_concurrent)
+        # Documents of the bulk requests in flight
+        self._sends: dict[asyncio.Task, list[tuple[dict, bytes]]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._replay_task: Optional[asyncio.Task] = None
+        self._spool_changed = asyncio.Event()
+        self._spool_lock = asyncio.Lock()
+        self._indexed_metric = DOCUMENTS.labels(name, "indexed")
+        self._failed_metric = DOCUMENTS.labels(name, "failed")
+        self._request_seconds = REQUEST_SECONDS.labels(name)
+        QUEUED.labels(name).set_function(lambda: self.pending)
+        SPOOLED.labels(name).set_function(lambda: self.spooled)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        if self.spool is not None and (
+            self._replay_task is None or self._replay_task.done()
+        ):
+            self._replay_task = asyncio.create_task(self._replay())
+
+    async def put(self, index: str, document: dict) -> None:
+        """Queue a document for indexing. Blocks while the queue is full."""
+        await self._put(index, document)
+
+    async def put_serialized(self, index: str, body: bytes) -> None:
+        """Queue a document which was already serialized with `codec.dumps`."""
+        await self._put(index, body)
+
+    async def _put(self, index: str, document: Union[dict, bytes]) -> None:
+        self.start()
+        if self.spool is not None and self._queue.full():
+            await self._spool([({"index": {"_index": index}}, _body(document))])
+            return
+        await self._queue.put((index, document))
+
+    async def flush(self) -> None:
+        """Wait until all queued documents have been sent."""
+        if self._task is None:
+            return
+        flushed = asyncio.get_running_loop().create_future()
+        await self._queue.put(flushed)
+        await flushed
+
+    async def close(self) -> None:
+        await self.flush()
+        for task in (self._task, self._replay_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._replay_task = None
+        if self.spool is not None:
+            await self._spool_io(self.spool.close)
+        if self.close_client:
+            await self.es.close()
+
+    async def abort(self) -> int:
+        """Stop sending at once. Documents which have not been sent, including
+        those of requests in flight, are written to the spool if there is one.
+
+        Returns:
+            int: The number of documents dropped.
+        """
+        tasks = [
+            task
+            for task in (self._task, self._replay_task, *self._sends)
+            if task is not None
+        ]
+        if not tasks:
+            # Closed already, or nothing was ever sent
+            return 0
+        actions = [action for sent in self._sends.values() for action in sent]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = self._replay_task = None
+        for batch in self._batches.values():
+            actions.extend(batch.actions)
+        self._batches.clear()
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if isinstance(item, asyncio.Future):
+                item.cancel()
+                continue
+            index, document = item
+            actions.append(({"index": {"_index": index}}, _body(document)))
+
+        dropped = 0
+        if self.spool is not None:
+            if actions:
+                await self._spool(actions)
+            await self._spool_io(self.spool.close)
+        else:
+            dropped = len(actions)
+            self._add_failed(dropped)
+        if self.close_client:
+            await self.es.close()
+        return dropped
+
+    @property
+    def pending(self) -> int:
+        return (
+            self._queue.qsize()
+            + sum(len(batch.actions) for batch in self._batches.values())
+            + sum(len(actions) for actions in self._sends.values())
+        )
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                item = await asyncio.wait_for(self._queue.get(), self._next_timeout())
+            except asyncio.TimeoutError:
+                await self._flush_expired()
+                continue
+
+            if isinstance(item, asyncio.Future):
+                await self._flush_all()
+                if self._sends:
+                    await asyncio.wait(list(self._sends))
+                self._queue.task_done()
+                if not item.done():
+                    item.set_result(None)
+                continue
+
+            index, document = item
+            try:
+                self._add(index, document)
+            except Exception:
+                self._add_failed(1)
+                logger.exception(f"Unable to serialize document for index {index}.")
+            finally:
+                self._queue.task_done()
+
+            batch = self._batches.get(index)
+            if batch is not None and (
+                len(batch.actions) >= self.chunk_size
+                or batch.size >= self.max_chunk_bytes
+            ):
+                await self._flush_index(index)
+            await self._flush_expired()
+
+    def _add(self, index: str, document: Union[dict, bytes]) -> None:
+        body = _body(document)
+        batch = self._batches.get(index)
+        if batch is None:
+            batch = self._batches[index] = _IndexBatch()
+        batch.actions.append(({"index": {"_index": index}}, body))
+        batch.size += len(body) + 1
+
+    def _next_timeout(self) -> Optional[float]:
+        if not self._batches:
+            return None
+        oldest = min(batch.created_at for batch in self._batches.values())
+        return max(0.0, oldest + self.linger - time.monotonic())
+
+    async def _flush_expired(self) -> None:
+        now = time.monotonic()
+        for index, batch in list(self._batches.items()):
+            if now - batch.created_at >= self.linger:
+                await self._flush_index(index)
+
+    async def _flush_all(self) -> None:
+        for index in list(self._batches):
+            await self._flush_index(index)
+
+    async def _flush_index(self, index: str) -> None:
+        if index not in self._batches:
+            return
+        # Waits while `max_concurrent` requests are in flight, a failed one may
+        # have made the cluster unavailable meanwhile
+        await self._slots.acquire()
+        batch = self._batches.pop(index)
+        if self.spool is not None and (
+            not self._available or not await self._spool_empty()
+        ):
+            self._slots.release()
+            await self._spool(batch.actions)
+            return
+        task = asyncio.create_task(self._deliver(batch.actions))
+        self._sends[task] = batch.actions
+        task.add_done_callback(self._sends.pop)
+
+    async def _deliver(self, actions: list[tuple[dict, bytes]]) -> None:
+        try:
+            undelivered = await self._send(actions)
+        finally:
+            self._slots.release()
+        if not undelivered:
+            return
+        if self.spool is None:
+            self._add_failed(len(undelivered))
+            logger.error(f"Dropped {len(undelivered)} documents which were not sent.")
+        else:
+            self._available = False
+            await self._spool(undelivered)
+
+    def _add_failed(self, count: int) -> None:
+        self.failed += count
+        self._failed_metric.inc(count)
+
+    async def _spool_io(self, function: Callable[..., T], *args) -> T:
+        """Run an operation on the spool in a thread, after the previous ones. The
+        operation is completed even if the caller is cancelled."""
+        async with self._spool_lock:
+            future = asyncio.ensure_future(asyncio.to_thread(function, *args))
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                await asyncio.wait([future])
+                raise
+
+    async def _spool_empty(self) -> bool:
+        # Kept in memory, but changed by the operations running in a thread
+        async with self._spool_lock:
+            return self.spool.empty
+
+    async def _spool(self, actions: list[tuple[dict, bytes]]) -> None:
+        dropped = await self._spool_io(
+            self.spool.append,
+            [(header["index"]["_index"], body) for header, body in actions],
+        )
+        # Documents spooled before a restart are not counted
+        self.spooled = max(0, self.spooled + len(actions) - dropped)
+        if dropped:
+            self._add_failed(dropped)
+        self._spool_changed.set()
+
+    async def _replay(self) -> None:
+        """Send spooled documents in order, once the cluster is available."""
+        while True:
+            entries, position = await self._spool_io(
+                self.spool.read, self.chunk_size, self.max_chunk_bytes
+            )
+            if not entries:
+                # Empty, or nothing but an incomplete entry is left
+                self._available = True
+                self._spool_changed.clear()
+                await self._spool_changed.wait()
+                continue
+            actions = [({"index": {"_index": index}}, body) for index, body in entries]
+            undelivered = await self._send(actions)
+            if len(undelivered) == len(actions):
+                self._available = False
+                await asyncio.sleep(self.retry_interval)
+                continue
+            await self._spool_io(self.spool.commit, position)
+            self.spooled -= len(actions)
+            if undelivered:
+                # Retry documents which were rejected, without sending the others twice
+                await self._spool(undelivered)
+
+    async def _send(
+        self, actions: list[tuple[dict, bytes]]
+    ) -> list[tuple[dict, bytes]]:
+        """Send the documents in one bulk request.
+
+        Documents rejected with one of RETRY_STATUS are retried with exponential
+        backoff, other rejected documents are logged and dropped.
+
+        Returns:
+            list[tuple[dict, bytes]]: the documents which could not be sent because
+            the cluster is unavailable or overloaded.
+        """
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(self.initial_backoff * 2 ** (attempt - 1))
+            start = time.perf_counter()
+            try:
+                # A single chunk without retries, so results are in order of actions
+                results = [
+                    result
+                    async for result in async_streaming_bulk(
+                        self.es,
+                        actions,
+                        chunk_size=len(actions),
+                        max_chunk_bytes=sys.maxsize,
+                        expand_action_callback=_expand_action,
+                        raise_on_error=False,
+                        raise_on_exception=False,
+                    )
+                ]
+            except TransportError as e:
+                logger.warning(
+                    f"Bulk request with {len(actions)} documents failed: {e}"
+                )
+                return actions
+            except Exception:
+                self._add_failed(len(actions))
+                logger.exception(f"Bulk request with {len(actions)} documents failed.")
+                return []
+            finally:
+                self._request_seconds.observe(time.perf_counter() - start)
+
+            retry = []
+            indexed = 0
+            for action, (ok, info) in zip(actions, results):
+                if ok:
+                    indexed += 1
+                    continue
+                status = next(iter(info.values())).get("status")
+                if status in self.RETRY_STATUS:
+                    retry.append(action)
+                else:
+                    self._add_failed(1)
+                    logger.error(f"Failed to index document: {info}")
+            self.indexed += indexed
+            self._indexed_metric.inc(indexed)
+            if not retry:
+                return []
+            actions = retry
+        return actions
@@ -0,0 +1,156 @@
+import json
+import logging
+from datetime import date, datetime
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover
+    msgspec = None
+
+logger = logging.getLogger(__name__)
+
+# Integers which might not fit into 64 bit are decoded as float by the fast
+# libraries. Digits are mapped to 1 and everything else to 0, to find runs of
+# digits a lot faster than a regex could. Digits within strings are found as
+# well, such documents are just decoded slower.
+_DIGITS = bytes(ord("1") if ord("0") <= i <= ord("9") else ord("0") for i in range(256))
+_LONG_DIGITS = b"1" * 19
+
+
+def _has_long_digits(data: bytes) -> bool:
+    return _LONG_DIGITS in data.translate(_DIGITS)
+
+
+# The fast libraries write floats beyond 1e16 as `1e16` instead of `1e+16`, and
+# floats below 1e-4 as `0.00001` instead of `1e-05`. Such documents are encoded
+# by the standard library instead, again with false positives within strings.
+_NUMBER_DIGITS = bytes(ord("1") if ord("0") <= i <= ord("9") else i for i in range(256))
+
+
+def _has_exponent_floats(data: bytes) -> bool:
+    digits = data.translate(_NUMBER_DIGITS)
+    return b"1e1" in digits or b"1e-" in digits or b"0.0000" in data
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Unable to serialize {value!r} (type: {type(value)})")
+
+
+class JsonCodec:
+    """Encodes documents and decodes json using the json module of the standard library.
+
+    Documents are encoded like the serializer of the elasticsearch client does,
+    compact and without escaping non-ASCII characters, and with dates in ISO 8601.
+    """
+
+    name = "json"
+
+    def dumps(self, document: Any) -> bytes:
+        return json.dumps(
+            document, default=_default, ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8", "surrogatepass")
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        return json.loads(data)
+
+
+class OrjsonCodec(JsonCodec):
+    """Codec using orjson.
+
+    Values orjson does not support, like integers beyond 64 bit or NaN, and
+    floats it writes in another notation are handled by the standard library
+    instead, so the results do not change.
+    """
+
+    name = "orjson"
+
+    def dumps(self, document: Any) -> bytes:
+        try:
+            data = orjson.dumps(
+                document, default=_default, option=orjson.OPT_NON_STR_KEYS
+            )
+        except orjson.JSONEncodeError:
+            return super().dumps(document)
+        if _has_exponent_floats(data):
+            return super().dumps(document)
+        return data
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        encoded = (
+            data.encode("utf-8", "surrogatepass") if isinstance(data, str) else data
+        )
+        if _has_long_digits(encoded):
+            return super().loads(data)
+        try:
+            return orjson.loads(encoded)
+        except orjson.JSONDecodeError:
+            return super().loads(data)
+
+
+class MsgspecCodec(JsonCodec):
+    """Codec using msgspec, with the same fallback as OrjsonCodec."""
+
+    name = "msgspec"
+
+    def __init__(self) -> None:
+        self._encoder = msgspec.json.Encoder(enc_hook=_default)
+        self._decoder = msgspec.json.Decoder()
+
+    def dumps(self, document: Any) -> bytes:
+        try:
+            data = self._encoder.encode(document)
+        except (msgspec.EncodeError, TypeError, OverflowError):
+            return super().dumps(document)
+        if _has_exponent_floats(data):
+            return super().dumps(document)
+        return data
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        encoded = (
+            data.encode("utf-8", "surrogatepass") if isinstance(data, str) else data
+        )
+        if _has_long_digits(encoded):
+            return super().loads(data)
+        try:
+            return self._decoder.decode(encoded)
+        except msgspec.DecodeError:
+            return super().loads(data)
+
+
+def _create_codec() -> JsonCodec:
+    if orjson is not None:
+        return OrjsonCodec()
+    if msgspec is not None:
+        return MsgspecCodec()
+    return JsonCodec()
+
+
+_codec = _create_codec()
+
+
+def get_codec() -> JsonCodec:
+    return _codec
+
+
+def set_codec(codec: JsonCodec) -> None:
+    """Replace the codec, which by default is the fastest one installed."""
+    global _codec
+    logger.debug(f"Using {codec.name} to encode and decode json.")
+    _codec = codec
+
+
+def dumps(document: Any) -> bytes:
+    """Serialize a document for the bulk API."""
+    return _codec.dumps(document)
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    return _codec.loads(data)
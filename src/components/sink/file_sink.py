@@ -0,0 +1,92 @@
+import asyncio
+import gzip
+import logging
+import os
+import shutil
+import sys
+from typing import BinaryIO, Optional
+
+from components.sink.batching import BatchingSink
+
+logger = logging.getLogger(__name__)
+
+
+class FileSink(BatchingSink):
+    """Appends the documents as NDJSON lines to the file at `path`.
+
+    Before the file grows beyond `max_bytes`, it is renamed to `path.1`, or
+    compressed to `path.1.gz` with `compress`, and a new file is started. Older
+    files are renamed to `path.2` and so on, and only `backups` of them are kept.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 100 * 1024 * 1024,
+        backups: int = 5,
+        compress: bool = False,
+        **kwargs,
+    ) -> None:
+        # Batches are appended in order
+        super().__init__(f"file:{path}", max_concurrent=1, **kwargs)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.compress = compress
+        self._file: Optional[BinaryIO] = None
+
+    async def _write(self, data: bytes) -> None:
+        # Writing and compressing rotated files blocks the event loop otherwise
+        await asyncio.to_thread(self._append, data)
+
+    def _append(self, data: bytes) -> None:
+        if self._file is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._file = open(self.path, "ab")
+        size = self._file.tell()
+        if self.max_bytes and size and size + len(data) > self.max_bytes:
+            self._rotate()
+        self._file.write(data)
+        self._file.flush()
+
+    def _backup(self, index: int) -> str:
+        return f"{self.path}.{index}.gz" if self.compress else f"{self.path}.{index}"
+
+    def _rotate(self) -> None:
+        self._file.close()
+        for index in range(self.backups - 1, 0, -1):
+            if os.path.exists(self._backup(index)):
+                os.replace(self._backup(index), self._backup(index + 1))
+        if not self.backups:
+            os.unlink(self.path)
+        elif self.compress:
+            with open(self.path, "rb") as source:
+                with gzip.open(self._backup(1), "wb") as target:
+                    shutil.copyfileobj(source, target)
+            os.unlink(self.path)
+        else:
+            os.replace(self.path, self._backup(1))
+        logger.info(f"Rotated {self.path}.")
+        self._file = open(self.path, "ab")
+
+    async def _close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class StdoutSink(BatchingSink):
+    """Writes the documents as NDJSON lines to stdout, e.g. to be collected by the
+    container runtime. Log messages are written to stderr."""
+
+    def __init__(self, stream: Optional[BinaryIO] = None, **kwargs) -> None:
+        super().__init__("stdout", max_concurrent=1, **kwargs)
+        self.stream = stream or sys.stdout.buffer
+
+    async def _write(self, data: bytes) -> None:
+        # Blocks while the reader of a pipe does not keep up
+        await asyncio.to_thread(self._write_all, data)
+
+    def _write_all(self, data: bytes) -> None:
+        self.stream.write(data)
+        self.stream.flush()
@@ -0,0 +1,75 @@
+import asyncio
+import gzip
+import logging
+import time
+from typing import Optional
+
+import aiohttp
+
+from components.sink.base import REQUEST_SECONDS
+from components.sink.batching import BatchingSink
+
+logger = logging.getLogger(__name__)
+
+
+class HttpSink(BatchingSink):
+    """Posts batches of documents as NDJSON to `url`, e.g. to Vector, Fluent Bit
+    or Logstash.
+
+    Requests which fail to connect, time out after `timeout` seconds or are
+    answered with one of RETRY_STATUS are retried with exponential backoff, at
+    most `max_retries` times. The body is compressed using gzip with `compress`.
+    """
+
+    RETRY_STATUS = (429, 502, 503, 504)
+
+    def __init__(
+        self,
+        url: str,
+        headers: Optional[dict[str, str]] = None,
+        compress: bool = False,
+        timeout: float = 10.0,
+        max_retries: int = 3,
+        initial_backoff: float = 1.0,
+        **kwargs,
+    ) -> None:
+        super().__init__(f"http:{url}", **kwargs)
+        self.url = url
+        self.headers = {"Content-Type": "application/x-ndjson", **(headers or {})}
+        if compress:
+            self.headers["Content-Encoding"] = "gzip"
+        self.compress = compress
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._request_seconds = REQUEST_SECONDS.labels(self.name)
+
+    async def _write(self, data: bytes) -> None:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                headers=self.headers, timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        if self.compress:
+            data = await asyncio.to_thread(gzip.compress, data)
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(self.initial_backoff * 2 ** (attempt - 1))
+            start = time.perf_counter()
+            try:
+                async with self._session.post(self.url, data=data) as response:
+                    if response.status not in self.RETRY_STATUS:
+                        response.raise_for_status()
+                        return
+                    error = f"status {response.status}"
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                error = str(e) or type(e).__name__
+            finally:
+                self._request_seconds.observe(time.perf_counter() - start)
+            logger.warning(f"Request to {self.url} failed: {error}")
+        raise ConnectionError(f"Request to {self.url} failed {attempt + 1} times.")
+
+    async def _close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -0,0 +1,138 @@
+import asyncio
+import json
+import logging
+from functools import partial
+from typing import Awaitable, Callable, NamedTuple, Optional
+
+from pydantic import BaseModel
+
+from components.sink.base import Sink
+from components.sink.bulk_sink import ElasticsearchBulkSink
+from components.sink.file_sink import FileSink, StdoutSink
+from components.sink.http_sink import HttpSink
+from model import ElasticsearchTargetConfig, Target, TargetType
+
+logger = logging.getLogger(__name__)
+
+# Creates the sink of a target type from the settings of a target
+SINK_FACTORIES: dict[TargetType, Callable[[BaseModel], Sink]] = {
+    TargetType.FILE: lambda settings: FileSink(**settings.model_dump()),
+    TargetType.STDOUT: lambda settings: StdoutSink(**settings.model_dump()),
+    TargetType.HTTP: lambda settings: HttpSink(**settings.model_dump()),
+}
+
+
+def register_sink(
+    target_type: TargetType, factory: Callable[[BaseModel], Sink]
+) -> None:
+    """Use `factory` to create the sinks of `target_type`."""
+    SINK_FACTORIES[target_type] = factory
+
+
+class _Route(NamedTuple):
+    put: Callable[[dict], Awaitable[None]]
+    put_serialized: Callable[[bytes], Awaitable[None]]
+
+
+class SinkRouter:
+    """Sends documents to the sinks of their targets.
+
+    Each target is resolved to a sink once, when it is first used or passed to
+    `resolve`. Documents for Elasticsearch targets without further settings than
+    their index are sent by `elasticsearch`. Sinks of the other targets are created
+    by SINK_FACTORIES, or by `factories`, which has to create the sinks of
+    Elasticsearch targets with client settings. Targets with the same settings
+    share one sink, as do file targets with the same path.
+    """
+
+    def __init__(
+        self,
+        elasticsearch: Optional[ElasticsearchBulkSink] = None,
+        factories: Optional[dict[TargetType, Callable[[BaseModel], Sink]]] = None,
+    ) -> None:
+        self.elasticsearch = elasticsearch
+        self.factories = {**SINK_FACTORIES, **(factories or {})}
+        self.sinks: dict[str, Sink] = {}
+        # By `Target.key`
+        self._routes: dict[str, _Route] = {}
+
+    def start(self) -> None:
+        for sink in self._all():
+            sink.start()
+
+    async def put(self, target: Target, document: dict) -> None:
+        """Queue a document for `target`. Blocks while the queue of its sink is full."""
+        route = self._routes.get(target.key) or self.resolve(target)
+        await route.put(document)
+
+    async def put_serialized(self, target_key: str, body: bytes) -> None:
+        """Queue a document which was already serialized with `codec.dumps` for the
+        target with `target_key`."""
+        route = self._routes.get(target_key)
+        if route is None:
+            route = self.resolve(Target.model_validate_json(target_key))
+        await route.put_serialized(body)
+
+    def resolve(self, target: Target) -> _Route:
+        route = self._routes.get(target.key)
+        if route is None:
+            route = self._routes[target.key] = self._route(target)
+        return route
+
+    def _route(self, target: Target) -> _Route:
+        settings = target.settings
+        if target.type == TargetType.ELASTICSEARCH:
+            sink = self._elasticsearch(settings)
+            return _Route(
+                partial(sink.put, settings.index),
+                partial(sink.put_serialized, settings.index),
+            )
+        if target.type == TargetType.FILE:
+            key = f"file:{settings.path}"
+        else:
+            key = f"{target.type.value}:{settings.model_dump_json()}"
+        sink = self._sink(key, target.type, settings)
+        return _Route(sink.put, sink.put_serialized)
+
+    def _elasticsearch(self, settings: ElasticsearchTargetConfig) -> Sink:
+        if not (sink_settings := settings.sink_settings):
+            if self.elasticsearch is None:
+                raise ValueError("No Elasticsearch sink to send documents to.")
+            return self.elasticsearch
+        if TargetType.ELASTICSEARCH not in self.factories:
+            raise ValueError(f"Unable to create an Elasticsearch sink for {settings}.")
+        # Shared by the targets with the same settings, regardless of their index
+        key = f"elasticsearch:{json.dumps(sink_settings, sort_keys=True)}"
+        return self._sink(key, TargetType.ELASTICSEARCH, settings)
+
+    def _sink(self, key: str, target_type: TargetType, settings: BaseModel) -> Sink:
+        sink = self.sinks.get(key)
+        if sink is None:
+            sink = self.sinks[key] = self.factories[target_type](settings)
+            logger.info(f"Created the sink {sink.name}.")
+        return sink
+
+    async def flush(self) -> None:
+        await asyncio.gather(*(sink.flush() for sink in self._all()))
+
+    async def close(self) -> None:
+        """Send the queued documents of all sinks and close them."""
+        await asyncio.gather(*(sink.close() for sink in self._all()))
+
+    async def abort(self) -> int:
+        """Stop all sinks at once, see `Sink.abort`.
+
+        Returns:
+            int: The number of queued documents which were dropped.
+        """
+        return sum(await asyncio.gather(*(sink.abort() for sink in self._all())))
+
+    @property
+    def pending(self) -> int:
+        return sum(sink.pending for sink in self._all())
+
+    def _all(self) -> list[Sink]:
+        sinks = list(self.sinks.values())
+        if self.elasticsearch is not None:
+            sinks.insert(0, self.elasticsearch)
+        return sinks
@@ -0,0 +1,212 @@
+import json
+import logging
+import os
+from typing import BinaryIO, Optional
+
+from utils import write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+_SEGMENT_PREFIX = "segment-"
+_SEGMENT_SUFFIX = ".ndjson"
+_POSITION_FILE = "position.json"
+
+# (segment number, byte offset in the segment)
+SpoolPosition = tuple[int, int]
+
+
+class DiskSpool:
+    """Append-only write-ahead spool for documents which could not be sent yet.
+
+    Documents are appended to segment files of up to `segment_bytes` bytes in
+    `directory`. Each line holds the target index followed by the serialized
+    document. The read position is saved with `commit` once documents have been
+    sent, fully consumed segments are deleted. If the spool grows beyond
+    `max_bytes`, the oldest segments are dropped.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = 16 * 1024 * 1024,
+        max_bytes: int = 1024 * 1024 * 1024,
+    ) -> None:
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._segments: dict[int, int] = {
+            segment: os.path.getsize(self._segment_path(segment))
+            for segment in self._list_segments()
+        }
+        if self._segments:
+            self._truncate_incomplete_line(max(self._segments))
+        self._position = self._load_position()
+        self._writer: Optional[BinaryIO] = None
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(
+            self.directory, f"{_SEGMENT_PREFIX}{segment:010d}{_SEGMENT_SUFFIX}"
+        )
+
+    def _list_segments(self) -> list[int]:
+        segments = []
+        for name in os.listdir(self.directory):
+            if name.startswith(_SEGMENT_PREFIX) and name.endswith(_SEGMENT_SUFFIX):
+                segments.append(int(name[len(_SEGMENT_PREFIX) : -len(_SEGMENT_SUFFIX)]))
+        return sorted(segments)
+
+    def _truncate_incomplete_line(self, segment: int) -> None:
+        """Drop the incomplete last line of a segment, e.g. after a crash while
+        appending to it. New lines would be appended to it otherwise."""
+        size = end = self._segments[segment]
+        with open(self._segment_path(segment), "rb+") as file:
+            while end > 0:
+                start = max(0, end - 64 * 1024)
+                file.seek(start)
+                newline = file.read(end - start).rfind(b"\n")
+                if newline >= 0:
+                    end = start + newline + 1
+                    break
+                end = start
+            if end < size:
+                logger.warning(
+                    f"Dropping {size - end} bytes of an incomplete entry at the end "
+                    f"of segment {segment}."
+                )
+                file.truncate(end)
+                self._segments[segment] = end
+
+    def _load_position(self) -> SpoolPosition:
+        first = min(self._segments, default=0)
+        try:
+            with open(os.path.join(self.directory, _POSITION_FILE), "r") as file:
+                segment, offset = json.load(file)
+        except FileNotFoundError:
+            return first, 0
+        if segment < first:
+            return first, 0
+        return segment, offset
+
+    @property
+    def size(self) -> int:
+        """Number of bytes in the spool which have not been consumed yet."""
+        return sum(self._segments.values()) - (
+            self._position[1] if self._position[0] in self._segments else 0
+        )
+
+    @property
+    def empty(self) -> bool:
+        if not self._segments:
+            return True
+        last = max(self._segments)
+        return self._position >= (last, self._segments[last])
+
+    def append(self, entries: list[tuple[str, bytes]]) -> int:
+        """Append serialized documents, given as (index, document) tuples.
+
+        Returns:
+            int: The number of unsent entries dropped to stay within `max_bytes`.
+        """
+        for index, document in entries:
+            line = b"%s %s\n" % (json.dumps(index).encode(), document)
+            writer = self._get_writer(len(line))
+            writer.write(line)
+            self._segments[max(self._segments)] += len(line)
+        if self._writer is not None:
+            self._writer.flush()
+        return self._enforce_max_bytes()
+
+    def _get_writer(self, length: int) -> BinaryIO:
+        last = max(self._segments, default=None)
+        if (
+            last is None
+            or self._segments[last] > 0
+            and self._segments[last] + length > self.segment_bytes
+        ):
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            last = 0 if last is None else last + 1
+            self._segments[last] = 0
+        if self._writer is None:
+            self._writer = open(self._segment_path(last), "ab")
+        return self._writer
+
+    def _enforce_max_bytes(self) -> int:
+        dropped = 0
+        while self.size > self.max_bytes and len(self._segments) > 1:
+            oldest = min(self._segments)
+            logger.error(
+                f"Spool exceeds {self.max_bytes} bytes, dropping segment {oldest}."
+            )
+            dropped += self._count_unsent(oldest)
+            self._remove_segment(oldest)
+            if self._position[0] <= oldest:
+                self._position = (min(self._segments), 0)
+        return dropped
+
+    def _count_unsent(self, segment: int) -> int:
+        if self._position[0] > segment:
+            return 0
+        offset = self._position[1] if self._position[0] == segment else 0
+        with open(self._segment_path(segment), "rb") as file:
+            file.seek(offset)
+            return sum(
+                block.count(b"\n") for block in iter(lambda: file.read(1 << 16), b"")
+            )
+
+    def _remove_segment(self, segment: int) -> None:
+        del self._segments[segment]
+        try:
+            os.unlink(self._segment_path(segment))
+        except FileNotFoundError:
+            pass
+
+    def read(
+        self, max_entries: int, max_bytes: Optional[int] = None
+    ) -> tuple[list[tuple[str, bytes]], SpoolPosition]:
+        """Read the oldest entries, without consuming them.
+
+        Returns:
+            tuple[list[tuple[str, bytes]], SpoolPosition]: The (index, document)
+            entries and the position to `commit` once they have been sent.
+        """
+        entries: list[tuple[str, bytes]] = []
+        size = 0
+        segment, offset = self._position
+        decoder = json.JSONDecoder()
+        for segment in sorted(s for s in self._segments if s >= self._position[0]):
+            if segment != self._position[0]:
+                offset = 0
+            if offset >= self._segments[segment]:
+                continue
+            with open(self._segment_path(segment), "rb") as file:
+                file.seek(offset)
+                for raw_line in file:
+                    if not raw_line.endswith(b"\n"):
+                        break
+                    # The index is json, which is ASCII only
+                    index, end = decoder.raw_decode(raw_line.decode("ascii", "replace"))
+                    entries.append((index, raw_line[end + 1 : -1]))
+                    offset += len(raw_line)
+                    size += len(raw_line)
+                    if len(entries) >= max_entries or (
+                        max_bytes is not None and size >= max_bytes
+                    ):
+                        return entries, (segment, offset)
+        return entries, (segment, offset)
+
+    def commit(self, position: SpoolPosition) -> None:
+        """Mark everything before `position` as consumed."""
+        self._position = position
+        for segment in [s for s in self._segments if s < position[0]]:
+            self._remove_segment(segment)
+        write_json_atomic(
+            os.path.join(self.directory, _POSITION_FILE), list(self._position)
+        )
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import signal
+import time
+from typing import Optional
+
+from elasticsearch import AsyncElasticsearch
+
+from components.base.base_monitor import BaseMonitor
+from components.log_monitor.checkpoint import CheckpointStore
+from components.sink.router import SinkRouter
+
+logger = logging.getLogger(__name__)
+
+
+class Lifecycle:
+    """Runs the monitors until SIGTERM or SIGINT is received and shuts down gracefully.
+
+    On shutdown, all monitors are stopped, the documents queued in the sink are
+    sent and the read offsets are saved, all within `shutdown_timeout` seconds.
+    Documents which could not be sent in time are spooled, if there is a spool.
+    Otherwise they are dropped and the offsets are not saved, so that they are read
+    again. Finally the connections of the Elasticsearch client are closed.
+    """
+
+    SIGNALS = (signal.SIGTERM, signal.SIGINT)
+
+    def __init__(
+        self,
+        monitors: list[BaseMonitor],
+        es: AsyncElasticsearch,
+        sink: SinkRouter,
+        checkpoints: Optional[CheckpointStore] = None,
+        shutdown_timeout: float = 8.0,
+    ) -> None:
+        self.monitors = monitors
+        self.es = es
+        self.sink = sink
+        self.checkpoints = checkpoints
+        self.shutdown_timeout = shutdown_timeout
+        self._stopping = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+        self._checkpoint_task: Optional[asyncio.Task] = None
+
+    def stop(self) -> None:
+        """Request a graceful shutdown."""
+        if not self._stopping.is_set():
+            logger.info("Shutting down.")
+        self._stopping.set()
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        for sig in self.SIGNALS:
+            loop.add_signal_handler(sig, self.stop)
+        try:
+            self.sink.start()
+            for monitor in self.monitors:
+                self._tasks.append(asyncio.create_task(monitor.start_monitoring()))
+            if self.checkpoints is not None:
+                self._checkpoint_task = asyncio.create_task(self.checkpoints.run())
+
+            stopping = asyncio.create_task(self._stopping.wait())
+            monitors_done = asyncio.gather(*self._tasks, return_exceptions=True)
+            await asyncio.wait(
+                {stopping, monitors_done}, return_when=asyncio.FIRST_COMPLETED
+            )
+            stopping.cancel()
+            await self.shutdown()
+        finally:
+            for sig in self.SIGNALS:
+                loop.remove_signal_handler(sig)
+
+    async def shutdown(self) -> None:
+        deadline = time.monotonic() + self.shutdown_timeout
+
+        def remaining() -> float:
+            return max(0.0, deadline - time.monotonic())
+
+        for monitor in self.monitors:
+            monitor.stop_monitoring()
+        if self._tasks:
+            _, pending = await asyncio.wait(self._tasks, timeout=remaining())
+            for task in pending:
+                task.cancel()
+            results = await asyncio.gather(*self._tasks, return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.error("Monitor failed.", exc_info=result)
+
+        try:
+            await asyncio.wait_for(self.sink.close(), remaining())
+        except asyncio.TimeoutError:
+            dropped = await self.sink.abort()
+            if dropped:
+                logger.error(
+                    f"Timeout while sending queued documents, {dropped} dropped."
+                )
+                if self.checkpoints is not None:
+                    # Read them again after the restart
+                    self.checkpoints.discard_changes()
+            else:
+                logger.warning(
+                    "Timeout while sending queued documents, they have been spooled."
+                )
+
+        if self._checkpoint_task is not None:
+            self._checkpoint_task.cancel()
+            try:
+                await self._checkpoint_task
+            except asyncio.CancelledError:
+                pass
+            except OSError:
+                logger.exception("Unable to save checkpoints.")
+        await self.es.close()
@@ -1,50 +1,158 @@
 import asyncio
-import glob
+import json
 import logging
 import os
+import zlib
+from typing import Callable, Optional
 
 import click
 from elasticsearch import AsyncElasticsearch
 
 from components.base.base_monitor import BaseMonitor
-from components.command_monitor.monitor import CommandMonitor
-from components.log_monitor.monitor import LogMonitor
-from utils import read_config
+from components.log_monitor.checkpoint import CheckpointStore
+from components.metrics.monitor import MetricsReporter, MetricsServer
+from components.sink.bulk_sink import ElasticsearchBulkSink
+from components.sink.router import SinkRouter
+from components.sink.spool import DiskSpool
+from lifecycle import Lifecycle
+from model import ElasticsearchTargetConfig, SpoolConfig, TargetType
+from reload import ConfigReloader
+from utils import read_config, setup_logging
 
+logger = logging.getLogger(__name__)
 
-async def start_monitors(monitors: list[BaseMonitor]):
-    tasks = []
-    for monitor in monitors:
-        tasks.append(asyncio.create_task(monitor.start_monitoring()))
 
-    await asyncio.gather(*tasks)
+async def start_monitors(
+    monitors: list[BaseMonitor],
+    es: AsyncElasticsearch,
+    sink: SinkRouter,
+    checkpoints: Optional[CheckpointStore] = None,
+    shutdown_timeout: float = 8.0,
+):
+    lifecycle = Lifecycle(monitors, es, sink, checkpoints, shutdown_timeout)
+    await lifecycle.run()
 
 
-def run_monitors(config_path: str, es: AsyncElasticsearch):
-    configs = read_config(config_path)
-    monitors = []
+def _spool_options(spool: Optional[SpoolConfig], directory: str = "") -> dict:
+    if spool is None:
+        return {}
+    return {
+        "spool": DiskSpool(
+            directory or spool.directory, spool.segment_bytes, spool.max_bytes
+        ),
+        "retry_interval": spool.retry_interval,
+    }
+
+
+def _checksum(value) -> str:
+    return f"{zlib.crc32(json.dumps(value, sort_keys=True).encode()):08x}"
+
+
+class _ElasticsearchSinkFactory:
+    """Creates the sinks of Elasticsearch targets with client settings.
+
+    Each sink has its own client. Its spool is a subdirectory named after the
+    cluster (its `hosts`), so that documents spooled before a change of the other
+    settings are still replayed. Further sinks of the same cluster spool into a
+    subdirectory named after all of their settings.
+    """
 
-    for config in configs.log_configs:
-        for path in glob.glob(config.path):
-            monitors.append(LogMonitor(path, config.events, es))
+    def __init__(
+        self,
+        create_client: Callable[..., AsyncElasticsearch],
+        spool: Optional[SpoolConfig],
+    ) -> None:
+        self.create_client = create_client
+        self.spool = spool
+        # The spool subdirectories in use
+        self.directories: set[str] = set()
 
-    for config in configs.cmd_configs:
-        for event in config.events:
-            monitors.append(CommandMonitor(event, es))
-    asyncio.run(start_monitors(monitors))
+    def __call__(self, settings: ElasticsearchTargetConfig) -> ElasticsearchBulkSink:
+        options = settings.sink_settings
+        name = f"elasticsearch-{_checksum(options)}"
+        max_concurrent = options.pop("max_concurrent", 1)
+        spool_options = {}
+        if self.spool is not None:
+            directory = f"elasticsearch-{_checksum(sorted(options.get('hosts') or []))}"
+            if directory in self.directories:
+                directory = name
+            self.directories.add(directory)
+            spool_options = _spool_options(
+                self.spool, os.path.join(self.spool.directory, directory)
+            )
+        return ElasticsearchBulkSink(
+            self.create_client(**options),
+            name=name,
+            max_concurrent=max_concurrent,
+            close_client=True,
+            **spool_options,
+        )
 
+    def warn_orphaned_spools(self) -> None:
+        """Warn about spool subdirectories with documents which no sink replays."""
+        if self.spool is None or not os.path.isdir(self.spool.directory):
+            return
+        for directory in sorted(os.listdir(self.spool.directory)):
+            path = os.path.join(self.spool.directory, directory)
+            if (
+                directory.startswith("elasticsearch-")
+                and directory not in self.directories
+                and os.path.isdir(path)
+                and not DiskSpool(path).empty
+            ):
+                logger.warning(
+                    f"The spool {path} is not used by any target, its documents "
+                    "are not sent."
+                )
 
-def setup_logging(level: int):
-    format = (
-        "[%(asctime)s] %(levelname)s [%(name)s.%(funcName)s:%(lineno)d] %(message)s"
+
+def run_monitors(
+    config_path: str,
+    es: AsyncElasticsearch,
+    shutdown_timeout: float = 8.0,
+    create_client: Optional[Callable[..., AsyncElasticsearch]] = None,
+):
+    configs = read_config(config_path)
+    factories = {}
+    elasticsearch_sinks = None
+    if create_client is not None:
+        elasticsearch_sinks = _ElasticsearchSinkFactory(create_client, configs.spool)
+        factories[TargetType.ELASTICSEARCH] = elasticsearch_sinks
+    sink = SinkRouter(
+        ElasticsearchBulkSink(es, **_spool_options(configs.spool)), factories
     )
-    logging.basicConfig(format=format, level=level)
+    for target in configs.targets:
+        # Invalid settings fail before any monitor is started
+        sink.resolve(target)
+    if elasticsearch_sinks is not None:
+        elasticsearch_sinks.warn_orphaned_spools()
+    checkpoints = None
+    if configs.checkpoint is not None:
+        checkpoints = CheckpointStore(
+            configs.checkpoint.path, configs.checkpoint.interval, sink
+        )
+    # The log, command and collector monitors are started by the reloader
+    monitors = [ConfigReloader(config_path, configs, es, sink, checkpoints)]
+    if (metrics := configs.metrics) is not None:
+        if metrics.port is not None:
+            monitors.append(MetricsServer(metrics.host, metrics.port, es, sink))
+        if metrics.targets:
+            monitors.append(
+                MetricsReporter(metrics.interval, metrics.targets, es, sink)
+            )
+    asyncio.run(start_monitors(monitors, es, sink, checkpoints, shutdown_timeout))
 
 
 @click.command()
 @click.option("--config", prompt=True, help="Path to the config.yaml")
 @click.option("--verbose", "-v", is_flag=True, help="Print debug output")
-def main(config: str, verbose: bool):
+@click.option(
+    "--shutdown-timeout",
+    default=8.0,
+    show_default=True,
+    help="Seconds to send queued documents on shutdown. Keep below the stop timeout of docker (10s).",
+)
+def main(config: str, verbose: bool, shutdown_timeout: float):
     setup_logging(logging.DEBUG if verbose else logging.INFO)
     # # TODO: use proper logging framework
     # # TODO: get config vars from argparse, env or file
@@ -52,10 +160,18 @@ def main(config: str, verbose: bool):
     # TODO: How to do basic auth using netrc? does this work out-of-the-box?
     es_username = os.getenv("ES_USERNAME")
     es_password = os.getenv("ES_PASSWORD")
-    es = AsyncElasticsearch(
-        es_host, basic_auth=(es_username, es_password), verify_certs=False
-    )
-    run_monitors(config, es)
+
+    def create_client(
+        hosts: Optional[list[str]] = None, **options
+    ) -> AsyncElasticsearch:
+        return AsyncElasticsearch(
+            hosts or es_host,
+            basic_auth=(es_username, es_password),
+            verify_certs=False,
+            **options,
+        )
+
+    run_monitors(config, create_client(), shutdown_timeout, create_client)
 
 
 if __name__ == "__main__":
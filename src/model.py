@@ -1,25 +1,347 @@
+import re
 from enum import Enum
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Optional, Union
 
-from pydantic import BaseModel, ConfigDict, PrivateAttr, ValidationInfo, field_validator
+from pydantic import (
+    BaseModel,
+    ConfigDict,
+    PrivateAttr,
+    ValidationInfo,
+    field_validator,
+    model_validator,
+)
 
 from components.log_monitor.logparser import LogEventParser
 
 
 class TargetType(str, Enum):
     ELASTICSEARCH = "elasticsearch"
+    FILE = "file"
+    STDOUT = "stdout"
+    HTTP = "http"
+
+
+class WatcherType(str, Enum):
+    AUTO = "auto"
+    INOTIFY = "inotify"
+    POLLING = "polling"
+
+
+class StartPosition(str, Enum):
+    BEGINNING = "beginning"
+    END = "end"
+
+
+class CollectorType(str, Enum):
+    MEMINFO = "meminfo"
+    VMSTAT = "vmstat"
+    LOADAVG = "loadavg"
+    DISK = "disk"
+    PRESSURE = "pressure"
+
+
+class IoniceClass(str, Enum):
+    REALTIME = "realtime"
+    BEST_EFFORT = "best-effort"
+    IDLE = "idle"
+
+
+class OverlapPolicy(str, Enum):
+    SKIP = "skip"
+    QUEUE = "queue"
+    KILL = "kill"
+
+
+class ElasticsearchTargetConfig(BaseModel):
+    """Index of an Elasticsearch target and the settings of its sink and client.
+
+    Targets without further settings share the default sink, whose client is
+    configured by the environment. Targets with the same settings share a sink
+    with a client of its own.
+    """
+
+    index: str
+    # Cluster to send to instead of ES_HOST
+    hosts: Optional[list[str]] = None
+    # Connections kept open to each node
+    connections_per_node: Optional[int] = None
+    # Bulk requests sent at once
+    max_concurrent: Optional[int] = None
+    # Compress request bodies using gzip
+    http_compress: Optional[bool] = None
+    # Seconds until a request times out
+    request_timeout: Optional[float] = None
+    model_config = ConfigDict(extra="forbid")
+
+    @field_validator("connections_per_node", "max_concurrent", "request_timeout")
+    @classmethod
+    def check_positive(
+        cls, v: Optional[float], info: ValidationInfo
+    ) -> Optional[float]:
+        assert (
+            v is None or v > 0
+        ), f"{info.field_name} must be a positive non-zero value"
+        return v
+
+    @property
+    def sink_settings(self) -> dict[str, Any]:
+        """The settings which differ from the default sink, without the index."""
+        return self.model_dump(exclude={"index"}, exclude_none=True)
+
+
+class BatchConfig(BaseModel):
+    """Batching of the documents of a file, stdout or http target."""
+
+    batch_size: int = 500
+    max_batch_bytes: int = 5 * 1024 * 1024
+    # Seconds the first document of a batch waits for more documents
+    linger: float = 1.0
+    queue_size: int = 10000
+    model_config = ConfigDict(extra="forbid")
+
+    @field_validator("batch_size", "max_batch_bytes", "linger", "queue_size")
+    @classmethod
+    def check_bigger_than_zero(cls, v: float, info: ValidationInfo) -> float:
+        assert v > 0, f"{info.field_name} must be a positive non-zero value"
+        return v
+
+
+class FileTargetConfig(BatchConfig):
+    path: str
+    # Size at which the file is rotated, 0 does not rotate it
+    max_bytes: int = 100 * 1024 * 1024
+    # Rotated files which are kept
+    backups: int = 5
+    # Compress rotated files using gzip
+    compress: bool = False
+
+    @field_validator("max_bytes", "backups")
+    @classmethod
+    def check_not_negative(cls, v: int, info: ValidationInfo) -> int:
+        assert v >= 0, f"{info.field_name} must not be negative"
+        return v
+
+
+class StdoutTargetConfig(BatchConfig):
+    pass
+
+
+class HttpTargetConfig(BatchConfig):
+    url: str
+    headers: dict[str, str] = {}
+    # Compress request bodies using gzip
+    compress: bool = False
+    # Requests sent at once
+    max_concurrent: int = 1
+    timeout: float = 10.0
+    max_retries: int = 3
+
+    @field_validator("max_concurrent", "timeout")
+    @classmethod
+    def check_positive(cls, v: float, info: ValidationInfo) -> float:
+        assert v > 0, f"{info.field_name} must be a positive non-zero value"
+        return v
+
+    @field_validator("max_retries")
+    @classmethod
+    def check_not_negative(cls, v: int, info: ValidationInfo) -> int:
+        assert v >= 0, f"{info.field_name} must not be negative"
+        return v
+
+
+TARGET_CONFIGS: dict[TargetType, type[BaseModel]] = {
+    TargetType.ELASTICSEARCH: ElasticsearchTargetConfig,
+    TargetType.FILE: FileTargetConfig,
+    TargetType.STDOUT: StdoutTargetConfig,
+    TargetType.HTTP: HttpTargetConfig,
+}
 
 
 class Target(BaseModel):
     type: TargetType
-    config: dict[str, str]
+    # Settings of the type, see TARGET_CONFIGS
+    config: dict[str, Any] = {}
+    _settings: Optional[BaseModel] = PrivateAttr(default=None)
+    _key: str = PrivateAttr(default="")
+
+    @field_validator("config")
+    @classmethod
+    def check_config(cls, v: dict, info: ValidationInfo) -> dict:
+        if "type" in info.data:
+            TARGET_CONFIGS[info.data["type"]](**v)
+        return v
+
+    def model_post_init(self, __context: Any) -> None:
+        self._settings = TARGET_CONFIGS[self.type](**self.config)
+        self._key = self.model_dump_json()
+        return super().model_post_init(__context)
+
+    @property
+    def settings(self) -> BaseModel:
+        return self._settings
+
+    @property
+    def key(self) -> str:
+        """Identifies the target, e.g. to send documents to it from a worker."""
+        return self._key
+
+
+class MultilineConfig(BaseModel):
+    continuation: Optional[str] = None
+    end: Optional[str] = None
+    max_lines: int = 100
+    max_bytes: int = 64 * 1024
+    flush_timeout: float = 1.0
+    model_config = ConfigDict(extra="forbid")
+    _continuation_pattern: Optional[re.Pattern] = PrivateAttr(default=None)
+    _end_pattern: Optional[re.Pattern] = PrivateAttr(default=None)
+
+    @field_validator("max_lines", "max_bytes", "flush_timeout")
+    @classmethod
+    def check_bigger_than_zero(cls, v: float, info: ValidationInfo) -> float:
+        assert v > 0, f"{info.field_name} must be a positive non-zero value"
+        return v
+
+    @model_validator(mode="after")
+    def check_end_condition(self) -> "MultilineConfig":
+        assert (self.continuation is None) != (
+            self.end is None
+        ), "exactly one of continuation and end must be set"
+        return self
+
+    def model_post_init(self, __context: Any) -> None:
+        if self.continuation is not None:
+            self._continuation_pattern = re.compile(self.continuation)
+        if self.end is not None:
+            self._end_pattern = re.compile(self.end)
+        return super().model_post_init(__context)
+
+    @property
+    def continuation_pattern(self) -> Optional[re.Pattern]:
+        return self._continuation_pattern
+
+    @property
+    def end_pattern(self) -> Optional[re.Pattern]:
+        return self._end_pattern
+
+
+class TimestampConfig(BaseModel):
+    # Named group containing the timestamp
+    group: str = "timestamp"
+    # auto, iso8601, syslog, epoch or a strptime format like "%d/%b/%Y:%H:%M:%S %z"
+    format: str = "auto"
+    # Field to store the parsed timestamp in, as ISO 8601
+    field: str = "timestamp"
+    model_config = ConfigDict(extra="forbid")
+
+    @field_validator("format")
+    @classmethod
+    def check_format(cls, v: str, info: ValidationInfo) -> str:
+        assert (
+            v in ("auto", "iso8601", "syslog", "epoch") or "%" in v
+        ), f"{info.field_name} must be auto, iso8601, syslog, epoch or a strptime format"
+        return v
+
+
+class DedupConfig(BaseModel):
+    # Fields which must be identical, by default all fields except the line and
+    # the timestamp
+    fields: Optional[list[str]] = None
+    window: float = 60.0
+    max_keys: int = 10000
+    model_config = ConfigDict(extra="forbid")
+
+    @field_validator("window", "max_keys")
+    @classmethod
+    def check_bigger_than_zero(cls, v: float, info: ValidationInfo) -> float:
+        assert v > 0, f"{info.field_name} must be a positive non-zero value"
+        return v
+
+
+class RateLimitConfig(BaseModel):
+    # Events per second
+    rate: float
+    # Events allowed at once, defaults to the rate
+    burst: Optional[float] = None
+    model_config = ConfigDict(extra="forbid")
+
+    @field_validator("rate", "burst")
+    @classmethod
+    def check_bigger_than_zero(cls, v: float, info: ValidationInfo) -> float:
+        if v is not None:
+            assert v > 0, f"{info.field_name} must be a positive non-zero value"
+        return v
+
+
+class FilterConfig(BaseModel):
+    # Matching lines are dropped if they match any of these regexes as well
+    exclude: list[str] = []
+    dedup: Optional[DedupConfig] = None
+    rate_limit: Optional[RateLimitConfig] = None
+    # Share of the events to keep
+    sample: float = 1.0
+    model_config = ConfigDict(extra="forbid")
+    _exclude_patterns: list[re.Pattern] = PrivateAttr(default_factory=list)
+
+    @field_validator("sample")
+    @classmethod
+    def check_ratio(cls, v: float, info: ValidationInfo) -> float:
+        assert 0 < v <= 1, f"{info.field_name} must be bigger than 0 and at most 1"
+        return v
+
+    def model_post_init(self, __context: Any) -> None:
+        self._exclude_patterns = [re.compile(regex) for regex in self.exclude]
+        return super().model_post_init(__context)
+
+    @property
+    def exclude_patterns(self) -> list[re.Pattern]:
+        return self._exclude_patterns
+
+
+class AggregationConfig(BaseModel):
+    # Seconds per window, windows are aligned to the wall clock
+    window: float = 60.0
+    # Fields forming the key, one document is saved per key and window
+    group_by: list[str] = []
+    # Numeric fields to compute the count, sum, min, max and percentiles of
+    fields: list[str] = []
+    percentiles: list[float] = [50.0, 90.0, 99.0]
+    # Relative error of the percentiles
+    accuracy: float = 0.01
+    max_buckets: int = 1024
+    max_keys: int = 1000
+    model_config = ConfigDict(extra="forbid")
+
+    @field_validator("window", "max_buckets", "max_keys")
+    @classmethod
+    def check_bigger_than_zero(cls, v: float, info: ValidationInfo) -> float:
+        assert v > 0, f"{info.field_name} must be a positive non-zero value"
+        return v
+
+    @field_validator("percentiles")
+    @classmethod
+    def check_percentiles(cls, v: list[float], info: ValidationInfo) -> list[float]:
+        assert all(
+            0 <= percentile <= 100 for percentile in v
+        ), f"{info.field_name} must be between 0 and 100"
+        return v
+
+    @field_validator("accuracy")
+    @classmethod
+    def check_ratio(cls, v: float, info: ValidationInfo) -> float:
+        assert 0 < v < 1, f"{info.field_name} must be between 0 and 1"
+        return v
 
 
 class LogMonitorEvent(BaseModel):
     name: str
     regexes: list[str]
     targets: list[Target]
+    multiline: Optional[MultilineConfig] = None
+    timestamp: Optional[TimestampConfig] = None
+    filters: Optional[FilterConfig] = None
+    aggregation: Optional[AggregationConfig] = None
     model_config = ConfigDict(extra="forbid")
     _parser: LogEventParser = PrivateAttr()
 
@@ -35,24 +357,124 @@ class LogMonitorEvent(BaseModel):
 class LogMonitorConfig(BaseModel):
     path: str
     events: list[LogMonitorEvent]
+    watcher: WatcherType = WatcherType.AUTO
+    poll_interval: float = 0.1
+    chunk_size: int = 256 * 1024
+    start_position: StartPosition = StartPosition.BEGINNING
+    model_config = ConfigDict(extra="forbid")
+
+    @field_validator("poll_interval", "chunk_size")
+    @classmethod
+    def check_bigger_than_zero(cls, v: float, info: ValidationInfo) -> float:
+        assert v > 0.0, f"{info.field_name} must be a positive non-zero value"
+        return v
+
+
+class CmdOutputConfig(BaseModel):
+    # Bytes kept from the start and from the end of stdout and stderr each
+    head_bytes: int = 64 * 1024
+    tail_bytes: int = 64 * 1024
+    # Longer lines are split, when matching line events
+    max_line_bytes: int = 64 * 1024
+    model_config = ConfigDict(extra="forbid")
+
+    @field_validator("head_bytes", "tail_bytes")
+    @classmethod
+    def check_not_negative(cls, v: int, info: ValidationInfo) -> int:
+        assert v >= 0, f"{info.field_name} must not be negative"
+        return v
+
+    @field_validator("max_line_bytes")
+    @classmethod
+    def check_bigger_than_zero(cls, v: int, info: ValidationInfo) -> int:
+        assert v > 0, f"{info.field_name} must be a positive non-zero value"
+        return v
+
+
+class CmdLineEvent(BaseModel):
+    name: str
+    regexes: list[str]
+    # Defaults to the targets of the command
+    targets: Optional[list[Target]] = None
     model_config = ConfigDict(extra="forbid")
+    _parser: LogEventParser = PrivateAttr()
+
+    def model_post_init(self, __context: Any) -> None:
+        self._parser = LogEventParser(self.name, self.regexes)
+        return super().model_post_init(__context)
+
+    @property
+    def parser(self):
+        return self._parser
 
 
 class CmdMonitorEvent(BaseModel):
     name: str
-    command: str
+    # A string is run by the shell, a list is executed directly
+    command: Union[str, list[str]]
     targets: list[Target]
     repeat: Optional[float] = None
     chdir: Optional[str] = None
+    # Added to the environment of the agent, not saved in the documents
+    env: dict[str, str] = {}
+    nice: Optional[int] = None
+    ionice_class: Optional[IoniceClass] = None
+    ionice_level: Optional[int] = None
+    # Seconds after which the command and all its child processes are killed
+    timeout: Optional[float] = None
+    # Maximum random delay of every run, in seconds
+    jitter: float = 0.0
+    # Runs of this command at once, and what happens with further runs
+    max_concurrent: int = 1
+    overlap: OverlapPolicy = OverlapPolicy.SKIP
+    output: CmdOutputConfig = CmdOutputConfig()
+    # Events found in the lines of stdout and stderr, like in log files
+    line_events: list[CmdLineEvent] = []
     model_config = ConfigDict(extra="forbid")
 
-    @field_validator("repeat")
+    @field_validator("repeat", "timeout")
     @classmethod
     def check_bigger_than_zero(cls, v: float, info: ValidationInfo) -> float:
         if isinstance(v, float):
             assert v > 0.0, f"{info.field_name} must be a positive non-zero value"
         return v
 
+    @field_validator("max_concurrent")
+    @classmethod
+    def check_positive(cls, v: int, info: ValidationInfo) -> int:
+        assert v > 0, f"{info.field_name} must be a positive non-zero value"
+        return v
+
+    @field_validator("jitter")
+    @classmethod
+    def check_not_negative(cls, v: float, info: ValidationInfo) -> float:
+        assert v >= 0, f"{info.field_name} must not be negative"
+        return v
+
+    @field_validator("command")
+    @classmethod
+    def check_not_empty(
+        cls, v: Union[str, list[str]], info: ValidationInfo
+    ) -> Union[str, list[str]]:
+        assert v, f"{info.field_name} must not be empty"
+        return v
+
+    @field_validator("nice")
+    @classmethod
+    def check_nice(cls, v: Optional[int], info: ValidationInfo) -> Optional[int]:
+        if v is not None:
+            assert -20 <= v <= 19, f"{info.field_name} must be between -20 and 19"
+        return v
+
+    @field_validator("ionice_level")
+    @classmethod
+    def check_ionice_level(
+        cls, v: Optional[int], info: ValidationInfo
+    ) -> Optional[int]:
+        if v is not None:
+            assert 0 <= v <= 7, f"{info.field_name} must be between 0 and 7"
+        return v
+
     @field_validator("chdir")
     @classmethod
     def check_dir_exists(cls, v: str, info: ValidationInfo) -> str:
@@ -67,7 +489,101 @@ class CmdMonitorConfig(BaseModel):
     model_config = ConfigDict(extra="forbid")
 
 
+class CollectorConfig(BaseModel):
+    name: str
+    type: CollectorType
+    targets: list[Target]
+    interval: float = 60.0
+    # Only save these fields of meminfo and vmstat, by default all of them
+    fields: Optional[list[str]] = None
+    # Mount points of the disk collector, by default all mounted block devices
+    mounts: Optional[list[str]] = None
+    model_config = ConfigDict(extra="forbid")
+
+    @field_validator("interval")
+    @classmethod
+    def check_bigger_than_zero(cls, v: float, info: ValidationInfo) -> float:
+        assert v > 0, f"{info.field_name} must be a positive non-zero value"
+        return v
+
+
+class CheckpointConfig(BaseModel):
+    path: str
+    interval: float = 5.0
+    model_config = ConfigDict(extra="forbid")
+
+    @field_validator("interval")
+    @classmethod
+    def check_bigger_than_zero(cls, v: float, info: ValidationInfo) -> float:
+        assert v > 0.0, f"{info.field_name} must be a positive non-zero value"
+        return v
+
+
+class SpoolConfig(BaseModel):
+    directory: str
+    segment_bytes: int = 16 * 1024 * 1024
+    max_bytes: int = 1024 * 1024 * 1024
+    retry_interval: float = 5.0
+    model_config = ConfigDict(extra="forbid")
+
+    @field_validator("segment_bytes", "max_bytes", "retry_interval")
+    @classmethod
+    def check_bigger_than_zero(cls, v: float, info: ValidationInfo) -> float:
+        assert v > 0, f"{info.field_name} must be a positive non-zero value"
+        return v
+
+
+class MetricsConfig(BaseModel):
+    host: str = "127.0.0.1"
+    port: Optional[int] = 9464
+    interval: float = 60.0
+    targets: list[Target] = []
+    model_config = ConfigDict(extra="forbid")
+
+    @field_validator("interval")
+    @classmethod
+    def check_bigger_than_zero(cls, v: float, info: ValidationInfo) -> float:
+        assert v > 0, f"{info.field_name} must be a positive non-zero value"
+        return v
+
+
 class MonitorConfigs(BaseModel):
     log_configs: list[LogMonitorConfig]
     cmd_configs: list[CmdMonitorConfig]
+    collector_configs: list[CollectorConfig] = []
+    checkpoint: Optional[CheckpointConfig] = None
+    spool: Optional[SpoolConfig] = None
+    metrics: Optional[MetricsConfig] = None
+    # Processes monitoring the log files, 0 starts one per CPU core
+    log_workers: int = 1
+    # Threads matching and parsing log lines, 0 parses on the event loop
+    parse_threads: int = 1
+    # Commands running at once, 0 does not limit them
+    command_concurrency: int = 0
     model_config = ConfigDict(extra="forbid")
+
+    @field_validator("log_workers", "parse_threads", "command_concurrency")
+    @classmethod
+    def check_not_negative(cls, v: int, info: ValidationInfo) -> int:
+        assert v >= 0, f"{info.field_name} must not be negative"
+        return v
+
+    @property
+    def targets(self) -> list[Target]:
+        """All targets documents are saved to."""
+        targets = [
+            target
+            for config in self.log_configs
+            for event in config.events
+            for target in event.targets
+        ]
+        for config in self.cmd_configs:
+            for event in config.events:
+                targets.extend(event.targets)
+                for line_event in event.line_events:
+                    targets.extend(line_event.targets or [])
+        for collector in self.collector_configs:
+            targets.extend(collector.targets)
+        if self.metrics is not None:
+            targets.extend(self.metrics.targets)
+        return targets
@@ -0,0 +1,264 @@
+import asyncio
+import logging
+import os
+import signal
+from typing import Any, Optional, Union
+
+import yaml
+from elasticsearch import AsyncElasticsearch
+from pydantic import BaseModel, ValidationError
+
+from components.base.base_monitor import BaseMonitor
+from components.collector.monitor import CollectorMonitor
+from components.command_monitor.monitor import CommandMonitor
+from components.command_monitor.scheduler import CommandScheduler
+from components.log_monitor.checkpoint import CheckpointStore
+from components.log_monitor.discovery import LogFileDiscovery, create_parse_executor
+from components.log_monitor.watcher import create_directory_watcher
+from components.log_monitor.workers import LogWorkerPool
+from components.sink.router import SinkRouter
+from model import MonitorConfigs, WatcherType
+from utils import read_config
+
+logger = logging.getLogger(__name__)
+
+# Settings which are only applied when starting
+RESTART_SETTINGS = (
+    "checkpoint",
+    "spool",
+    "metrics",
+    "log_workers",
+    "parse_threads",
+    "command_concurrency",
+)
+
+
+def _dump(value: Any) -> Any:
+    # Compared by their fields, models with private attributes like compiled
+    # regexes are never equal
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    if isinstance(value, list):
+        return [_dump(item) for item in value]
+    return value
+
+
+class ConfigReloader(BaseMonitor):
+    """Runs the log, command and collector monitors of the config at `config_path`
+    and applies changes of the config without restarting them.
+
+    The config is read again on SIGHUP and, with `watch`, when the file changes.
+    Only monitors whose config changed are started, stopped or updated, the others
+    keep their file positions, buffers and schedules. The settings in
+    `RESTART_SETTINGS` are not reloaded. An invalid config is logged and ignored.
+    Ends once stopped, or when all monitors have ended.
+    """
+
+    def __init__(
+        self,
+        config_path: str,
+        configs: MonitorConfigs,
+        es: AsyncElasticsearch,
+        sink: SinkRouter,
+        checkpoints: Optional[CheckpointStore] = None,
+        watch: bool = True,
+        watch_interval: float = 5.0,
+    ) -> None:
+        super().__init__(es, sink)
+        self.config_path = config_path
+        self.configs = configs
+        self.checkpoints = checkpoints
+        self.watch = watch
+        self.watch_interval = watch_interval
+        self.log_monitor: Optional[Union[LogFileDiscovery, LogWorkerPool]] = None
+        self.scheduler: Optional[CommandScheduler] = None
+        self.commands: list[CommandMonitor] = []
+        self.collectors: list[CollectorMonitor] = []
+        self._scheduler_task: Optional[asyncio.Task] = None
+        self._tasks: set[asyncio.Task] = set()
+        self._reload = asyncio.Event()
+
+    async def start_monitoring(self) -> None:
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGHUP, self.request_reload)
+        watching = asyncio.create_task(self._watch()) if self.watch else None
+        try:
+            self._start(self.configs)
+            while self._tasks and not self.stopped:
+                reload = asyncio.create_task(self._reload.wait())
+                await asyncio.wait(
+                    {reload, *self._tasks}, return_when=asyncio.FIRST_COMPLETED
+                )
+                reload.cancel()
+                if self._reload.is_set() and not self.stopped:
+                    self._reload.clear()
+                    self.reload()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        finally:
+            loop.remove_signal_handler(signal.SIGHUP)
+            if watching is not None:
+                watching.cancel()
+            for task in self._tasks:
+                task.cancel()
+
+    def stop_monitoring(self) -> None:
+        self._stopped.set()
+        self._reload.set()
+        for monitor in self._monitors():
+            monitor.stop_monitoring()
+
+    def request_reload(self) -> None:
+        logger.info(f"Reloading {self.config_path}.")
+        self._reload.set()
+
+    def reload(self) -> bool:
+        """Read the config again and apply it.
+
+        Returns:
+            bool: False if the config could not be read, it is not applied then.
+        """
+        try:
+            configs = read_config(self.config_path)
+        except (OSError, TypeError, yaml.YAMLError, ValidationError) as error:
+            logger.error(
+                f"Unable to reload {self.config_path}, keeping the running config: "
+                f"{error}"
+            )
+            return False
+        self.apply(configs)
+        return True
+
+    def apply(self, configs: MonitorConfigs) -> None:
+        """Start, stop or update the monitors whose config differs from `configs`."""
+        for setting in RESTART_SETTINGS:
+            if _dump(getattr(configs, setting)) != _dump(
+                getattr(self.configs, setting)
+            ):
+                logger.warning(f"Changing {setting!r} requires a restart.")
+        if _dump(configs.log_configs) != _dump(self.configs.log_configs):
+            if self.log_monitor is None:
+                self._start_log_monitor(configs)
+            else:
+                logger.info("Applying the changed log configs.")
+                self.log_monitor.reconfigure(configs.log_configs)
+        self._apply_commands(configs)
+        self._apply_collectors(configs)
+        self.configs = configs.model_copy(
+            update={
+                setting: getattr(self.configs, setting) for setting in RESTART_SETTINGS
+            }
+        )
+
+    def _monitors(self) -> list[BaseMonitor]:
+        monitors = [self.log_monitor, self.scheduler, *self.collectors]
+        return [monitor for monitor in monitors if monitor is not None]
+
+    def _start(self, configs: MonitorConfigs) -> None:
+        if configs.log_configs:
+            self._start_log_monitor(configs)
+        self._apply_commands(configs)
+        self._apply_collectors(configs)
+
+    def _start_task(self, monitor: BaseMonitor) -> asyncio.Task:
+        task = asyncio.create_task(monitor.start_monitoring())
+        self._tasks.add(task)
+        task.add_done_callback(self._on_done)
+        return task
+
+    def _on_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and (exception := task.exception()) is not None:
+            logger.error("Monitor failed.", exc_info=exception)
+
+    def _start_log_monitor(self, configs: MonitorConfigs) -> None:
+        if self.configs.log_workers == 1:
+            self.log_monitor = LogFileDiscovery(
+                configs.log_configs,
+                self.es,
+                self.sink,
+                self.checkpoints,
+                executor=create_parse_executor(self.configs.parse_threads),
+            )
+        else:
+            self.log_monitor = LogWorkerPool(
+                configs.log_configs,
+                self.es,
+                self.sink,
+                self.checkpoints,
+                self.configs.log_workers,
+                parse_threads=self.configs.parse_threads,
+            )
+        self._start_task(self.log_monitor)
+
+    def _apply_commands(self, configs: MonitorConfigs) -> None:
+        # Commands are matched by their complete event, changed ones are replaced
+        removed = {}
+        for monitor in self.commands:
+            removed.setdefault(monitor.event.model_dump_json(), []).append(monitor)
+        commands, added = [], []
+        for config in configs.cmd_configs:
+            for event in config.events:
+                if kept := removed.get(event.model_dump_json()):
+                    commands.append(kept.pop(0))
+                    continue
+                monitor = CommandMonitor(event, self.es, self.sink)
+                commands.append(monitor)
+                added.append(monitor)
+        self.commands = commands
+
+        if self._scheduler_task is None or self._scheduler_task.done():
+            if added:
+                self.scheduler = CommandScheduler(
+                    added, self.es, self.sink, self.configs.command_concurrency
+                )
+                self._scheduler_task = self._start_task(self.scheduler)
+            return
+        for monitors in removed.values():
+            for monitor in monitors:
+                logger.info(f"Removing the command {monitor.event.name!r}.")
+                self.scheduler.remove(monitor)
+        for monitor in added:
+            logger.info(f"Adding the command {monitor.event.name!r}.")
+            self.scheduler.add(monitor)
+
+    def _apply_collectors(self, configs: MonitorConfigs) -> None:
+        removed = {}
+        for monitor in self.collectors:
+            removed.setdefault(monitor.config.model_dump_json(), []).append(monitor)
+        collectors = []
+        for config in configs.collector_configs:
+            if kept := removed.get(config.model_dump_json()):
+                collectors.append(kept.pop(0))
+                continue
+            monitor = CollectorMonitor(config, self.es, self.sink)
+            collectors.append(monitor)
+            self._start_task(monitor)
+        for monitors in removed.values():
+            for monitor in monitors:
+                monitor.stop_monitoring()
+        self.collectors = collectors
+
+    def _stat(self) -> Optional[tuple]:
+        try:
+            # Follows symlinks, which e.g. Kubernetes replaces to update configs
+            stat = os.stat(self.config_path)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_dev, stat.st_size, stat.st_mtime_ns)
+
+    async def _watch(self) -> None:
+        directory = os.path.dirname(os.path.abspath(self.config_path))
+        watcher = create_directory_watcher(
+            [directory], WatcherType.AUTO, self.watch_interval
+        )
+        try:
+            previous = self._stat()
+            while True:
+                await watcher.wait(timeout=self.watch_interval)
+                current = self._stat()
+                if current is not None and current != previous:
+                    logger.info(f"{self.config_path} has changed.")
+                    self.request_reload()
+                previous = current
+        finally:
+            watcher.close()
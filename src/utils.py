@@ -1,3 +1,9 @@
+import json
+import logging
+import os
+import tempfile
+from typing import Any
+
 import yaml
 
 from model import MonitorConfigs
@@ -7,3 +13,27 @@ def read_config(config_path: str) -> MonitorConfigs:
     with open(config_path, "r") as file:
         yaml_dict = yaml.safe_load(file)
         return MonitorConfigs(**yaml_dict)
+
+
+def write_json_atomic(path: str, data: Any) -> None:
+    """Write `data` as json to `path`, so that readers never see a partial file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(
+        dir=directory, prefix=f".{os.path.basename(path)}-", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "w") as file:
+            json.dump(data, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def setup_logging(level: int):
+    format = (
+        "[%(asctime)s] %(levelname)s [%(name)s.%(funcName)s:%(lineno)d] %(message)s"
+    )
+    logging.basicConfig(format=format, level=level)
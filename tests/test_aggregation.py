@@ -0,0 +1,146 @@
+import random
+from datetime import datetime
+from unittest.mock import AsyncMock
+
+import pytest
+import yaml
+
+from components.log_monitor.aggregation import OTHER, Aggregator, LogBucketSketch
+from components.log_monitor.monitor import LogMonitor
+from model import AggregationConfig, LogMonitorEvent
+
+
+def test_sketch_quantiles():
+    sketch = LogBucketSketch(accuracy=0.01)
+    rng = random.Random(0)
+    values = [rng.lognormvariate(0, 2) for _ in range(10000)]
+    for value in values:
+        sketch.add(value)
+    values.sort()
+    for q in (0.0, 0.5, 0.9, 0.99, 1.0):
+        exact = values[int(q * (len(values) - 1))]
+        assert sketch.quantile(q) == pytest.approx(exact, rel=0.011)
+
+
+def test_sketch_negative_and_zero():
+    sketch = LogBucketSketch()
+    for value in (-10, -1, 0, 0, 1, 10):
+        sketch.add(value)
+    assert sketch.quantile(0.0) == pytest.approx(-10, rel=0.01)
+    assert sketch.quantile(0.5) == 0.0
+    assert sketch.quantile(1.0) == pytest.approx(10, rel=0.01)
+    assert LogBucketSketch().quantile(0.5) is None
+
+
+def test_sketch_is_bounded():
+    sketch = LogBucketSketch(accuracy=0.01, max_buckets=10)
+    for value in range(1, 10000):
+        sketch.add(value)
+    assert len(sketch._positive) == 10
+    assert sketch.count == 9999
+    # The highest quantiles are still accurate
+    assert sketch.quantile(1.0) == pytest.approx(9999, rel=0.01)
+
+
+def test_aggregator_windows():
+    config = AggregationConfig(
+        window=60, group_by=["host"], fields=["seconds"], percentiles=[50]
+    )
+    aggregator = Aggregator(config)
+    start = datetime(2024, 10, 18, 12, 0).timestamp()
+    assert aggregator.add({"host": "a", "seconds": "1.5"}, start + 1) == []
+    assert aggregator.add({"host": "a", "seconds": "2.5"}, start + 2) == []
+    assert aggregator.add({"host": "b", "seconds": "n/a"}, start + 3) == []
+    assert aggregator.deadline() == start + 60
+    assert aggregator.expired(start + 59) == []
+
+    documents = aggregator.add({"host": "a", "seconds": 4}, start + 61)
+    assert documents == [
+        {
+            "host": "a",
+            "window_start": "2024-10-18T12:00:00",
+            "window_end": "2024-10-18T12:01:00",
+            "count": 2,
+            "seconds": {
+                "count": 2,
+                "sum": 4.0,
+                "min": 1.5,
+                "max": 2.5,
+                "avg": 2.0,
+                "p50": pytest.approx(1.5, rel=0.01),
+            },
+        },
+        {
+            "host": "b",
+            "window_start": "2024-10-18T12:00:00",
+            "window_end": "2024-10-18T12:01:00",
+            "count": 1,
+        },
+    ]
+    assert aggregator.expired() == [
+        {
+            "host": "a",
+            "window_start": "2024-10-18T12:01:00",
+            "window_end": "2024-10-18T12:02:00",
+            "count": 1,
+            "seconds": {
+                "count": 1,
+                "sum": 4.0,
+                "min": 4.0,
+                "max": 4.0,
+                "avg": 4.0,
+                "p50": 4.0,
+            },
+        }
+    ]
+    assert aggregator.deadline() is None
+
+
+def test_aggregator_bounds_keys():
+    aggregator = Aggregator(AggregationConfig(group_by=["host"], max_keys=2))
+    for host in ("a", "b", "c", "d", "a"):
+        aggregator.add({"host": host}, 0.0)
+    counts = {document["host"]: document["count"] for document in aggregator.expired()}
+    assert counts == {"a": 2, "b": 1, OTHER: 2}
+
+
+@pytest.mark.parametrize(
+    "config", [{"window": 0}, {"percentiles": [101]}, {"accuracy": 1}]
+)
+def test_aggregation_config_validation(config):
+    with pytest.raises(ValueError):
+        AggregationConfig(**config)
+
+
+@pytest.mark.asyncio
+async def test_log_monitor_aggregates_events():
+    log_event = LogMonitorEvent(**yaml.safe_load("""
+          name: "bazel_actions"
+          regexes:
+            - '^(?P<mnemonic>\\w+) took (?P<seconds>[\\d.]+)s'
+          aggregation:
+            group_by: [mnemonic]
+            fields: [seconds]
+          targets:
+            - type: elasticsearch
+              config:
+                index: "index"
+        """))
+    es_mock = AsyncMock()
+    monitor = LogMonitor("log.txt", [log_event], es_mock)
+
+    await monitor._retrieve_line_event("Javac took 1.5s\n")
+    await monitor._retrieve_line_event("Javac took 2.5s\n")
+    await monitor._retrieve_line_event("CppCompile took 3s\n")
+    es_mock.index.assert_not_called()
+    assert monitor._deadline() is not None
+
+    await monitor._flush_windows()
+    documents = {
+        call.kwargs["document"]["mnemonic"]: call.kwargs["document"]
+        for call in es_mock.index.call_args_list
+    }
+    assert documents["Javac"]["count"] == 2
+    assert documents["Javac"]["seconds"]["sum"] == 4.0
+    assert documents["CppCompile"]["seconds"]["max"] == 3.0
+    assert "created_at" in documents["CppCompile"]
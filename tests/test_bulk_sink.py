@@ -0,0 +1,148 @@
+import asyncio
+import json
+from datetime import datetime
+from unittest.mock import AsyncMock
+
+import pytest
+
+from components.sink import bulk_sink
+from components.sink.bulk_sink import ElasticsearchBulkSink
+
+
+class FakeBulk:
+    def __init__(self, failing_indices=()) -> None:
+        self.requests = []
+        self.failing_indices = failing_indices
+
+    async def __call__(self, client, actions, expand_action_callback, **kwargs):
+        actions = [expand_action_callback(action) for action in actions]
+        self.requests.append(actions)
+        for header, _ in actions:
+            index = header["index"]["_index"]
+            if index in self.failing_indices:
+                yield False, {"index": {"_index": index, "status": 400}}
+            elif kwargs.get("yield_ok", True):
+                yield True, {"index": {"_index": index, "status": 201}}
+
+
+@pytest.fixture
+def fake_bulk(monkeypatch):
+    fake = FakeBulk()
+    monkeypatch.setattr(bulk_sink, "async_streaming_bulk", fake)
+    return fake
+
+
+@pytest.mark.asyncio
+async def test_bulk_sink_flush_on_chunk_size(fake_bulk):
+    sink = ElasticsearchBulkSink(AsyncMock(), chunk_size=2, linger=60)
+
+    for i in range(5):
+        await sink.put("index", {"number": i})
+    await asyncio.sleep(0.01)
+
+    # Two full chunks were sent, the last document is still lingering
+    assert [len(request) for request in fake_bulk.requests] == [2, 2]
+    assert sink.pending == 1
+
+    await sink.close()
+    assert [len(request) for request in fake_bulk.requests] == [2, 2, 1]
+    assert sink.indexed == 5
+    assert sink.failed == 0
+
+
+@pytest.mark.asyncio
+async def test_bulk_sink_flush_on_linger(fake_bulk):
+    sink = ElasticsearchBulkSink(AsyncMock(), chunk_size=100, linger=0.05)
+
+    await sink.put("index", {"created_at": datetime(2024, 1, 2, 3, 4, 5)})
+    await asyncio.sleep(0.1)
+
+    assert len(fake_bulk.requests) == 1
+    header, body = fake_bulk.requests[0][0]
+    assert header == {"index": {"_index": "index"}}
+    assert json.loads(body) == {"created_at": "2024-01-02T03:04:05"}
+    await sink.close()
+
+
+@pytest.mark.asyncio
+async def test_bulk_sink_batches_per_index(fake_bulk):
+    sink = ElasticsearchBulkSink(AsyncMock(), chunk_size=100, linger=60)
+
+    await sink.put("index_a", {"a": 1})
+    await sink.put("index_b", {"b": 1})
+    await sink.put("index_a", {"a": 2})
+    await sink.flush()
+
+    indices = [
+        {header["index"]["_index"] for header, _ in request}
+        for request in fake_bulk.requests
+    ]
+    assert indices == [{"index_a"}, {"index_b"}]
+    assert len(fake_bulk.requests[0]) == 2
+    await sink.close()
+
+
+@pytest.mark.asyncio
+async def test_bulk_sink_backpressure(fake_bulk):
+    sink = ElasticsearchBulkSink(AsyncMock(), queue_size=1, linger=60)
+    sink.chunk_size = 1
+    blocked = asyncio.Event()
+
+    async def slow_send(actions):
+        await blocked.wait()
+
+    sink._send = slow_send
+    await sink.put("index", {"a": 1})
+    await asyncio.sleep(0.01)
+    # Waits for the request of the first document to finish
+    await sink.put("index", {"a": 2})
+    await asyncio.sleep(0.01)
+    await sink.put("index", {"a": 3})
+
+    put = asyncio.create_task(sink.put("index", {"a": 4}))
+    await asyncio.sleep(0.01)
+    assert not put.done()
+
+    blocked.set()
+    await asyncio.wait_for(put, 1)
+    await sink.close()
+
+
+@pytest.mark.asyncio
+async def test_bulk_sink_concurrent_requests(fake_bulk):
+    sink = ElasticsearchBulkSink(AsyncMock(), chunk_size=1, linger=60, max_concurrent=2)
+    in_flight = []
+    blocked = asyncio.Event()
+
+    async def slow_send(actions):
+        in_flight.append(actions)
+        await blocked.wait()
+        return []
+
+    sink._send = slow_send
+    for i in range(3):
+        await sink.put("index", {"number": i})
+    await asyncio.sleep(0.01)
+
+    # The third request waits for one of the first two
+    assert len(in_flight) == 2
+    assert sink.pending == 3
+
+    blocked.set()
+    await sink.close()
+    assert len(in_flight) == 3
+    assert sink.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_bulk_sink_reports_failures(monkeypatch):
+    fake = FakeBulk(failing_indices=("broken",))
+    monkeypatch.setattr(bulk_sink, "async_streaming_bulk", fake)
+    sink = ElasticsearchBulkSink(AsyncMock())
+
+    await sink.put("broken", {"a": 1})
+    await sink.put("index", {"a": 2})
+    await sink.close()
+
+    assert sink.failed == 1
+    assert sink.indexed == 1
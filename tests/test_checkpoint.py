@@ -0,0 +1,170 @@
+import asyncio
+import json
+import os
+from unittest.mock import AsyncMock
+
+import pytest
+import yaml
+
+from components.log_monitor.checkpoint import CheckpointStore
+from components.log_monitor.monitor import LogMonitor
+from model import LogMonitorEvent, MultilineConfig, StartPosition
+
+
+def test_checkpoint_store_save_and_load(tmp_path):
+    checkpoint_path = tmp_path / "checkpoints.json"
+    log_file_path = tmp_path / "log.txt"
+    log_file_path.write_text("line\n")
+    stat = os.stat(log_file_path)
+
+    store = CheckpointStore(checkpoint_path)
+    assert store.get_offset(str(log_file_path), stat) is None
+    store.update(str(log_file_path), stat, 5)
+    store.save()
+
+    assert json.loads(checkpoint_path.read_text()) == {
+        str(log_file_path): {"inode": stat.st_ino, "device": stat.st_dev, "offset": 5}
+    }
+    assert CheckpointStore(checkpoint_path).get_offset(str(log_file_path), stat) == 5
+    assert not any(p.name.endswith(".tmp") for p in tmp_path.iterdir())
+
+
+def test_checkpoint_store_rotated_and_truncated_file(tmp_path):
+    log_file_path = tmp_path / "log.txt"
+    log_file_path.write_text("line\n")
+    store = CheckpointStore(tmp_path / "checkpoints.json")
+    store.update(str(log_file_path), os.stat(log_file_path), 5)
+
+    log_file_path.write_text("")
+    assert store.get_offset(str(log_file_path), os.stat(log_file_path)) == 0
+
+    log_file_path.rename(tmp_path / "log.txt.1")
+    log_file_path.write_text("new line\n")
+    assert store.get_offset(str(log_file_path), os.stat(log_file_path)) == 0
+
+
+@pytest.mark.asyncio
+async def test_checkpoint_store_saves_once_sent(tmp_path):
+    checkpoint_path = tmp_path / "checkpoints.json"
+    log_file_path = tmp_path / "log.txt"
+    log_file_path.write_text("line\n")
+    stat = os.stat(log_file_path)
+    sent = asyncio.Event()
+
+    class Sink:
+        async def flush(self):
+            await sent.wait()
+
+    store = CheckpointStore(checkpoint_path, sink=Sink())
+    store.update(str(log_file_path), stat, 5)
+    saving = asyncio.create_task(store.save_sent())
+    await asyncio.sleep(0.01)
+    assert not checkpoint_path.exists()
+    # Its documents are only queued after the flush was requested
+    store.update(str(log_file_path), stat, 10)
+
+    sent.set()
+    await saving
+    assert json.loads(checkpoint_path.read_text())[str(log_file_path)]["offset"] == 5
+    await store.save_sent()
+    assert json.loads(checkpoint_path.read_text())[str(log_file_path)]["offset"] == 10
+
+
+def _log_event():
+    yaml_string = """
+      name: "log_event"
+      regexes:
+        - '.*'
+      targets:
+        - type: elasticsearch
+          config:
+            index: "index"
+    """
+    return LogMonitorEvent(**yaml.safe_load(yaml_string))
+
+
+async def _run_monitor(monitor):
+    task = asyncio.create_task(monitor.start_monitoring())
+    await asyncio.sleep(0.1)
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+
+@pytest.mark.asyncio
+async def test_log_monitor_resumes_from_checkpoint(tmp_path):
+    log_file_path = tmp_path / "log.txt"
+    log_file_path.write_text("log_line: 1\n")
+    store = CheckpointStore(tmp_path / "checkpoints.json")
+
+    es_mock = AsyncMock()
+    await _run_monitor(
+        LogMonitor(log_file_path, [_log_event()], es_mock, checkpoints=store)
+    )
+    store.save()
+
+    with open(log_file_path, "a") as file:
+        file.write("log_line: 2\n")
+
+    es_mock = AsyncMock()
+    store = CheckpointStore(tmp_path / "checkpoints.json")
+    await _run_monitor(
+        LogMonitor(log_file_path, [_log_event()], es_mock, checkpoints=store)
+    )
+
+    assert es_mock.index.call_count == 1
+    assert es_mock.index.call_args.kwargs["document"]["line"] == "log_line: 2\n"
+
+
+@pytest.mark.asyncio
+async def test_log_monitor_start_at_end(tmp_path):
+    log_file_path = tmp_path / "log.txt"
+    log_file_path.write_text("log_line: 1\n")
+
+    es_mock = AsyncMock()
+    monitor = LogMonitor(
+        log_file_path, [_log_event()], es_mock, start_position=StartPosition.END
+    )
+    task = asyncio.create_task(monitor.start_monitoring())
+    await asyncio.sleep(0.05)
+    with open(log_file_path, "a") as file:
+        file.write("log_line: 2\n")
+    await asyncio.sleep(0.05)
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+    assert es_mock.index.call_count == 1
+    assert es_mock.index.call_args.kwargs["document"]["line"] == "log_line: 2\n"
+
+
+@pytest.mark.asyncio
+async def test_log_monitor_holds_checkpoint_at_pending_event(tmp_path):
+    log_file_path = tmp_path / "log.txt"
+    log_file_path.write_text("before\n")
+    store = CheckpointStore(tmp_path / "checkpoints.json")
+    event = _log_event().model_dump()
+    event["regexes"] = ["^Traceback"]
+    event["multiline"] = MultilineConfig(end="never", flush_timeout=60).model_dump()
+    monitor = LogMonitor(
+        log_file_path, [LogMonitorEvent(**event)], AsyncMock(), checkpoints=store
+    )
+
+    task = asyncio.create_task(monitor.start_monitoring())
+    await asyncio.sleep(0.05)
+    with open(log_file_path, "a") as file:
+        file.write("Traceback\n")
+    await asyncio.sleep(0.05)
+    with open(log_file_path, "a") as file:
+        file.write("  at line 1\n")
+    await asyncio.sleep(0.05)
+
+    # The pending event is read again after a crash
+    assert store.get(str(log_file_path))["offset"] == len("before\n")
+    monitor.stop_monitoring()
+    await asyncio.wait_for(task, 1)
+    assert store.get(str(log_file_path))["offset"] == log_file_path.stat().st_size
@@ -1,10 +1,17 @@
 import asyncio
+import os
+import random
+import sys
+import time
+from pathlib import Path
 from unittest.mock import AsyncMock
 
 import pytest
 import yaml
 
 from components.command_monitor.monitor import CommandMonitor
+from components.command_monitor.output import LineSplitter, OutputCapture
+from components.command_monitor.scheduler import CommandScheduler
 from model import CmdMonitorEvent
 
 
@@ -57,3 +64,290 @@ async def test_cmd_monitoring(tmp_path):
         assert es_document["chdir"] == expected_chdir
         assert es_document["stdout"] == expected_file_content
         assert es_document["stderr"] == expected_stderr
+
+
+class _SleepingMonitor(CommandMonitor):
+    """Sleeps instead of running the command, and records the runs."""
+
+    def __init__(self, event: CmdMonitorEvent, duration: float, log: list) -> None:
+        super().__init__(event, AsyncMock())
+        self.duration = duration
+        self.log = log
+        self.starts: list[float] = []
+        self.cancelled = 0
+
+    async def _execute_command(self) -> None:
+        self.starts.append(time.monotonic())
+        self.log.append(("start", self.event.name))
+        try:
+            await asyncio.sleep(self.duration)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.log.append(("end", self.event.name))
+
+
+def _event(name: str = "cmd", **options) -> CmdMonitorEvent:
+    return CmdMonitorEvent(name=name, command="true", targets=[], **options)
+
+
+async def _run_scheduler(scheduler: CommandScheduler, duration: float) -> None:
+    task = asyncio.create_task(scheduler.start_monitoring())
+    await asyncio.sleep(duration)
+    scheduler.stop_monitoring()
+    await asyncio.wait_for(task, 2)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "overlap, expected_second_start",
+    [("skip", 0.3), ("queue", 0.25)],
+)
+async def test_scheduler_overlap(overlap, expected_second_start):
+    monitor = _SleepingMonitor(_event(repeat=0.1, overlap=overlap), 0.25, [])
+    scheduler = CommandScheduler([monitor], None)
+    await _run_scheduler(scheduler, 0.45)
+
+    first, second, *_ = monitor.starts
+    assert second - first == pytest.approx(expected_second_start, abs=0.04)
+
+
+@pytest.mark.asyncio
+async def test_scheduler_overlap_kill():
+    monitor = _SleepingMonitor(_event(repeat=0.1, overlap="kill"), 10, [])
+    scheduler = CommandScheduler([monitor], None)
+    task = asyncio.create_task(scheduler.start_monitoring())
+    await asyncio.sleep(0.25)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert len(monitor.starts) == 3
+    # Killed by the next run, the last one when the scheduler was cancelled
+    assert monitor.cancelled == 3
+
+
+@pytest.mark.asyncio
+async def test_scheduler_concurrency_limit():
+    log = []
+    monitors = [
+        _SleepingMonitor(_event(f"cmd{index}"), 0.05, log) for index in range(3)
+    ]
+    scheduler = CommandScheduler(monitors, None, max_concurrent=1)
+    await asyncio.wait_for(scheduler.start_monitoring(), 2)
+
+    # Runs never overlap
+    assert [kind for kind, _ in log] == ["start", "end"] * 3
+
+
+@pytest.mark.asyncio
+async def test_scheduler_fixed_rate_and_jitter():
+    monitor = _SleepingMonitor(_event(repeat=0.1, jitter=0.05), 0.08, [])
+    scheduler = CommandScheduler([monitor], None, rng=random.Random(0))
+    await _run_scheduler(scheduler, 0.5)
+
+    # The duration of the runs does not delay the next ones
+    assert len(monitor.starts) >= 4
+    for index, start in enumerate(monitor.starts):
+        offset = start - monitor.starts[0] - index * 0.1
+        assert -0.05 - 0.02 < offset < 0.05 + 0.02
+
+
+@pytest.mark.asyncio
+async def test_scheduler_add_and_remove():
+    log = []
+    removed = _SleepingMonitor(_event("removed", repeat=0.1), 0.01, log)
+    last = _SleepingMonitor(_event("last"), 0.2, log)
+    scheduler = CommandScheduler([removed, last], None)
+    task = asyncio.create_task(scheduler.start_monitoring())
+    await asyncio.sleep(0.05)
+
+    scheduler.remove(removed)
+    assert scheduler.monitors == [last]
+    # No more runs are due, but a command added while the last run is running
+    # is still started
+    await asyncio.sleep(0.1)
+    added = _SleepingMonitor(_event("added"), 0.01, log)
+    scheduler.add(added)
+    await asyncio.wait_for(task, 2)
+
+    assert [name for kind, name in log if kind == "start"] == [
+        "removed",
+        "last",
+        "added",
+    ]
+    assert scheduler.monitors == [last, added]
+    assert not scheduler._running
+
+
+@pytest.mark.asyncio
+async def test_cmd_timeout_kills_process_group(tmp_path):
+    pid_file = tmp_path / "pid"
+    cmd_event = CmdMonitorEvent(
+        name="hanging",
+        command=f"sleep 30 & echo $! > {pid_file}; wait",
+        timeout=0.3,
+        targets=[{"type": "elasticsearch", "config": {"index": "index"}}],
+    )
+    es_mock = AsyncMock()
+    monitor = CommandMonitor(cmd_event, es_mock)
+
+    await asyncio.wait_for(monitor.start_monitoring(), 5)
+
+    document = es_mock.index.call_args.kwargs["document"]
+    assert document["timed_out"] is True
+    # The background process has been killed as well
+    pid = int(pid_file.read_text())
+    await asyncio.sleep(0.1)
+    try:
+        state = (Path("/proc") / str(pid) / "stat").read_text().split()[2]
+    except FileNotFoundError:
+        state = None
+    # Gone, or a zombie if nothing reaps orphans
+    assert state in (None, "Z")
+
+
+def test_output_capture_head_and_tail():
+    capture = OutputCapture(head_bytes=4, tail_bytes=4)
+    for chunk in (b"ab", b"cdef", b"ghijk", b"lm"):
+        capture.feed(chunk)
+    assert capture.total == 13
+    assert capture.truncated
+    assert capture.text() == "abcd\n[... 5 bytes truncated ...]\njklm"
+
+    capture = OutputCapture(head_bytes=4, tail_bytes=4)
+    capture.feed(b"abcdefgh")
+    assert not capture.truncated
+    assert capture.text() == "abcdefgh"
+
+
+def test_line_splitter():
+    splitter = LineSplitter(max_line_bytes=4)
+    assert splitter.feed(b"ab\nc") == ["ab\n"]
+    assert splitter.feed(b"d\nefghij") == ["cd\n", "efgh"]
+    assert splitter.flush() == ["ij"]
+    assert splitter.flush() == []
+
+
+@pytest.mark.asyncio
+async def test_cmd_output_is_bounded_and_parsed():
+    cmd_event = CmdMonitorEvent(**yaml.safe_load("""
+      name: "cmd event"
+      command: "seq 1 100000; echo 'status: failed' >&2"
+      output:
+        head_bytes: 8
+        tail_bytes: 7
+      line_events:
+        - name: "status"
+          regexes:
+            - 'status: (?P<status>\\w+)'
+          targets:
+            - type: elasticsearch
+              config:
+                index: "status"
+        - name: "round numbers"
+          regexes:
+            - '^(?P<number>\\d+0000)$'
+      targets:
+        - type: elasticsearch
+          config:
+            index: "index"
+    """))
+    es_mock = AsyncMock()
+    monitor = CommandMonitor(cmd_event, es_mock)
+
+    await monitor._execute_command()
+
+    documents = {}
+    for call in es_mock.index.call_args_list:
+        documents.setdefault(call.kwargs["index"], []).append(call.kwargs["document"])
+    (status,) = documents["status"]
+    line_events, (document,) = documents["index"][:-1], documents["index"][-1:]
+    assert [event["number"] for event in line_events] == [
+        str(number) for number in range(10000, 100001, 10000)
+    ]
+    assert status["status"] == "failed"
+    assert status["line"] == "status: failed"
+    assert status["name"] == "cmd event"
+    assert status["line_event"] == "status"
+    assert status["stream"] == "stderr"
+    assert line_events[0]["line"] == "10000"
+    assert line_events[0]["line_event"] == "round numbers"
+    assert line_events[0]["stream"] == "stdout"
+    # Links the line events to the document of their run
+    assert status["run_id"] == line_events[0]["run_id"] == document["run_id"]
+    assert document["stdout_bytes"] == 588895
+    assert document["stdout_truncated"]
+    assert (
+        document["stdout"] == "1\n2\n3\n4\n\n[... 588880 bytes truncated ...]\n100000\n"
+    )
+    assert document["stderr"] == "status: failed\n"
+    assert not document["stderr_truncated"]
+    assert "line_events" not in document
+
+
+@pytest.mark.asyncio
+async def test_cmd_exec_mode(tmp_path):
+    cmd_event = CmdMonitorEvent(
+        name="exec",
+        command=[
+            sys.executable,
+            "-c",
+            "import os; print(os.getcwd(), os.environ['GREETING'], os.nice(0))",
+        ],
+        chdir=str(tmp_path),
+        env={"GREETING": "hello world"},
+        nice=5,
+        ionice_class="idle",
+        targets=[{"type": "elasticsearch", "config": {"index": "index"}}],
+    )
+    es_mock = AsyncMock()
+    monitor = CommandMonitor(cmd_event, es_mock)
+
+    await monitor._execute_command()
+
+    document = es_mock.index.call_args.kwargs["document"]
+    assert document["stdout"] == f"{tmp_path} hello world {os.nice(0) + 5}\n"
+    assert document["command"] == cmd_event.command
+    # The execution and scheduling settings are not saved
+    assert set(document) == {
+        "name",
+        "command",
+        "repeat",
+        "chdir",
+        "stdout",
+        "stderr",
+        "stdout_bytes",
+        "stderr_bytes",
+        "stdout_truncated",
+        "stderr_truncated",
+        "timed_out",
+        "run_id",
+        "created_at",
+    }
+
+
+@pytest.mark.asyncio
+async def test_cmd_shell_mode_with_priority(tmp_path):
+    cmd_event = CmdMonitorEvent(
+        name="shell",
+        command="echo $GREETING; pwd",
+        chdir=str(tmp_path),
+        env={"GREETING": "hello"},
+        nice=1,
+        targets=[{"type": "elasticsearch", "config": {"index": "index"}}],
+    )
+    es_mock = AsyncMock()
+    await CommandMonitor(cmd_event, es_mock)._execute_command()
+
+    document = es_mock.index.call_args.kwargs["document"]
+    assert document["stdout"] == f"hello\n{tmp_path}\n"
+
+
+@pytest.mark.parametrize(
+    "options", [{"command": []}, {"nice": 20}, {"ionice_level": 8}]
+)
+def test_cmd_event_validation(options):
+    with pytest.raises(ValueError):
+        CmdMonitorEvent(**{"name": "cmd", "command": "true", "targets": [], **options})
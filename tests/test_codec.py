@@ -0,0 +1,83 @@
+import json
+import math
+from datetime import date, datetime
+from unittest.mock import AsyncMock
+
+import pytest
+import yaml
+from elasticsearch.serializer import JsonSerializer
+
+from components.collector import collectors
+from components.log_monitor.monitor import LogMonitor
+from components.sink import codec
+from model import LogMonitorEvent
+
+CODECS = [codec.JsonCodec()]
+if codec.orjson is not None:
+    CODECS.append(codec.OrjsonCodec())
+if codec.msgspec is not None:
+    CODECS.append(codec.MsgspecCodec())
+
+DOCUMENTS = [
+    {"line": "ERROR: broken\n", "pattern": "ERROR: (?P<message>.+)", "message": "x"},
+    {"created_at": datetime(2024, 1, 2, 3, 4, 5), "day": date(2024, 1, 2)},
+    {"created_at": datetime(2024, 1, 2, 3, 4, 5, 120)},
+    {"unicode": "äöü ✓  ", "nested": {"list": [1, 2.5, None, True]}},
+    {"big": 2**70, "negative": -(2**70)},
+    {1: "integer key", None: "null key"},
+]
+
+
+@pytest.mark.parametrize("json_codec", CODECS, ids=lambda c: c.name)
+@pytest.mark.parametrize("document", DOCUMENTS)
+def test_codec_dumps_like_elasticsearch_client(json_codec, document):
+    expected = json.dumps(
+        document,
+        default=lambda value: value.isoformat(),
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    assert json_codec.dumps(document) == expected.encode()
+
+
+@pytest.mark.parametrize("json_codec", CODECS, ids=lambda c: c.name)
+def test_codec_loads(json_codec):
+    data = '{"key": "value", "number": 1, "big": 100000000000000000000000}'
+    assert json_codec.loads(data) == json.loads(data)
+    # Not valid json, but accepted by the standard library
+    assert math.isnan(json_codec.loads('{"value": NaN}')["value"])
+    with pytest.raises(ValueError):
+        json_codec.loads("{broken")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("json_codec", CODECS, ids=lambda c: c.name)
+async def test_codec_dumps_monitor_documents_like_serializer(json_codec, tmp_path):
+    log_event = LogMonitorEvent(**yaml.safe_load("""
+          name: "json_event"
+          regexes:
+            - '^(?P<json>{.*})$'
+          timestamp:
+            group: time
+            field: "@timestamp"
+          targets:
+            - type: elasticsearch
+              config:
+                index: "index"
+        """))
+    es_mock = AsyncMock()
+    monitor = LogMonitor("log.txt", [log_event], es_mock)
+    for values in [
+        '"seconds": 0.00001, "bytes": 1e16, "ratio": 0.25',
+        '"seconds": 1.5e-7, "bytes": 12345678901234567890, "ratio": 1e-4',
+        '"seconds": 100.0, "bytes": -2.5e300, "id": "3e4f-0.0000"',
+    ]:
+        line = f'{{"time": "2024-10-18T12:34:56.789+02:00", {values}}}\n'
+        await monitor._retrieve_line_event(line)
+    documents = [call.kwargs["document"] for call in es_mock.index.call_args_list]
+    (tmp_path / "loadavg").write_text("0.00 0.01 12.50 2/345 6789\n")
+    documents.append(collectors.read_loadavg(str(tmp_path)))
+
+    serializer = JsonSerializer()
+    for document in documents:
+        assert json_codec.dumps(document) == serializer.dumps(document)
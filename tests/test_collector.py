@@ -0,0 +1,150 @@
+import asyncio
+import threading
+from unittest.mock import AsyncMock
+
+import pytest
+import yaml
+
+from components.collector import collectors
+from components.collector.monitor import CollectorMonitor
+from model import CollectorConfig
+
+
+@pytest.fixture
+def proc(tmp_path):
+    (tmp_path / "meminfo").write_text(
+        "MemTotal:       16384000 kB\n"
+        "MemAvailable:    8192000 kB\n"
+        "HugePages_Total:       0\n"
+    )
+    (tmp_path / "vmstat").write_text("nr_free_pages 2048\npgmajfault 12\noom_kill 3\n")
+    (tmp_path / "loadavg").write_text("0.52 0.58 0.59 2/1234 56789\n")
+    (tmp_path / "pressure").mkdir()
+    (tmp_path / "pressure" / "memory").write_text(
+        "some avg10=1.50 avg60=0.25 avg300=0.00 total=123456\n"
+        "full avg10=0.00 avg60=0.00 avg300=0.00 total=42\n"
+    )
+    (tmp_path / "self").mkdir()
+    (tmp_path / "self" / "mounts").write_text(
+        "/dev/sda1 / ext4 rw,relatime 0 0\n"
+        "proc /proc proc rw 0 0\n"
+        "/dev/sda1 /var/lib/docker ext4 rw 0 0\n"
+        f"/dev/sdb1 {tmp_path}/with\\040space ext4 rw 0 0\n"
+        f"overlay {tmp_path}/merged overlay rw 0 0\n"
+        f"tmpfs {tmp_path}/run tmpfs rw 0 0\n"
+        f"tmpfs {tmp_path}/shm tmpfs rw 0 0\n"
+        "cgroup2 /sys/fs/cgroup cgroup2 rw 0 0\n"
+    )
+    return str(tmp_path)
+
+
+def test_read_meminfo(proc):
+    assert collectors.read_meminfo(proc) == {
+        "MemTotal": 16384000 * 1024,
+        "MemAvailable": 8192000 * 1024,
+        "HugePages_Total": 0,
+    }
+    assert collectors.read_meminfo(proc, ["MemAvailable", "Unknown"]) == {
+        "MemAvailable": 8192000 * 1024
+    }
+
+
+def test_read_vmstat_and_loadavg(proc):
+    assert collectors.read_vmstat(proc, ["oom_kill"]) == {"oom_kill": 3}
+    assert collectors.read_loadavg(proc) == {
+        "load1": 0.52,
+        "load5": 0.58,
+        "load15": 0.59,
+        "tasks_running": 2,
+        "tasks_total": 1234,
+    }
+
+
+def test_read_pressure(proc):
+    assert collectors.read_pressure(proc) == {
+        "memory": {
+            "some": {"avg10": 1.5, "avg60": 0.25, "avg300": 0.0, "total": 123456},
+            "full": {"avg10": 0.0, "avg60": 0.0, "avg300": 0.0, "total": 42},
+        }
+    }
+
+
+def test_read_disk_usage(proc, tmp_path):
+    assert collectors.read_mounts(proc) == [
+        ("/dev/sda1", "/", "ext4"),
+        ("/dev/sdb1", f"{tmp_path}/with space", "ext4"),
+        # The root of a container, and memory file systems
+        ("overlay", f"{tmp_path}/merged", "overlay"),
+        ("tmpfs", f"{tmp_path}/run", "tmpfs"),
+        ("tmpfs", f"{tmp_path}/shm", "tmpfs"),
+    ]
+    # Only the first mount point exists
+    (document,) = collectors.read_disk_usage(proc=proc)
+    assert document["mount"] == "/"
+    assert document["device"] == "/dev/sda1"
+    assert 0 < document["used_bytes"] <= document["total_bytes"]
+    assert 0 <= document["used_percent"] <= 100
+
+    (document,) = collectors.read_disk_usage([str(tmp_path)], proc)
+    assert document["mount"] == str(tmp_path)
+    assert document["device"] is None
+
+
+@pytest.mark.asyncio
+async def test_collector_monitor(proc):
+    config = CollectorConfig(**yaml.safe_load("""
+      name: "oom"
+      type: vmstat
+      interval: 60
+      fields: [oom_kill]
+      targets:
+        - type: elasticsearch
+          config:
+            index: "index"
+    """))
+    es_mock = AsyncMock()
+    monitor = CollectorMonitor(config, es_mock, proc=proc)
+
+    task = asyncio.create_task(monitor.start_monitoring())
+    await asyncio.sleep(0.05)
+    monitor.stop_monitoring()
+    await asyncio.wait_for(task, 1)
+
+    document = es_mock.index.call_args.kwargs["document"]
+    assert document["name"] == "oom"
+    assert document["type"] == "vmstat"
+    assert document["oom_kill"] == 3
+    assert "created_at" in document
+
+
+@pytest.mark.asyncio
+async def test_collector_skips_blocked_disk_usage(proc, monkeypatch):
+    config = CollectorConfig(**yaml.safe_load("""
+      name: "disk"
+      type: disk
+      interval: 0.05
+      targets:
+        - type: elasticsearch
+          config:
+            index: "index"
+    """))
+    unblocked = threading.Event()
+    calls = []
+
+    def read_disk_usage(mounts, proc):
+        calls.append(mounts)
+        unblocked.wait(1)
+        return [{"mount": "/"}]
+
+    monkeypatch.setattr(collectors, "read_disk_usage", read_disk_usage)
+    monitor = CollectorMonitor(config, AsyncMock(), proc=proc)
+
+    # Gives up after one interval, and does not read again while still blocked
+    assert await monitor.collect() == []
+    assert await monitor.collect() == []
+    assert len(calls) == 1
+
+    unblocked.set()
+    await asyncio.sleep(0.05)
+    assert await monitor.collect() == [{"mount": "/"}]
+    assert len(calls) == 2
@@ -0,0 +1,236 @@
+import asyncio
+import os
+from unittest.mock import AsyncMock
+
+import pytest
+import yaml
+
+from components.log_monitor.checkpoint import CheckpointStore
+from components.log_monitor.discovery import LogFileDiscovery
+from components.log_monitor.monitor import LogMonitor
+from model import LogMonitorConfig, LogMonitorEvent
+
+
+def _log_event():
+    yaml_string = """
+      name: "log_event"
+      regexes:
+        - '.*'
+      targets:
+        - type: elasticsearch
+          config:
+            index: "index"
+    """
+    return LogMonitorEvent(**yaml.safe_load(yaml_string))
+
+
+def _indexed_lines(es_mock):
+    return [call.kwargs["document"]["line"] for call in es_mock.index.call_args_list]
+
+
+async def _cancel(task):
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+
+@pytest.mark.asyncio
+async def test_log_monitor_follows_rename_rotation(tmp_path):
+    log_file_path = tmp_path / "log.txt"
+    log_file_path.write_text("log_line: 1\n")
+    es_mock = AsyncMock()
+    task = asyncio.create_task(
+        LogMonitor(log_file_path, [_log_event()], es_mock).start_monitoring()
+    )
+    await asyncio.sleep(0.05)
+
+    with open(log_file_path, "a") as file:
+        os.rename(log_file_path, tmp_path / "log.txt.1")
+        # Written to the old file after it has been renamed
+        file.write("log_line: 2\n")
+    log_file_path.write_text("log_line: 3\n")
+    await asyncio.sleep(0.1)
+    await _cancel(task)
+
+    assert _indexed_lines(es_mock) == [
+        "log_line: 1\n",
+        "log_line: 2\n",
+        "log_line: 3\n",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_log_monitor_follows_copytruncate(tmp_path):
+    log_file_path = tmp_path / "log.txt"
+    log_file_path.write_text("log_line: 1\n")
+    es_mock = AsyncMock()
+    task = asyncio.create_task(
+        LogMonitor(log_file_path, [_log_event()], es_mock).start_monitoring()
+    )
+    await asyncio.sleep(0.05)
+
+    log_file_path.write_text("")
+    await asyncio.sleep(0.05)
+    with open(log_file_path, "a") as file:
+        file.write("log_line: 2\n")
+    await asyncio.sleep(0.05)
+    await _cancel(task)
+
+    assert _indexed_lines(es_mock) == ["log_line: 1\n", "log_line: 2\n"]
+
+
+@pytest.mark.asyncio
+async def test_log_monitor_ends_for_deleted_file(tmp_path):
+    log_file_path = tmp_path / "log.txt"
+    log_file_path.write_text("log_line: 1\n")
+    task = asyncio.create_task(
+        LogMonitor(log_file_path, [_log_event()], AsyncMock()).start_monitoring()
+    )
+    await asyncio.sleep(0.05)
+
+    log_file_path.unlink()
+    await asyncio.wait_for(task, 1)
+
+
+@pytest.mark.asyncio
+async def test_discovery_picks_up_new_files(tmp_path):
+    (tmp_path / "first.log").write_text("first: 1\n")
+    config = LogMonitorConfig(path=f"{tmp_path}/*.log", events=[_log_event()])
+    es_mock = AsyncMock()
+    discovery = LogFileDiscovery([config], es_mock, rescan_interval=10)
+    task = asyncio.create_task(discovery.start_monitoring())
+    await asyncio.sleep(0.05)
+    assert len(discovery.monitors) == 1
+
+    (tmp_path / "second.log").write_text("second: 1\n")
+    (tmp_path / "ignored.txt").write_text("ignored: 1\n")
+    await asyncio.sleep(0.1)
+    assert len(discovery.monitors) == 2
+
+    (tmp_path / "first.log").unlink()
+    await asyncio.sleep(0.1)
+    assert list(discovery.monitors) == [str(tmp_path / "second.log")]
+
+    await _cancel(task)
+    assert sorted(_indexed_lines(es_mock)) == ["first: 1\n", "second: 1\n"]
+
+
+@pytest.mark.asyncio
+async def test_discovery_reconfigure(tmp_path):
+    for name in ("a", "b", "c"):
+        (tmp_path / f"{name}.log").write_text(f"{name}: 1\n")
+    configs = [
+        LogMonitorConfig(path=f"{tmp_path}/{name}.log", events=[_log_event()])
+        for name in ("a", "b", "c")
+    ]
+    es_mock = AsyncMock()
+    discovery = LogFileDiscovery(configs, es_mock, rescan_interval=10)
+    task = asyncio.create_task(discovery.start_monitoring())
+    await asyncio.sleep(0.05)
+    monitors = dict(discovery.monitors)
+
+    event = LogMonitorEvent(
+        **{**_log_event().model_dump(), "regexes": ["(?P<file>a): .*"]}
+    )
+    discovery.reconfigure(
+        [
+            # Removed c, changed the events of a and another setting of b
+            configs[1].model_copy(update={"chunk_size": 1024}),
+            configs[0].model_copy(update={"events": [event]}),
+        ]
+    )
+    for name in ("a", "b", "c"):
+        with open(tmp_path / f"{name}.log", "a") as file:
+            file.write(f"{name}: 2\n")
+    await asyncio.sleep(0.1)
+
+    a, b = str(tmp_path / "a.log"), str(tmp_path / "b.log")
+    assert sorted(discovery.monitors) == [a, b]
+    assert discovery.monitors[a] is monitors[a]
+    assert discovery.monitors[b].chunk_size == 1024
+    await _cancel(task)
+
+    documents = [call.kwargs["document"] for call in es_mock.index.call_args_list]
+    # The restarted monitor continued at the offset of its predecessor
+    assert sorted(document["line"] for document in documents) == [
+        "a: 1\n",
+        "a: 2\n",
+        "b: 1\n",
+        "b: 2\n",
+        "c: 1\n",
+    ]
+    assert [
+        document.get("file") for document in documents if "a" in document["line"]
+    ] == [
+        None,
+        "a",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_discovery_shares_monitor_between_configs(tmp_path):
+    log_file_path = tmp_path / "app.log"
+    log_file_path.write_text("line: 1\nother: 1\n")
+    os.symlink(log_file_path, tmp_path / "current")
+    other_event = LogMonitorEvent(
+        **{
+            **_log_event().model_dump(),
+            "name": "other",
+            "targets": [{"type": "elasticsearch", "config": {"index": "other"}}],
+        }
+    )
+    configs = [
+        LogMonitorConfig(
+            path=f"{tmp_path}/*.log",
+            events=[
+                LogMonitorEvent(**{**_log_event().model_dump(), "regexes": ["line"]})
+            ],
+        ),
+        LogMonitorConfig(path=f"{tmp_path}/current", events=[other_event]),
+    ]
+    es_mock = AsyncMock()
+    discovery = LogFileDiscovery(configs, es_mock, rescan_interval=10)
+    task = asyncio.create_task(discovery.start_monitoring())
+    await asyncio.sleep(0.05)
+
+    # One reader for both configs, each event saved to the targets of its config
+    assert list(discovery.monitors) == [str(log_file_path)]
+    monitor = discovery.monitors[str(log_file_path)]
+    assert [event.name for event in monitor.events] == ["log_event", "other"]
+    assert monitor.groups == [0, 1]
+    await _cancel(task)
+    # Lines are matched against the events of both configs
+    assert [
+        (call.kwargs["index"], call.kwargs["document"]["line"])
+        for call in es_mock.index.call_args_list
+    ] == [("index", "line: 1\n"), ("other", "line: 1\n"), ("other", "other: 1\n")]
+
+
+@pytest.mark.asyncio
+async def test_discovery_uses_checkpoint_of_symlink(tmp_path):
+    (tmp_path / "pods").mkdir()
+    log_file_path = tmp_path / "pods" / "app.log"
+    log_file_path.write_text("line: 1\n")
+    (tmp_path / "containers").mkdir()
+    symlink = tmp_path / "containers" / "app.log"
+    os.symlink(log_file_path, symlink)
+    # Saved for the path of the symlink by earlier versions
+    checkpoints = CheckpointStore(tmp_path / "checkpoints.json")
+    checkpoints.update(str(symlink), os.stat(log_file_path), len("line: 1\n"))
+    with open(log_file_path, "a") as file:
+        file.write("line: 2\n")
+
+    es_mock = AsyncMock()
+    configs = [
+        LogMonitorConfig(path=f"{tmp_path}/containers/*.log", events=[_log_event()])
+    ]
+    discovery = LogFileDiscovery(configs, es_mock, checkpoints=checkpoints)
+    task = asyncio.create_task(discovery.start_monitoring())
+    await asyncio.sleep(0.05)
+    await _cancel(task)
+
+    assert _indexed_lines(es_mock) == ["line: 2\n"]
+    assert checkpoints.get(str(symlink)) is None
+    assert checkpoints.get(str(log_file_path))["offset"] == len("line: 1\nline: 2\n")
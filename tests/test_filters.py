@@ -0,0 +1,130 @@
+import random
+from unittest.mock import AsyncMock
+
+import pytest
+import yaml
+
+from components.log_monitor.filters import Deduplicator, EventFilter, TokenBucket
+from components.log_monitor.monitor import LogMonitor
+from model import (
+    DedupConfig,
+    FilterConfig,
+    LogMonitorEvent,
+    RateLimitConfig,
+    TimestampConfig,
+)
+
+
+def test_deduplicator_counts_repeats():
+    dedup = Deduplicator(DedupConfig(window=10.0))
+    assert dedup.check({"message": "a", "line": "1 a"}, 0.0)
+    assert not dedup.check({"message": "a", "line": "2 a"}, 1.0)
+    assert not dedup.check({"message": "a", "line": "3 a"}, 2.0)
+    assert dedup.check({"message": "b", "line": "4 b"}, 3.0)
+    assert dedup.deadline() == 10.0
+    assert dedup.expired(9.0) == []
+
+    assert dedup.expired(10.0) == [{"message": "a", "line": "3 a", "repeat_count": 2}]
+    # Windows without repeats end silently
+    assert dedup.expired(13.0) == []
+    assert dedup.deadline() is None
+    assert dedup.check({"message": "a", "line": "5 a"}, 14.0)
+
+
+def test_deduplicator_fields_and_ignored():
+    dedup = Deduplicator(DedupConfig(fields=["message"]))
+    assert dedup.check({"message": "a", "level": "ERROR"}, 0.0)
+    assert not dedup.check({"message": "a", "level": "WARN"}, 0.0)
+
+    dedup = Deduplicator(DedupConfig(), ignored=("time",))
+    assert dedup.check({"message": "a", "time": "12:00"}, 0.0)
+    assert not dedup.check({"message": "a", "time": "12:01"}, 0.0)
+
+
+def test_deduplicator_is_bounded():
+    dedup = Deduplicator(DedupConfig(max_keys=2))
+    for message in ("a", "a", "b", "c"):
+        dedup.check({"message": message}, 0.0)
+    assert len(dedup._windows) == 2
+    # The window of "a" ended early
+    assert dedup.deadline() == 0.0
+    assert dedup.expired(0.0) == [{"message": "a", "repeat_count": 1}]
+    assert dedup.expired() == []
+
+
+def test_token_bucket():
+    bucket = TokenBucket(RateLimitConfig(rate=2.0, burst=3.0))
+    assert [bucket.take(0.0) for _ in range(4)] == [True, True, True, False]
+    assert bucket.take(0.5)
+    assert not bucket.take(0.5)
+    # Never more than the burst
+    assert [bucket.take(100.0) for _ in range(4)] == [True, True, True, False]
+
+
+def test_event_filter():
+    config = FilterConfig(exclude=["health"], sample=0.5)
+    filters = EventFilter(config, rng=random.Random(0))
+    assert filters.check({"line": "GET /health"}, 0.0) == "excluded"
+
+    reasons = [filters.check({"line": "GET /"}, 0.0) for _ in range(1000)]
+    assert 400 < reasons.count(None) < 600
+    assert set(reasons) == {None, "sampled"}
+
+    document = {"line": "GET /"}
+    while filters.check(document, 0.0) is not None:
+        pass
+    assert document["sample_rate"] == 0.5
+
+
+def test_event_filter_ignores_timestamps():
+    filters = EventFilter(
+        FilterConfig(dedup={}, rate_limit={"rate": 1}),
+        TimestampConfig(group="time", field="@timestamp"),
+    )
+    assert filters.check({"time": "1", "@timestamp": "1", "message": "a"}, 0.0) is None
+    assert filters.check({"time": "2", "@timestamp": "2", "message": "a"}, 0.0) == (
+        "duplicate"
+    )
+    # Duplicates do not count towards the rate limit
+    assert filters.check({"message": "b"}, 0.0) == "rate_limited"
+
+
+@pytest.mark.parametrize(
+    "config",
+    [{"sample": 0}, {"sample": 1.5}, {"dedup": {"window": 0}}, {"rate_limit": {}}],
+)
+def test_filter_config_validation(config):
+    with pytest.raises(ValueError):
+        FilterConfig(**config)
+
+
+@pytest.mark.asyncio
+async def test_log_monitor_filters_events():
+    log_event = LogMonitorEvent(**yaml.safe_load("""
+          name: "error_event"
+          regexes:
+            - '^\\d+ ERROR: (?P<message>.+)'
+          filters:
+            exclude:
+              - 'ignored'
+            dedup:
+              window: 60
+          targets:
+            - type: elasticsearch
+              config:
+                index: "index"
+        """))
+    es_mock = AsyncMock()
+    monitor = LogMonitor("log.txt", [log_event], es_mock)
+
+    await monitor._retrieve_line_event("1 ERROR: broken\n")
+    await monitor._retrieve_line_event("2 ERROR: broken\n")
+    await monitor._retrieve_line_event("3 ERROR: broken\n")
+    await monitor._retrieve_line_event("4 ERROR: ignored\n")
+    assert es_mock.index.call_count == 1
+    assert monitor._deadline() is not None
+
+    await monitor._flush_windows()
+    documents = [call.kwargs["document"] for call in es_mock.index.call_args_list]
+    assert documents[1]["line"] == "3 ERROR: broken\n"
+    assert documents[1]["repeat_count"] == 2
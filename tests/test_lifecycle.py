@@ -0,0 +1,140 @@
+import asyncio
+import json
+import os
+import signal
+from unittest.mock import AsyncMock
+
+import pytest
+import yaml
+
+from components.command_monitor.monitor import CommandMonitor
+from components.log_monitor.checkpoint import CheckpointStore
+from components.log_monitor.monitor import LogMonitor
+from components.sink import bulk_sink
+from components.sink.bulk_sink import ElasticsearchBulkSink
+from components.sink.router import SinkRouter
+from components.sink.spool import DiskSpool
+from lifecycle import Lifecycle
+from model import CmdMonitorEvent, LogMonitorEvent
+
+
+class FakeBulk:
+    def __init__(self) -> None:
+        self.documents = []
+
+    async def __call__(self, client, actions, expand_action_callback, **kwargs):
+        for action in actions:
+            self.documents.append(json.loads(expand_action_callback(action)[1]))
+        for _ in []:
+            yield
+
+
+class BlockedBulk:
+    def __init__(self) -> None:
+        self.requests = 0
+
+    async def __call__(self, client, actions, expand_action_callback, **kwargs):
+        self.requests += 1
+        await asyncio.Event().wait()
+        yield
+
+
+def _monitors(tmp_path, es_mock, sink, checkpoints):
+    log_event = LogMonitorEvent(**yaml.safe_load("""
+          name: "log_event"
+          regexes:
+            - '.*'
+          targets:
+            - type: elasticsearch
+              config:
+                index: "index"
+        """))
+    cmd_event = CmdMonitorEvent(**yaml.safe_load("""
+          name: "cmd_event"
+          command: "echo 1"
+          repeat: 60
+          targets:
+            - type: elasticsearch
+              config:
+                index: "index"
+        """))
+    return [
+        LogMonitor(
+            tmp_path / "log.txt", [log_event], es_mock, sink, checkpoints=checkpoints
+        ),
+        CommandMonitor(cmd_event, es_mock, sink),
+    ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("stop", ["method", "signal"])
+async def test_lifecycle_graceful_shutdown(tmp_path, monkeypatch, stop):
+    fake_bulk = FakeBulk()
+    monkeypatch.setattr(bulk_sink, "async_streaming_bulk", fake_bulk)
+    (tmp_path / "log.txt").write_text("log_line: 1\n")
+    es_mock = AsyncMock()
+    # Documents are only sent on shutdown
+    sink = SinkRouter(ElasticsearchBulkSink(es_mock, linger=60))
+    checkpoints = CheckpointStore(tmp_path / "checkpoints.json", interval=60)
+    lifecycle = Lifecycle(
+        _monitors(tmp_path, es_mock, sink, checkpoints), es_mock, sink, checkpoints
+    )
+
+    task = asyncio.create_task(lifecycle.run())
+    await asyncio.sleep(0.1)
+    assert fake_bulk.documents == []
+
+    if stop == "signal":
+        os.kill(os.getpid(), signal.SIGTERM)
+    else:
+        lifecycle.stop()
+    await asyncio.wait_for(task, 2)
+
+    assert sorted(document.get("line", "cmd") for document in fake_bulk.documents) == [
+        "cmd",
+        "log_line: 1\n",
+    ]
+    offsets = json.loads((tmp_path / "checkpoints.json").read_text())
+    assert offsets[str(tmp_path / "log.txt")]["offset"] == len("log_line: 1\n")
+    es_mock.close.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("spooled", [True, False])
+async def test_lifecycle_shutdown_timeout(tmp_path, monkeypatch, spooled):
+    blocked_bulk = BlockedBulk()
+    monkeypatch.setattr(bulk_sink, "async_streaming_bulk", blocked_bulk)
+    (tmp_path / "log.txt").write_text("log_line: 1\n")
+    es_mock = AsyncMock()
+    spool = DiskSpool(tmp_path / "spool") if spooled else None
+    bulk = ElasticsearchBulkSink(es_mock, linger=60, spool=spool)
+    sink = SinkRouter(bulk)
+    checkpoints = CheckpointStore(tmp_path / "checkpoints.json", interval=60)
+    lifecycle = Lifecycle(
+        _monitors(tmp_path, es_mock, sink, checkpoints)[:1],
+        es_mock,
+        sink,
+        checkpoints,
+        shutdown_timeout=0.2,
+    )
+
+    task = asyncio.create_task(lifecycle.run())
+    await asyncio.sleep(0.1)
+    lifecycle.stop()
+    await asyncio.wait_for(task, 2)
+
+    # The bulk request did not finish in time and was cancelled
+    assert blocked_bulk.requests == 1
+    assert bulk._task is None and not bulk._sends
+    es_mock.close.assert_awaited_once()
+    if spooled:
+        entries, _ = DiskSpool(tmp_path / "spool").read(10)
+        assert [json.loads(document)["line"] for _, document in entries] == [
+            "log_line: 1\n"
+        ]
+        offsets = json.loads((tmp_path / "checkpoints.json").read_text())
+        assert offsets[str(tmp_path / "log.txt")]["offset"] == len("log_line: 1\n")
+    else:
+        # The line is read again after a restart
+        assert not (tmp_path / "checkpoints.json").exists()
+        assert bulk.failed == 1
@@ -1,4 +1,5 @@
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import AsyncMock, MagicMock
 
 import pytest
@@ -48,3 +49,43 @@ async def test_log_monitoring(tmp_path):
     assert es_mock.index.call_count == 2
     assert es_mock.index.call_args_list[0].kwargs["document"]["line"] == "log_line: 1\n"
     assert es_mock.index.call_args_list[1].kwargs["document"]["line"] == "log_line: 2\n"
+
+
+@pytest.mark.asyncio
+async def test_log_monitoring_with_executor(tmp_path):
+    log_file_path = tmp_path / "log.txt"
+    yaml_string = """
+      name: "log_event"
+      regexes:
+        - 'log_line: (?P<number>\\d+)'
+      targets:
+        - type: elasticsearch
+          config:
+            index: "index"
+    """
+    log_event = LogMonitorEvent(**yaml.safe_load(yaml_string))
+    es_mock = AsyncMock()
+    log_file_path.write_text("".join(f"log_line: {i}\nnoise\n" for i in range(200)))
+
+    with ThreadPoolExecutor(2) as executor:
+        # Small chunks, so that several batches are in flight at once
+        monitor = LogMonitor(
+            log_file_path,
+            [log_event],
+            es_mock,
+            chunk_size=64,
+            executor=executor,
+            max_in_flight=2,
+        )
+        task = asyncio.create_task(monitor.start_monitoring())
+        for _ in range(100):
+            await asyncio.sleep(0.05)
+            if es_mock.index.call_count == 200:
+                break
+        monitor.stop_monitoring()
+        await asyncio.wait_for(task, 1)
+
+    numbers = [
+        call.kwargs["document"]["number"] for call in es_mock.index.call_args_list
+    ]
+    assert numbers == [str(i) for i in range(200)]
@@ -0,0 +1,108 @@
+import json
+
+import pytest
+
+from components.log_monitor.logparser import (
+    EventMatcher,
+    LogEventParser,
+    required_literals,
+)
+
+
+@pytest.mark.parametrize(
+    "pattern,expected",
+    [
+        (r"\[SMRT\] (?P<content>.*)", ("[SMRT] ",)),
+        (r"(?P<level>ERROR|CRITICAL): (?P<message>.+)$", ("ERROR", "CRITICAL")),
+        (r"json: (?P<json>\{.+:.+\})", ("json: {",)),
+        (r"\d+ actions executed. \d+ remote", (" actions executed",)),
+        (r"(abc)+x", ("abc",)),
+        (r".*", None),
+        (r"(?i)error", None),
+    ],
+)
+def test_required_literals(pattern, expected):
+    assert required_literals(pattern) == expected
+
+
+def _parsers():
+    return [
+        LogEventParser("smrt", [r"\[SMRT\] (?P<content>.*)"]),
+        LogEventParser("error", [r"(?P<level>ERROR|CRITICAL): (?P<message>.+)$"]),
+        LogEventParser("json", [r"json: (?P<json>\{.+:.+\})"]),
+        LogEventParser("number", [r"(?P<number>\d+)", r"(?P<word>\w+)"]),
+    ]
+
+
+@pytest.mark.parametrize(
+    "line",
+    [
+        "[SMRT] retry 1\n",
+        "ERROR: something broke\n",
+        'json: {"key": "value"}\n',
+        "x 42\n",
+        "word\n",
+        "CRITICAL: 5 [SMRT] both\n",
+        "12 ERROR: number first, error wins\n",
+        "   \n",
+    ],
+)
+def test_event_matcher_same_result_as_parse_line(line):
+    parsers = _parsers()
+    matcher = EventMatcher(parsers)
+
+    expected = None
+    for index, parser in enumerate(parsers):
+        if (result := parser.parse_line(line)) is not None:
+            expected = (index, result)
+            break
+
+    assert matcher.match(line) == expected
+
+
+def test_event_matcher_first_match_wins():
+    matcher = EventMatcher(_parsers())
+
+    index, result = matcher.match("CRITICAL: crash [SMRT] retry\n")
+
+    assert index == 0
+    assert result == {
+        "content": "retry",
+        "line": "CRITICAL: crash [SMRT] retry\n",
+        "pattern": r"\[SMRT\] (?P<content>.*)",
+    }
+
+
+def test_event_matcher_parses_json_group():
+    matcher = EventMatcher(_parsers())
+
+    index, result = matcher.match('json: {"key": "value", "number": 1}\n')
+
+    assert index == 2
+    assert result["key"] == "value"
+    assert result["number"] == 1
+    assert "json" not in result
+    assert json.loads(result["line"][len("json: ") :]) == {"key": "value", "number": 1}
+
+
+def test_event_matcher_without_combined_pattern():
+    # Duplicate group names can not be combined into one alternation
+    parsers = [
+        LogEventParser("a", [r"a(?P<value>\d)"]),
+        LogEventParser("b", [r"b(?P<value>\d)"]),
+    ]
+    matcher = EventMatcher(parsers)
+
+    assert matcher.match("b1 a2")[0] == 0
+    assert matcher.match("b1")[1]["value"] == "1"
+    assert matcher.match("c1") is None
+
+
+def test_event_matcher_times_the_search():
+    parser = LogEventParser("slow_search", [r"(?P<number>\d+)$"])
+    matcher = EventMatcher([parser])
+    parsed = parser._parse_seconds.sum
+
+    # Searching the long line takes far longer than parsing the match
+    assert matcher.match("x" * 2_000_000 + " 42")[1]["number"] == "42"
+    assert parser._parse_seconds.sum - parsed > 0.01
@@ -0,0 +1,125 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+import yaml
+
+from components.log_monitor.monitor import LogMonitor
+from components.metrics.metrics import MetricsRegistry
+from components.metrics.monitor import MetricsReporter, MetricsServer
+from model import LogMonitorEvent, Target
+
+
+def test_registry_render():
+    registry = MetricsRegistry()
+    counter = registry.counter("lines_total", "Lines read.", ("path",))
+    gauge = registry.gauge("queue", "Queue depth.")
+    histogram = registry.histogram("seconds", "Duration.", ("event",), (0.1, 1.0))
+
+    counter.labels('/tmp/"log".txt').inc(3)
+    gauge.labels().set_function(lambda: 7)
+    histogram.labels("event").observe(0.05)
+    histogram.labels("event").observe(0.5)
+
+    assert registry.render().splitlines() == [
+        "# HELP lines_total Lines read.",
+        "# TYPE lines_total counter",
+        'lines_total{path="/tmp/\\"log\\".txt"} 3.0',
+        "# HELP queue Queue depth.",
+        "# TYPE queue gauge",
+        "queue 7.0",
+        "# HELP seconds Duration.",
+        "# TYPE seconds histogram",
+        'seconds_bucket{event="event",le="0.1"} 1',
+        'seconds_bucket{event="event",le="1.0"} 2',
+        'seconds_bucket{event="event",le="+Inf"} 2',
+        'seconds_sum{event="event"} 0.55',
+        'seconds_count{event="event"} 2',
+    ]
+
+
+def test_registry_documents():
+    registry = MetricsRegistry()
+    registry.counter("runs_total", "Runs.", ("event",)).labels("ls").inc()
+    registry.histogram("seconds", "Duration.", (), (0.1, 1.0)).labels().observe(0.5)
+
+    assert list(registry.documents()) == [
+        {"metric": "runs_total", "labels": {"event": "ls"}, "value": 1.0},
+        {
+            "metric": "seconds",
+            "labels": {},
+            "count": 1,
+            "sum": 0.5,
+            "p50": 1.0,
+            "p99": 1.0,
+        },
+    ]
+
+
+@pytest.mark.asyncio
+async def test_log_monitor_metrics(tmp_path):
+    log_event = LogMonitorEvent(**yaml.safe_load("""
+          name: "error_event"
+          regexes:
+            - 'ERROR: (?P<message>.+)'
+          targets:
+            - type: elasticsearch
+              config:
+                index: "index"
+        """))
+    log_file_path = tmp_path / "log.txt"
+    log_file_path.write_text("info\nERROR: broken\ninfo\n")
+    monitor = LogMonitor(log_file_path, [log_event], AsyncMock())
+    # The histogram is shared by all events of the same name
+    parsed = log_event.parser._parse_seconds.count
+
+    task = asyncio.create_task(monitor.start_monitoring())
+    await asyncio.sleep(0.05)
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+    assert monitor._lines_metric.value == 3
+    assert monitor._event_metrics[0].value == 1
+    assert log_event.parser._parse_seconds.count == parsed + 1
+
+
+@pytest.mark.asyncio
+async def test_metrics_server():
+    registry = MetricsRegistry()
+    registry.counter("lines_total", "Lines read.").labels().inc()
+    server = MetricsServer("127.0.0.1", 0, AsyncMock(), registry=registry)
+    task = asyncio.create_task(server.start_monitoring())
+    await asyncio.sleep(0.01)
+    port = server.server.sockets[0].getsockname()[1]
+
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    response = await reader.read()
+    writer.close()
+
+    server.stop_monitoring()
+    await asyncio.wait_for(task, 1)
+    assert response.startswith(b"HTTP/1.1 200 OK\r\n")
+    assert response.endswith(b"lines_total 1.0\n")
+
+
+@pytest.mark.asyncio
+async def test_metrics_reporter():
+    registry = MetricsRegistry()
+    registry.counter("lines_total", "Lines read.").labels().inc()
+    target = Target(type="elasticsearch", config={"index": "metrics"})
+    es_mock = AsyncMock()
+    reporter = MetricsReporter(0.01, [target], es_mock, registry=registry)
+
+    task = asyncio.create_task(reporter.start_monitoring())
+    await asyncio.sleep(0.015)
+    reporter.stop_monitoring()
+    await asyncio.wait_for(task, 1)
+
+    document = es_mock.index.call_args_list[0].kwargs["document"]
+    assert es_mock.index.call_args_list[0].kwargs["index"] == "metrics"
+    assert document["metric"] == "lines_total"
+    assert document["value"] == 1.0
@@ -33,11 +33,56 @@ def test_target_unknown():
     with pytest.raises(ValidationError) as excinfo:
         Target(**input_dict)
     assert (
-        "Input should be 'elasticsearch' [type=enum, input_value='unknown_target', input_type=str]"
+        "Input should be 'elasticsearch', 'file', 'stdout' or 'http' [type=enum, input_value='unknown_target', input_type=str]"
         in str(excinfo.value)
     )
 
 
+def test_target_settings():
+    target = Target(**yaml.safe_load("""
+      type: file
+      config:
+        path: "/var/log/agent/events.ndjson"
+        compress: true
+    """))
+    assert target.settings.path == "/var/log/agent/events.ndjson"
+    assert target.settings.compress
+    assert target.settings.batch_size == 500
+    assert Target(type="stdout").settings.linger == 1.0
+
+
+def test_target_invalid_settings():
+    with pytest.raises(ValidationError) as excinfo:
+        Target(type="http", config={"url": "http://localhost", "max_concurrent": 0})
+    assert "max_concurrent must be a positive non-zero value" in str(excinfo.value)
+    with pytest.raises(ValidationError) as excinfo:
+        Target(type="elasticsearch", config={"path": "/tmp/events.ndjson"})
+    assert "index\n  Field required" in str(excinfo.value)
+    with pytest.raises(ValidationError) as excinfo:
+        Target(type="elasticsearch", config={"index": "index", "request_timeout": 0})
+    assert "request_timeout must be a positive non-zero value" in str(excinfo.value)
+
+
+def test_elasticsearch_target_sink_settings():
+    target = Target(**yaml.safe_load("""
+      type: elasticsearch
+      config:
+        index: "index"
+        hosts: ["https://remote:9200"]
+        max_concurrent: 4
+        http_compress: true
+    """))
+    assert target.settings.sink_settings == {
+        "hosts": ["https://remote:9200"],
+        "max_concurrent": 4,
+        "http_compress": True,
+    }
+    assert (
+        Target(type="elasticsearch", config={"index": "index"}).settings.sink_settings
+        == {}
+    )
+
+
 def test_log_monitor_event_valid():
     yaml_string = """
       name: "log_event"
@@ -0,0 +1,177 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import AsyncMock
+
+import pytest
+import yaml
+from pydantic import ValidationError
+
+from components.log_monitor.monitor import LogMonitor
+from model import LogMonitorEvent, MultilineConfig
+
+
+def _events(multiline: str):
+    yaml_string = f"""
+      - name: "traceback"
+        regexes:
+          - '^Traceback'
+        multiline:
+          {multiline}
+        targets:
+          - type: elasticsearch
+            config:
+              index: "tracebacks"
+      - name: "log_event"
+        regexes:
+          - '(?P<content>.+)'
+        targets:
+          - type: elasticsearch
+            config:
+              index: "index"
+    """
+    return [LogMonitorEvent(**event) for event in yaml.safe_load(yaml_string)]
+
+
+def _documents(es_mock):
+    return [
+        (call.kwargs["index"], call.kwargs["document"])
+        for call in es_mock.index.call_args_list
+    ]
+
+
+TRACEBACK = [
+    "Traceback (most recent call last):\n",
+    '  File "main.py", line 1, in <module>\n',
+    "ValueError: broken\n",
+]
+
+
+@pytest.mark.asyncio
+async def test_multiline_continuation():
+    es_mock = AsyncMock()
+    monitor = LogMonitor(
+        "log.txt", _events("continuation: '^\\s|^\\w+Error:'"), es_mock
+    )
+
+    for line in ["before\n", *TRACEBACK, "after\n"]:
+        await monitor._retrieve_line_event(line)
+
+    documents = _documents(es_mock)
+    assert [index for index, _ in documents] == ["index", "tracebacks", "index"]
+    traceback = documents[1][1]
+    assert traceback["line"] == "".join(TRACEBACK)
+    assert traceback["lines"] == 3
+    assert traceback["complete"] is True
+    assert documents[2][1]["content"] == "after"
+
+
+@pytest.mark.asyncio
+async def test_multiline_end():
+    es_mock = AsyncMock()
+    monitor = LogMonitor("log.txt", _events("end: 'Error:'"), es_mock)
+
+    for line in [*TRACEBACK, "after\n"]:
+        await monitor._retrieve_line_event(line)
+
+    documents = _documents(es_mock)
+    assert [index for index, _ in documents] == ["tracebacks", "index"]
+    assert documents[0][1]["line"] == "".join(TRACEBACK)
+
+
+@pytest.mark.asyncio
+async def test_multiline_max_lines():
+    es_mock = AsyncMock()
+    monitor = LogMonitor("log.txt", _events("{end: 'never', max_lines: 2}"), es_mock)
+
+    for line in [*TRACEBACK]:
+        await monitor._retrieve_line_event(line)
+
+    documents = _documents(es_mock)
+    assert [index for index, _ in documents] == ["tracebacks", "index"]
+    assert documents[0][1]["lines"] == 2
+    assert documents[0][1]["complete"] is False
+
+
+@pytest.mark.asyncio
+async def test_multiline_flush_timeout(tmp_path):
+    log_file_path = tmp_path / "log.txt"
+    log_file_path.write_text("".join(TRACEBACK[:2]))
+    es_mock = AsyncMock()
+    monitor = LogMonitor(
+        log_file_path, _events("{end: 'never', flush_timeout: 0.05}"), es_mock
+    )
+
+    task = asyncio.create_task(monitor.start_monitoring())
+    await asyncio.sleep(0.02)
+    assert es_mock.index.call_count == 0
+    await asyncio.sleep(0.1)
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+    documents = _documents(es_mock)
+    assert len(documents) == 1
+    assert documents[0][1]["line"] == "".join(TRACEBACK[:2])
+    assert documents[0][1]["complete"] is False
+
+
+@pytest.mark.asyncio
+async def test_multiline_groups_are_independent():
+    es_mock = AsyncMock()
+    monitor = LogMonitor(
+        "log.txt",
+        _events("continuation: '^\\s|^\\w+Error:'"),
+        es_mock,
+        groups=[0, 1],
+    )
+
+    for line in [*TRACEBACK, "after\n"]:
+        await monitor._retrieve_line_event(line)
+
+    # The lines of the traceback are still matched by the other group
+    documents = _documents(es_mock)
+    assert [index for index, _ in documents] == ["index"] * 3 + ["tracebacks", "index"]
+    assert documents[3][1]["line"] == "".join(TRACEBACK)
+
+
+class SlowExecutor(ThreadPoolExecutor):
+    def submit(self, fn, *args, **kwargs):
+        def slow():
+            time.sleep(0.1)
+            return fn(*args, **kwargs)
+
+        return super().submit(slow)
+
+
+@pytest.mark.asyncio
+async def test_multiline_flush_timeout_with_executor(tmp_path):
+    log_file_path = tmp_path / "log.txt"
+    log_file_path.write_text("".join(TRACEBACK[:2]))
+    es_mock = AsyncMock()
+    with SlowExecutor(1) as executor:
+        monitor = LogMonitor(
+            log_file_path,
+            _events("{end: 'never', flush_timeout: 0.05}"),
+            es_mock,
+            executor=executor,
+        )
+        task = asyncio.create_task(monitor.start_monitoring())
+        # The end of the file is reached before the lines have been matched
+        await asyncio.sleep(0.3)
+        documents = _documents(es_mock)
+        monitor.stop_monitoring()
+        await asyncio.wait_for(task, 1)
+
+    assert len(documents) == 1
+    assert documents[0][1]["complete"] is False
+
+
+def test_multiline_config_requires_one_end_condition():
+    with pytest.raises(ValidationError) as excinfo:
+        MultilineConfig()
+    assert "exactly one of continuation and end must be set" in str(excinfo.value)
+    with pytest.raises(ValidationError):
+        MultilineConfig(continuation="a", end="b")
@@ -0,0 +1,52 @@
+import pytest
+from aiofile import AIOFile
+
+from components.log_monitor.reader import LineReader
+
+
+@pytest.mark.asyncio
+async def test_line_reader_splits_blocks(tmp_path):
+    log_file_path = tmp_path / "log.txt"
+    log_file_path.write_text("first\nsecond\nthird\n")
+
+    async with AIOFile(log_file_path, "rb") as file:
+        reader = LineReader(file, chunk_size=8)
+        lines = []
+        while not reader.eof:
+            lines.extend(await reader.read_lines())
+
+    assert lines == ["first\n", "second\n", "third\n"]
+    assert reader.offset == len("first\nsecond\nthird\n")
+
+
+@pytest.mark.asyncio
+async def test_line_reader_carries_partial_line(tmp_path):
+    log_file_path = tmp_path / "log.txt"
+    log_file_path.write_text("complete\nparti")
+
+    async with AIOFile(log_file_path, "rb") as file:
+        reader = LineReader(file)
+        assert await reader.read_lines() == ["complete\n"]
+        assert await reader.read_lines() == []
+        assert reader.eof
+
+        with open(log_file_path, "a") as f:
+            f.write("al ünicode\n")
+        assert await reader.read_lines() == ["partial ünicode\n"]
+
+    assert reader.offset == log_file_path.stat().st_size
+
+
+@pytest.mark.asyncio
+async def test_line_reader_splits_overlong_lines(tmp_path):
+    log_file_path = tmp_path / "log.txt"
+    log_file_path.write_text("x" * 10 + "\n")
+
+    async with AIOFile(log_file_path, "rb") as file:
+        reader = LineReader(file, chunk_size=4, max_line_bytes=6)
+        lines = []
+        while not reader.eof:
+            lines.extend(await reader.read_lines())
+
+    assert "".join(lines) == "x" * 10 + "\n"
+    assert all(len(line) <= 8 for line in lines)
@@ -0,0 +1,166 @@
+import asyncio
+import os
+import signal
+from unittest.mock import AsyncMock, patch
+
+import pytest
+import yaml
+
+from reload import ConfigReloader
+from utils import read_config
+
+
+def _config(tmp_path, commands, log_regex="'.*'"):
+    return f"""
+log_configs:
+  - path: "{tmp_path}/*.log"
+    events:
+      - name: "log_event"
+        regexes:
+          - {log_regex}
+        targets:
+          - type: elasticsearch
+            config:
+              index: "logs"
+cmd_configs:
+  - events:
+{"".join(f'''
+      - name: "{name}"
+        command: "echo {name}"
+        repeat: 60
+        targets:
+          - type: elasticsearch
+            config:
+              index: "commands"
+''' for name in commands)}
+"""
+
+
+def _write(path, content):
+    # Replaced at once, like editors and configuration management do
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        file.write(content)
+    os.replace(tmp_path, path)
+
+
+def _documents(es_mock, index):
+    return [
+        call.kwargs["document"]
+        for call in es_mock.index.call_args_list
+        if call.kwargs["index"] == index
+    ]
+
+
+async def _start(tmp_path, config, **kwargs):
+    config_path = tmp_path / "config.yaml"
+    _write(config_path, config)
+    es_mock = AsyncMock()
+    reloader = ConfigReloader(
+        str(config_path), read_config(config_path), es_mock, None, **kwargs
+    )
+    task = asyncio.create_task(reloader.start_monitoring())
+    await asyncio.sleep(0.1)
+    return reloader, task, es_mock
+
+
+@pytest.mark.asyncio
+async def test_reload_applies_changes(tmp_path):
+    (tmp_path / "app.log").write_text("line: 1\n")
+    reloader, task, es_mock = await _start(
+        tmp_path, _config(tmp_path, ["first", "second"]), watch=False
+    )
+    log_monitor = reloader.log_monitor
+    file_monitor = next(iter(log_monitor.monitors.values()))
+    first, second = reloader.commands
+
+    _write(
+        tmp_path / "config.yaml",
+        _config(tmp_path, ["second", "third"], log_regex="'line: (?P<number>\\d+)'"),
+    )
+    os.kill(os.getpid(), signal.SIGHUP)
+    await asyncio.sleep(0.1)
+    with open(tmp_path / "app.log", "a") as file:
+        file.write("line: 2\n")
+    await asyncio.sleep(0.1)
+
+    # Unchanged monitors keep running
+    assert reloader.log_monitor is log_monitor
+    assert next(iter(log_monitor.monitors.values())) is file_monitor
+    assert reloader.commands[0] is second
+    assert [monitor.event.name for monitor in reloader.commands] == ["second", "third"]
+    assert first not in reloader.scheduler.monitors
+
+    reloader.stop_monitoring()
+    await asyncio.wait_for(task, 1)
+
+    stdouts = [document["stdout"] for document in _documents(es_mock, "commands")]
+    assert sorted(stdouts) == ["first\n", "second\n", "third\n"]
+    logs = _documents(es_mock, "logs")
+    assert [document["line"] for document in logs] == ["line: 1\n", "line: 2\n"]
+    assert "number" not in logs[0]
+    assert logs[1]["number"] == "2"
+
+
+@pytest.mark.asyncio
+async def test_reload_on_file_change(tmp_path, caplog):
+    reloader, task, es_mock = await _start(
+        tmp_path, _config(tmp_path, ["first"]), watch_interval=10
+    )
+
+    _write(tmp_path / "config.yaml", "log_configs: [")
+    await asyncio.sleep(0.1)
+    assert "keeping the running config" in caplog.text
+    assert [monitor.event.name for monitor in reloader.commands] == ["first"]
+
+    configs = yaml.safe_load(_config(tmp_path, ["first", "second"]))
+    configs["log_workers"] = 2
+    _write(tmp_path / "config.yaml", yaml.safe_dump(configs))
+    await asyncio.sleep(0.1)
+    assert [monitor.event.name for monitor in reloader.commands] == [
+        "first",
+        "second",
+    ]
+    assert "Changing 'log_workers' requires a restart." in caplog.text
+    assert reloader.configs.log_workers == 1
+
+    reloader.stop_monitoring()
+    await asyncio.wait_for(task, 1)
+    stdouts = [document["stdout"] for document in _documents(es_mock, "commands")]
+    assert sorted(stdouts) == ["first\n", "second\n"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("log_workers", [1, 2])
+async def test_reload_keeps_monitors_of_unchanged_config(tmp_path, caplog, log_workers):
+    (tmp_path / "app.log").write_text("line: 1\n")
+    configs = yaml.safe_load(_config(tmp_path, ["first"]))
+    configs["log_workers"] = log_workers
+    configs["metrics"] = {
+        "port": None,
+        "targets": [{"type": "elasticsearch", "config": {"index": "metrics"}}],
+    }
+    reloader, task, _ = await _start(tmp_path, yaml.safe_dump(configs), watch=False)
+    log_monitor = reloader.log_monitor
+    commands = list(reloader.commands)
+    if log_workers == 1:
+        monitors = dict(log_monitor.monitors)
+    else:
+        processes = list(log_monitor._processes)
+
+    with patch.object(log_monitor, "reconfigure") as reconfigure:
+        assert reloader.reload()
+        await asyncio.sleep(0.1)
+
+    reconfigure.assert_not_called()
+    assert reloader.log_monitor is log_monitor
+    assert reloader.commands == commands
+    if log_workers == 1:
+        assert log_monitor.monitors == monitors
+    else:
+        assert log_monitor._processes == processes
+        assert all(process.is_alive() for process in processes)
+    assert "requires a restart" not in caplog.text
+
+    reloader.stop_monitoring()
+    await asyncio.wait_for(task, 5)
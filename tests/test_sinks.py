@@ -0,0 +1,155 @@
+import asyncio
+import gzip
+import io
+import json
+from unittest.mock import AsyncMock
+
+import pytest
+import pytest_asyncio
+from aiohttp import web
+
+from components.sink.bulk_sink import ElasticsearchBulkSink
+from components.sink.file_sink import FileSink, StdoutSink
+from components.sink.http_sink import HttpSink
+from components.sink.router import SinkRouter
+from model import Target, TargetType
+
+
+def _lines(data: bytes) -> list[dict]:
+    return [json.loads(line) for line in data.splitlines()]
+
+
+@pytest.mark.asyncio
+async def test_file_sink_rotates_and_compresses(tmp_path):
+    path = tmp_path / "out" / "events.ndjson"
+    sink = FileSink(str(path), max_bytes=40, backups=2, compress=True, batch_size=2)
+
+    for i in range(8):
+        await sink.put({"number": i, "padding": "x"})
+    await sink.close()
+
+    # Batches of two 25 byte lines, each batch starts a new file
+    assert _lines(path.read_bytes()) == [
+        {"number": 6, "padding": "x"},
+        {"number": 7, "padding": "x"},
+    ]
+    with gzip.open(f"{path}.1.gz") as file:
+        assert [line["number"] for line in _lines(file.read())] == [4, 5]
+    with gzip.open(f"{path}.2.gz") as file:
+        assert [line["number"] for line in _lines(file.read())] == [2, 3]
+    assert sorted(p.name for p in path.parent.iterdir()) == [
+        "events.ndjson",
+        "events.ndjson.1.gz",
+        "events.ndjson.2.gz",
+    ]
+    assert sink.sent == 8
+
+
+@pytest.mark.asyncio
+async def test_stdout_sink_flushes_on_linger():
+    stream = io.BytesIO()
+    sink = StdoutSink(stream, linger=0.05)
+
+    await sink.put({"message": "first"})
+    await sink.put({"message": "second"})
+    assert stream.getvalue() == b""
+    await asyncio.sleep(0.1)
+
+    assert _lines(stream.getvalue()) == [{"message": "first"}, {"message": "second"}]
+    assert sink.pending == 0
+    await sink.close()
+
+
+@pytest_asyncio.fixture
+async def server():
+    requests = []
+    statuses = [503]
+
+    async def handle(request: web.Request) -> web.Response:
+        # Decompressed by aiohttp
+        requests.append((dict(request.headers), _lines(await request.read())))
+        return web.Response(status=statuses.pop(0) if statuses else 200)
+
+    app = web.Application()
+    app.router.add_post("/ingest", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}/ingest", requests
+    await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_http_sink_retries(server):
+    url, requests = server
+    sink = HttpSink(
+        url,
+        headers={"Authorization": "Bearer token"},
+        compress=True,
+        initial_backoff=0.01,
+    )
+
+    await sink.put({"message": "first"})
+    await sink.put({"message": "second"})
+    await sink.close()
+
+    # The first request was answered with 503 and retried
+    assert len(requests) == 2
+    headers, documents = requests[-1]
+    assert headers["Authorization"] == "Bearer token"
+    assert headers["Content-Type"] == "application/x-ndjson"
+    assert headers["Content-Encoding"] == "gzip"
+    assert documents == [{"message": "first"}, {"message": "second"}]
+    assert (sink.sent, sink.failed) == (2, 0)
+
+
+@pytest.mark.asyncio
+async def test_router_shares_sinks(tmp_path):
+    path = tmp_path / "events.ndjson"
+    first = Target(type="file", config={"path": str(path)})
+    second = Target(type="file", config={"path": str(path), "batch_size": 10})
+    router = SinkRouter()
+
+    await router.put(first, {"number": 1})
+    # Sent by a worker process, which only knows the key of the target
+    await router.put_serialized(second.key, b'{"number":2}')
+    await router.close()
+
+    assert list(router.sinks) == [f"file:{path}"]
+    assert _lines(path.read_bytes()) == [{"number": 1}, {"number": 2}]
+    with pytest.raises(ValueError):
+        router.resolve(Target(type="elasticsearch", config={"index": "index"}))
+
+
+@pytest.mark.asyncio
+async def test_router_elasticsearch_clients():
+    clients = []
+
+    def create_sink(settings):
+        clients.append(AsyncMock())
+        return ElasticsearchBulkSink(
+            clients[-1],
+            max_concurrent=settings.max_concurrent or 1,
+            close_client=True,
+        )
+
+    default = ElasticsearchBulkSink(AsyncMock())
+    router = SinkRouter(default, {TargetType.ELASTICSEARCH: create_sink})
+    remote = {"hosts": ["https://remote:9200"], "max_concurrent": 4}
+
+    assert router.resolve(Target(type="elasticsearch", config={"index": "a"}))
+    first = Target(type="elasticsearch", config={"index": "a", **remote})
+    second = Target(type="elasticsearch", config={"index": "b", **remote})
+    other = Target(type="elasticsearch", config={"index": "a", "request_timeout": 30})
+    for target in (first, second, other):
+        router.resolve(target)
+
+    # The default sink is not created, targets to the same cluster share a sink
+    assert len(clients) == 2
+    assert len(router.sinks) == 2
+    await router.close()
+    for client in clients:
+        client.close.assert_awaited_once()
+    default.es.close.assert_not_awaited()
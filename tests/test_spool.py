@@ -0,0 +1,233 @@
+import asyncio
+import json
+import threading
+
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from elasticsearch import AsyncElasticsearch
+
+from components.sink.bulk_sink import ElasticsearchBulkSink
+from components.sink.spool import DiskSpool
+
+
+def test_spool_append_read_commit(tmp_path):
+    spool = DiskSpool(tmp_path, segment_bytes=64)
+    assert spool.empty
+
+    spool.append([("index", json.dumps({"number": i}).encode()) for i in range(5)])
+    assert not spool.empty
+    assert len(list(tmp_path.glob("segment-*"))) > 1
+
+    entries, position = spool.read(3)
+    assert entries == [("index", json.dumps({"number": i}).encode()) for i in range(3)]
+    # Reading does not consume the entries
+    assert spool.read(3)[0] == entries
+
+    spool.commit(position)
+    spool.close()
+
+    # The read position is persisted
+    spool = DiskSpool(tmp_path, segment_bytes=64)
+    entries, position = spool.read(10)
+    assert entries == [
+        ("index", json.dumps({"number": i}).encode()) for i in range(3, 5)
+    ]
+    spool.commit(position)
+    assert spool.empty
+
+
+def test_spool_drops_oldest_segments(tmp_path):
+    spool = DiskSpool(tmp_path, segment_bytes=32, max_bytes=64)
+
+    dropped = spool.append(
+        [("index", json.dumps({"number": i}).encode()) for i in range(10)]
+    )
+
+    assert spool.size <= 64
+    entries, _ = spool.read(10)
+    assert entries[-1] == ("index", json.dumps({"number": 9}).encode())
+    assert len(entries) == 10 - dropped
+
+
+def test_spool_drops_incomplete_entry(tmp_path):
+    spool = DiskSpool(tmp_path)
+    spool.append([("index", b'{"a":1}')])
+    spool.close()
+    # Crashed while appending the next entry
+    with open(next(tmp_path.glob("segment-*")), "ab") as file:
+        file.write(b'"index" {"a":2,"b"')
+
+    spool = DiskSpool(tmp_path)
+    spool.append([("index", b'{"live":1}')])
+
+    entries, position = spool.read(10)
+    assert entries == [("index", b'{"a":1}'), ("index", b'{"live":1}')]
+    spool.commit(position)
+    assert spool.empty
+
+
+class FakeElasticsearch:
+    """Minimal Elasticsearch HTTP server supporting the bulk API."""
+
+    def __init__(self) -> None:
+        self.available = True
+        self.documents = []
+
+    async def bulk(self, request: web.Request) -> web.Response:
+        headers = {"X-Elastic-Product": "Elasticsearch"}
+        if not self.available:
+            return web.json_response(
+                {"error": "unavailable", "status": 503}, status=503, headers=headers
+            )
+        lines = (await request.text()).splitlines()
+        items = []
+        for header, document in zip(lines[::2], lines[1::2]):
+            index = json.loads(header)["index"]["_index"]
+            self.documents.append((index, json.loads(document)))
+            items.append({"index": {"_index": index, "status": 201}})
+        return web.json_response({"errors": False, "items": items}, headers=headers)
+
+
+@pytest_asyncio.fixture
+async def fake_es():
+    fake = FakeElasticsearch()
+    app = web.Application()
+    app.router.add_route("*", "/_bulk", fake.bulk)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    es = AsyncElasticsearch(f"http://127.0.0.1:{port}", max_retries=0)
+    yield fake, es
+    await es.close()
+    await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_sink_spools_while_unavailable(tmp_path, fake_es):
+    fake, es = fake_es
+    spool = DiskSpool(tmp_path)
+    sink = ElasticsearchBulkSink(
+        es,
+        linger=0.01,
+        max_retries=1,
+        initial_backoff=0.01,
+        spool=spool,
+        retry_interval=0.05,
+    )
+
+    await sink.put("index", {"number": 1})
+    await sink.flush()
+    assert fake.documents == [("index", {"number": 1})]
+
+    fake.available = False
+    for number in range(2, 5):
+        await sink.put("index", {"number": number})
+    await sink.flush()
+    assert not spool.empty
+    assert len(fake.documents) == 1
+
+    fake.available = True
+    await sink.put("index", {"number": 5})
+    await sink.flush()
+    for _ in range(50):
+        if spool.empty:
+            break
+        await asyncio.sleep(0.02)
+    await sink.flush()
+    await sink.close()
+
+    assert fake.documents == [("index", {"number": n}) for n in range(1, 6)]
+    assert sink.failed == 0
+
+
+@pytest.mark.asyncio
+async def test_sink_spools_when_queue_is_full(tmp_path, fake_es):
+    fake, es = fake_es
+    spool = DiskSpool(tmp_path)
+    sink = ElasticsearchBulkSink(es, queue_size=1, linger=60, spool=spool)
+    sink._queue.put_nowait(("index", {"number": 1}))
+
+    await sink.put("index", {"number": 2})
+
+    assert not spool.empty
+    await sink.close()
+
+
+@pytest.mark.asyncio
+async def test_sink_spools_in_a_thread(tmp_path, fake_es):
+    fake, es = fake_es
+    spool = DiskSpool(tmp_path, segment_bytes=32, max_bytes=64)
+    threads = []
+    append = spool.append
+
+    def record_thread(entries):
+        threads.append(threading.current_thread())
+        return append(entries)
+
+    spool.append = record_thread
+    sink = ElasticsearchBulkSink(es, spool=spool)
+
+    for number in range(10):
+        await sink._spool([({"index": {"_index": "index"}}, b'{"n":%d}' % number)])
+
+    assert threads and threading.main_thread() not in threads
+    # Documents dropped with the oldest segments are no longer counted as spooled
+    entries, _ = spool.read(100)
+    assert sink.spooled == len(entries) < 10
+    assert sink.failed == 10 - len(entries)
+    await sink.close()
+
+
+@pytest.mark.asyncio
+async def test_sink_ignores_incomplete_spool_entry(tmp_path, fake_es):
+    fake, es = fake_es
+    spool = DiskSpool(tmp_path)
+    # Left over by a failed append, which `read` skips
+    spool.append([("index", b'{"a":1}')])
+    spool.commit(spool.read(10)[1])
+    with open(next(tmp_path.glob("segment-*")), "ab") as file:
+        file.write(b'"index" {"a":2,"b"')
+    spool._segments[max(spool._segments)] += 18
+    sink = ElasticsearchBulkSink(es, linger=0.01, spool=spool, retry_interval=0.05)
+
+    sink.start()
+    await asyncio.sleep(0.05)
+
+    # No empty bulk requests, and the cluster is not considered unavailable
+    assert sink._available
+    await sink.close()
+
+
+def test_elasticsearch_spool_is_kept_when_settings_change(tmp_path, caplog):
+    from main import _ElasticsearchSinkFactory
+    from model import ElasticsearchTargetConfig, SpoolConfig
+
+    spool = SpoolConfig(directory=str(tmp_path))
+    settings = ElasticsearchTargetConfig(
+        index="index", hosts=["http://other:9200"], request_timeout=5
+    )
+    sink = _ElasticsearchSinkFactory(AsyncElasticsearch, spool)(settings)
+    sink.spool.append([("index", b'{"number": 1}')])
+    sink.spool.close()
+    directory = sink.spool.directory
+
+    # The documents spooled for the cluster are replayed with another timeout
+    factory = _ElasticsearchSinkFactory(AsyncElasticsearch, spool)
+    changed = settings.model_copy(update={"request_timeout": 10})
+    sink = factory(changed)
+    assert sink.spool.directory == directory
+    assert not sink.spool.empty
+    # Another sink of the same cluster spools elsewhere
+    other = factory(settings.model_copy(update={"max_concurrent": 2}))
+    assert other.spool.directory != directory
+    assert other.spool.empty
+
+    factory.warn_orphaned_spools()
+    assert "not used by any target" not in caplog.text
+    factory = _ElasticsearchSinkFactory(AsyncElasticsearch, spool)
+    factory(settings.model_copy(update={"hosts": ["http://third:9200"]}))
+    factory.warn_orphaned_spools()
+    assert f"The spool {directory} is not used by any target" in caplog.text
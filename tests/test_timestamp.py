@@ -0,0 +1,138 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock
+
+import pytest
+import yaml
+
+from components.log_monitor.monitor import LogMonitor
+from components.log_monitor.timestamp import (
+    TimestampParser,
+    parse_epoch,
+    parse_iso8601,
+    parse_syslog,
+)
+from model import LogMonitorEvent, TimestampConfig
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("2024-10-18T12:34:56", datetime(2024, 10, 18, 12, 34, 56)),
+        ("2024-10-18 12:34:56,123", datetime(2024, 10, 18, 12, 34, 56, 123000)),
+        (
+            "2024-10-18T12:34:56.123456789Z",
+            datetime(2024, 10, 18, 12, 34, 56, 123456, timezone.utc),
+        ),
+        (
+            "2024-10-18T12:34:56+0200",
+            datetime(2024, 10, 18, 12, 34, 56, tzinfo=timezone(timedelta(hours=2))),
+        ),
+        ("2024-13-18T12:34:56", None),
+        ("Oct 18 12:34:56", None),
+    ],
+)
+def test_parse_iso8601(value, expected):
+    assert parse_iso8601(value) == expected
+
+
+def test_parse_syslog():
+    now = datetime(2024, 10, 18, 13, 0, 0)
+    assert parse_syslog("Oct  8 12:34:56", now) == datetime(2024, 10, 8, 12, 34, 56)
+    assert parse_syslog("Oct 18 12:34:56.5", now) == datetime(
+        2024, 10, 18, 12, 34, 56, 500000
+    )
+    # Lines from last year
+    assert parse_syslog("Dec 31 23:59:59", datetime(2025, 1, 1)) == datetime(
+        2024, 12, 31, 23, 59, 59
+    )
+    assert parse_syslog("Foo 18 12:34:56", now) is None
+
+
+@pytest.mark.parametrize(
+    "value", ["1729254896", "1729254896.5", "1729254896500", "1729254896500000"]
+)
+def test_parse_epoch(value):
+    parsed = parse_epoch(value)
+    assert parsed.replace(microsecond=0) == datetime(
+        2024, 10, 18, 12, 34, 56, tzinfo=timezone.utc
+    )
+
+
+def test_timestamp_parser_detects_format():
+    parser = TimestampParser(TimestampConfig())
+    assert parser.parse("Oct 18 12:34:56").month == 10
+    assert parser._parse is parse_syslog
+    assert parser.parse("2024-10-18T12:34:56") == datetime(2024, 10, 18, 12, 34, 56)
+    assert parser._parse is parse_iso8601
+    assert parser.parse("yesterday") is None
+
+
+def test_timestamp_parser_strptime():
+    parser = TimestampParser(TimestampConfig(format="%d/%b/%Y:%H:%M:%S %z"))
+    document = {"timestamp": "18/Oct/2024:12:34:56 +0000"}
+    parser.apply(document)
+    assert document == {"timestamp": "2024-10-18T12:34:56+00:00"}
+    # Other formats are not detected
+    assert parser.parse("2024-10-18T12:34:56") is None
+
+
+@pytest.mark.asyncio
+async def test_log_monitor_parses_timestamps():
+    log_event = LogMonitorEvent(**yaml.safe_load("""
+          name: "error_event"
+          regexes:
+            - '^(?P<time>\\S+ \\S+) ERROR: (?P<message>.+)'
+          timestamp:
+            group: time
+            field: "@timestamp"
+          targets:
+            - type: elasticsearch
+              config:
+                index: "index"
+        """))
+    es_mock = AsyncMock()
+    monitor = LogMonitor("log.txt", [log_event], es_mock)
+
+    await monitor._retrieve_line_event("2024-10-18 12:34:56.789 ERROR: broken\n")
+    await monitor._retrieve_line_event("bad time ERROR: broken\n")
+
+    documents = [call.kwargs["document"] for call in es_mock.index.call_args_list]
+    assert documents[0]["time"] == "2024-10-18 12:34:56.789"
+    assert documents[0]["@timestamp"] == "2024-10-18T12:34:56.789000"
+    assert "@timestamp" not in documents[1]
+
+
+@pytest.mark.asyncio
+async def test_log_monitor_parses_numeric_timestamps():
+    log_event = LogMonitorEvent(**yaml.safe_load("""
+          name: "json_event"
+          regexes:
+            - '^(?P<json>{.*})$'
+          timestamp:
+            group: ts
+            field: "@timestamp"
+          targets:
+            - type: elasticsearch
+              config:
+                index: "index"
+        """))
+    es_mock = AsyncMock()
+    monitor = LogMonitor("log.txt", [log_event], es_mock)
+
+    await monitor._retrieve_line_event('{"ts": 1729254896, "message": "int"}\n')
+    await monitor._retrieve_line_event('{"ts": 1729254896500.0, "message": "ms"}\n')
+    await monitor._retrieve_line_event('{"ts": true, "message": "bool"}\n')
+    await monitor._retrieve_line_event('{"ts": [1], "message": "list"}\n')
+
+    documents = [call.kwargs["document"] for call in es_mock.index.call_args_list]
+    # Events with timestamps which cannot be parsed are saved without the field
+    assert [document["message"] for document in documents] == [
+        "int",
+        "ms",
+        "bool",
+        "list",
+    ]
+    assert documents[0]["@timestamp"] == "2024-10-18T12:34:56+00:00"
+    assert documents[1]["@timestamp"] == "2024-10-18T12:34:56.500000+00:00"
+    assert "@timestamp" not in documents[2]
+    assert "@timestamp" not in documents[3]
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from components.log_monitor.watcher import (
+    InotifyWatcher,
+    PollingWatcher,
+    create_watcher,
+)
+from model import WatcherType
+
+
+@pytest.mark.asyncio
+async def test_inotify_watcher_wakes_up_on_append(tmp_path):
+    log_file_path = tmp_path / "log.txt"
+    log_file_path.write_text("")
+    watcher = create_watcher(log_file_path)
+    assert isinstance(watcher, InotifyWatcher)
+
+    assert await watcher.wait(timeout=0.05) is False
+
+    waiting = asyncio.create_task(watcher.wait(timeout=1))
+    await asyncio.sleep(0.01)
+    with open(log_file_path, "a") as file:
+        file.write("log_line\n")
+
+    assert await waiting is True
+    watcher.close()
+
+
+@pytest.mark.asyncio
+async def test_inotify_watcher_wakes_up_on_recreate(tmp_path):
+    log_file_path = tmp_path / "log.txt"
+    log_file_path.write_text("")
+    watcher = InotifyWatcher(log_file_path)
+
+    log_file_path.rename(tmp_path / "log.txt.1")
+    assert await watcher.wait(timeout=1) is True
+    log_file_path.write_text("")
+    assert await watcher.wait(timeout=1) is True
+
+    # Changes to other files in the directory are ignored
+    watcher.rewatch()
+    (tmp_path / "other.txt").write_text("")
+    assert await watcher.wait(timeout=0.05) is False
+    watcher.close()
+
+
+@pytest.mark.asyncio
+async def test_polling_watcher(tmp_path):
+    watcher = create_watcher(tmp_path / "log.txt", WatcherType.POLLING, 0.01)
+    assert isinstance(watcher, PollingWatcher)
+
+    assert await watcher.wait() is True
+    assert await watcher.wait(timeout=0.001) is False
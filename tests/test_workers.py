@@ -0,0 +1,148 @@
+import asyncio
+import json
+import os
+import signal
+
+import pytest
+import yaml
+
+from components.log_monitor.checkpoint import CheckpointStore
+from components.log_monitor.discovery import shard_of
+from components.log_monitor.workers import LogWorkerPool
+from model import LogMonitorConfig
+
+
+class FakeSink:
+    def __init__(self) -> None:
+        self.documents = []
+
+    async def put_serialized(self, index, body):
+        self.documents.append((index, json.loads(body)))
+
+
+def _config(tmp_path):
+    return LogMonitorConfig(**yaml.safe_load(f"""
+          path: "{tmp_path}/*.log"
+          poll_interval: 0.05
+          events:
+            - name: "error_event"
+              regexes:
+                - 'ERROR: (?P<message>.+)'
+              targets:
+                - type: elasticsearch
+                  config:
+                    index: "index"
+        """))
+
+
+async def _wait_for(condition, timeout=10.0):
+    for _ in range(int(timeout / 0.05)):
+        if condition():
+            return
+        await asyncio.sleep(0.05)
+    raise AssertionError("timeout")
+
+
+def test_shard_of_is_stable():
+    paths = [f"/var/log/app-{i}.log" for i in range(100)]
+    shards = [shard_of(path, 4) for path in paths]
+    assert shards == [shard_of(path, 4) for path in paths]
+    assert set(shards) == {0, 1, 2, 3}
+
+
+@pytest.mark.asyncio
+async def test_worker_pool(tmp_path):
+    logs = tmp_path / "logs"
+    logs.mkdir()
+    for i in range(4):
+        (logs / f"app-{i}.log").write_text(f"ERROR: first {i}\ninfo\n")
+    checkpoints = CheckpointStore(str(tmp_path / "checkpoints.json"))
+    sink = FakeSink()
+    pool = LogWorkerPool(
+        [_config(logs)], None, sink, checkpoints, workers=2, restart_interval=0.1
+    )
+    task = asyncio.create_task(pool.start_monitoring())
+
+    await _wait_for(lambda: len(sink.documents) == 4)
+    assert sorted(doc["message"] for _, doc in sink.documents) == [
+        f"first {i}" for i in range(4)
+    ]
+
+    # A crashed worker is restarted and continues at its checkpoint
+    await _wait_for(lambda: len(checkpoints._checkpoints) == 4)
+    crashed = pool._processes[0]
+    os.kill(crashed.pid, signal.SIGKILL)
+    await _wait_for(lambda: pool._processes[0] is not crashed)
+    for i in range(4):
+        with open(logs / f"app-{i}.log", "a") as file:
+            file.write(f"ERROR: second {i}\n")
+    await _wait_for(lambda: len(sink.documents) == 8)
+
+    pool.stop_monitoring()
+    await asyncio.wait_for(task, 10)
+    assert all(not process.is_alive() for process in pool._processes)
+    assert sorted(doc["message"] for _, doc in sink.documents) == sorted(
+        [f"first {i}" for i in range(4)] + [f"second {i}" for i in range(4)]
+    )
+    offsets = {path: c["offset"] for path, c in checkpoints._checkpoints.items()}
+    assert offsets == {
+        str(logs / f"app-{i}.log"): len(f"ERROR: first {i}\ninfo\nERROR: second {i}\n")
+        for i in range(4)
+    }
+
+
+class FakeProcess:
+    """A worker process which does not exit when terminated."""
+
+    def __init__(self, **kwargs) -> None:
+        self.pid = 1
+        self.killed = False
+
+    def start(self):
+        pass
+
+    def terminate(self):
+        pass
+
+    def join(self, timeout=None):
+        pass
+
+    def is_alive(self):
+        return not self.killed
+
+    def kill(self):
+        self.killed = True
+
+
+class FakeContext:
+    Process = FakeProcess
+
+
+@pytest.mark.asyncio
+async def test_worker_pool_saves_sent_checkpoints_and_kills_stuck_workers(
+    tmp_path, caplog
+):
+    path = tmp_path / "checkpoints.json"
+    saved_on_flush = []
+
+    class FlushingSink(FakeSink):
+        async def flush(self):
+            saved_on_flush.append(path.exists())
+
+    checkpoints = CheckpointStore(str(path), sink=FlushingSink())
+    checkpoints.update(str(tmp_path / "app.log"), os.stat(tmp_path), 10)
+    pool = LogWorkerPool(
+        [_config(tmp_path)], None, FakeSink(), checkpoints, workers=1, stop_timeout=0
+    )
+    pool._context = FakeContext()
+    task = asyncio.create_task(pool.start_monitoring())
+
+    # The checkpoints of the restarted worker are saved once the sink is flushed
+    await _wait_for(lambda: pool._processes[0] is not None)
+    assert saved_on_flush == [False]
+    assert json.loads(path.read_text())[str(tmp_path / "app.log")]["offset"] == 10
+
+    pool.stop_monitoring()
+    await asyncio.wait_for(task, 10)
+    assert pool._processes[0].killed
+    assert "Log worker 0 did not stop within 0s, killing it." in caplog.text